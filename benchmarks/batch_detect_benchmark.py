@@ -0,0 +1,82 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faceswap.batch import iter_target_paths  # noqa: E402
+from faceswap.batch_detection import BatchFaceAnalyzer  # noqa: E402
+from faceswap.core import (  # noqa: E402
+    DEFAULT_DET_SIZE,
+    DEFAULT_MODEL_PACK,
+    create_face_analyzer,
+)
+
+# Detection throughput for different batch sizes. Needs the model pack;
+# only the detection model is loaded so the numbers are detector-only.
+
+
+def load_images(args):
+    if args.images:
+        paths = list(iter_target_paths(args.images))[: args.count]
+        images = [cv2.imread(path) for path in paths]
+        return [image for image in images if image is not None]
+
+    rng = np.random.default_rng(0)
+    return [
+        rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+        for _ in range(args.count)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batched face detection")
+    parser.add_argument(
+        "--images", nargs="*", help="Directories, globs or @lists (default: noise)"
+    )
+    parser.add_argument("--count", type=int, default=64)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model-pack", default=DEFAULT_MODEL_PACK)
+    parser.add_argument("--det-size", type=int, default=DEFAULT_DET_SIZE[0])
+    args = parser.parse_args(argv)
+
+    analyzer = create_face_analyzer(
+        name=args.model_pack,
+        det_size=(args.det_size, args.det_size),
+        allowed_modules=["detection"],
+    )
+    images = load_images(args)
+    print(f"{len(images)} images, det_size {args.det_size}")
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        detector = BatchFaceAnalyzer(analyzer, batch_size=batch_size)
+        if batch_size > 1 and not detector.batched:
+            print(
+                f"batch {batch_size:>3}: detection model has a fixed batch size "
+                "of 1, runs one image per call"
+            )
+        detector.detect(images[:batch_size])  # warm up
+
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for start in range(0, len(images), batch_size):
+                detector.detect(images[start : start + batch_size])
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(
+            f"batch {batch_size:>3}: {len(images) / best:8.2f} images/sec, "
+            f"{best / len(images) * 1000:7.2f} ms/image"
+        )
+
+
+if __name__ == "__main__":
+    main()
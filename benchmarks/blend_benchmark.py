@@ -0,0 +1,130 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faceswap.blending import clear_mask_cache  # noqa: E402
+from faceswap.core import swap_faces  # noqa: E402
+
+# Compares the blend path against the float64 implementation it replaced, on
+# a synthetic group photo. No models needed: faces are laid out on a grid.
+
+
+def legacy_swap_faces(source_image, source_face, target_image, target_faces, indices):
+    result_image = target_image.copy()
+    for idx in indices:
+        dst_bbox = target_faces[idx].bbox.astype(int)
+        src_bbox = source_face.bbox.astype(int)
+        src_face = source_image[src_bbox[1] : src_bbox[3], src_bbox[0] : src_bbox[2]]
+        dst_width = dst_bbox[2] - dst_bbox[0]
+        dst_height = dst_bbox[3] - dst_bbox[1]
+        src_face_resized = cv2.resize(src_face, (dst_width, dst_height))
+        mask = np.zeros((dst_height, dst_width), dtype=np.uint8)
+        center = (dst_width // 2, dst_height // 2)
+        axes = (dst_width // 2 - 5, dst_height // 2 - 5)
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)  # type: ignore
+        mask = cv2.GaussianBlur(mask, (19, 19), 11)
+        mask_3channel = np.stack([mask] * 3, axis=2) / 255.0
+        target_region = result_image[
+            dst_bbox[1] : dst_bbox[3], dst_bbox[0] : dst_bbox[2]
+        ]
+        blended = (src_face_resized * mask_3channel) + (
+            target_region * (1 - mask_3channel)
+        )
+        result_image[dst_bbox[1] : dst_bbox[3], dst_bbox[0] : dst_bbox[2]] = (
+            blended.astype(np.uint8)
+        )
+    return result_image
+
+
+def synthetic_scene(width, height, faces, face_size, seed=0):
+    rng = np.random.default_rng(seed)
+    source_image = rng.integers(0, 256, (400, 400, 3), dtype=np.uint8)
+    source_face = Face(bbox=np.array([80, 60, 320, 360], dtype=np.float32))
+    target_image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    # Grid cells are big enough for the largest face size variation
+    cell = face_size * 2
+    columns = max(1, width // cell)
+    rows = max(1, height // cell)
+    faces = min(faces, columns * rows)
+
+    target_faces = []
+    for i in range(faces):
+        x = (i % columns) * cell + face_size // 4
+        y = (i // columns) * cell + face_size // 4
+        # Vary sizes a little, like real detections
+        w = face_size + int(rng.integers(-8, 9))
+        h = int(w * 1.25)
+        target_faces.append(Face(bbox=np.array([x, y, x + w, y + h], dtype=np.float32)))
+    return source_image, source_face, target_image, target_faces
+
+
+def swap_faces_cold(*args):
+    # Every mask rebuilt, as for a stream of never seen face sizes
+    clear_mask_cache()
+    return swap_faces(*args)
+
+
+def measure(swap, scene, repeat):
+    source_image, source_face, target_image, target_faces = scene
+    indices = list(range(len(target_faces)))
+    swap(source_image, source_face, target_image, target_faces, indices)  # warm up
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        swap(source_image, source_face, target_image, target_faces, indices)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    # Memory on top of the result image both versions have to allocate
+    tracemalloc.start()
+    result = swap(source_image, source_face, target_image, target_faces, indices)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak - result.nbytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark face blending")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--faces", type=int, default=36)
+    parser.add_argument("--face-size", type=int, default=160)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    scene = synthetic_scene(args.width, args.height, args.faces, args.face_size)
+    print(
+        f"{args.width}x{args.height} image, {len(scene[3])} faces of "
+        f"~{args.face_size}px, {args.repeat} runs"
+    )
+
+    legacy, legacy_time, legacy_peak = measure(legacy_swap_faces, scene, args.repeat)
+    _, cold_time, cold_peak = measure(swap_faces_cold, scene, args.repeat)
+    current, current_time, current_peak = measure(swap_faces, scene, args.repeat)
+
+    for name, elapsed, peak in (
+        ("legacy float64", legacy_time, legacy_peak),
+        ("cold masks", cold_time, cold_peak),
+        ("cached masks", current_time, current_peak),
+    ):
+        print(
+            f"{name:>15}: {elapsed * 1000:8.2f} ms/image, "
+            f"peak temporaries {peak / 2**20:6.2f} MB"
+        )
+
+    difference = np.abs(legacy.astype(np.int16) - current.astype(np.int16)).max()
+    print(
+        f"speedup: {legacy_time / current_time:.1f}x, max pixel difference: {difference}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faceswap.backends import required_tasks  # noqa: E402
+from faceswap.core import (  # noqa: E402
+    DEFAULT_DET_SIZE,
+    DEFAULT_MODEL_PACK,
+    MODE_BBOX,
+    MODE_INSWAPPER,
+    SWAP_MODES,
+    create_face_analyzer,
+    swap_faces,
+)
+
+# Regression benchmarks for every stage of a swap: decode, detect, swap,
+# encode, and all of them end to end. Inputs are synthetic and reproducible
+# (same seed, same images), one case per resolution x face count x face size.
+#
+# With --detector stub (default) detection returns the faces the scene was
+# drawn with, so the other stages can be measured without model files. With
+# --detector model the real analyzer is timed on the scene, and the swap
+# still uses the drawn faces so the blend numbers stay comparable.
+#
+#     python benchmarks/suite.py -o results.json
+#     python benchmarks/suite.py -o new.json --compare results.json
+
+STAGES = ("decode", "detect", "swap", "encode", "end_to_end")
+
+# Five landmarks (eyes, nose, mouth corners) relative to the face box
+LANDMARKS = np.array(
+    [[0.3, 0.4], [0.7, 0.4], [0.5, 0.6], [0.35, 0.8], [0.65, 0.8]], dtype=np.float32
+)
+
+
+def synthetic_face(rng, x, y, width, height):
+    bbox = np.array([x, y, x + width, y + height], dtype=np.float32)
+    kps = LANDMARKS * (width, height) + (x, y)
+    # A little jitter, so the aligned transform isn't a pure scale
+    kps += rng.normal(0, width * 0.01, kps.shape).astype(np.float32)
+    return Face(bbox=bbox, kps=kps, det_score=np.float32(0.9))
+
+
+def draw_face(image, face, color):
+    x1, y1, x2, y2 = face.bbox.astype(int)
+    center = ((x1 + x2) // 2, (y1 + y2) // 2)
+    cv2.ellipse(image, center, ((x2 - x1) // 2, (y2 - y1) // 2), 0, 0, 360, color, -1)
+    for x, y in face.kps.astype(int):
+        cv2.circle(image, (int(x), int(y)), max(1, (x2 - x1) // 20), (40, 40, 40), -1)
+
+
+def synthetic_scene(width, height, faces, face_size, seed=0):
+    # Smooth background with faces on a jittered grid, so the encoded size is
+    # closer to a photo than noise would be
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, height // 64), max(1, width // 64), 3))
+    image = cv2.resize(small.astype(np.uint8), (width, height), cv2.INTER_CUBIC)
+
+    cell = int(face_size * 1.6)
+    columns = max(1, width // cell)
+    rows = max(1, height // int(cell * 1.25))
+    target_faces = []
+    for i in range(min(faces, columns * rows)):
+        w = max(
+            16, face_size + int(rng.integers(-face_size // 10, face_size // 10 + 1))
+        )
+        h = int(w * 1.25)
+        x = (i % columns) * cell + int(rng.integers(0, max(1, cell - w)))
+        y = (i // columns) * int(cell * 1.25) + int(rng.integers(0, max(1, cell - w)))
+        face = synthetic_face(rng, x, y, min(w, width - x), min(h, height - y))
+        draw_face(image, face, tuple(int(c) for c in rng.integers(120, 230, 3)))
+        target_faces.append(face)
+    return image, target_faces
+
+
+def synthetic_source(seed=0):
+    rng = np.random.default_rng(seed + 1)
+    image = np.full((512, 512, 3), 200, dtype=np.uint8)
+    face = synthetic_face(rng, 136, 96, 240, 300)
+    draw_face(image, face, (150, 170, 210))
+    return image, face
+
+
+class StubDetector:
+    # Stands in for FaceAnalysis: the faces each scene was drawn with
+    def __init__(self):
+        self.faces = {}
+
+    def register(self, image, faces):
+        self.faces[image.shape] = faces
+
+    def get(self, img, max_num=0):
+        return self.faces.get(img.shape, [])
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def measure(fn, repeat, warmup=1):
+    # Wall times of repeat runs, then one extra run under tracemalloc for the
+    # peak of Python/numpy/OpenCV allocations. Tracing is kept out of timing.
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times)
+    return {
+        "runs": repeat,
+        "mean_ms": round(float(times.mean()) * 1000, 3),
+        "p50_ms": percentile_ms(times, 50),
+        "p95_ms": percentile_ms(times, 95),
+        "images_per_sec": round(1.0 / float(np.median(times)), 2),
+        "peak_mb": round(peak / 2**20, 3),
+    }
+
+
+def run_case(case, detector, source, mode, repeat, seed, backend_options):
+    width, height, faces, face_size = case
+    source_image, source_face = source
+    image, target_faces = synthetic_scene(width, height, faces, face_size, seed)
+    if isinstance(detector, StubDetector):
+        detector.register(image, target_faces)
+
+    encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1]
+    indices = list(range(len(target_faces)))
+
+    def decode():
+        return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+    def detect():
+        return detector.get(image)
+
+    def swap():
+        return swap_faces(
+            source_image,
+            source_face,
+            image,
+            target_faces,
+            indices,
+            mode,
+            **backend_options,
+        )
+
+    swapped = swap()
+
+    def encode():
+        return cv2.imencode(".jpg", swapped, [cv2.IMWRITE_JPEG_QUALITY, 95])
+
+    def end_to_end():
+        decoded = decode()
+        detector.get(decoded)
+        result = swap_faces(
+            source_image,
+            source_face,
+            decoded,
+            target_faces,
+            indices,
+            mode,
+            **backend_options,
+        )
+        return cv2.imencode(".jpg", result, [cv2.IMWRITE_JPEG_QUALITY, 95])
+
+    stages = {"decode": decode, "detect": detect, "swap": swap}
+    stages.update({"encode": encode, "end_to_end": end_to_end})
+    return {
+        "width": width,
+        "height": height,
+        "faces": len(target_faces),
+        "face_size": face_size,
+        "mode": mode,
+        "stages": {name: measure(fn, repeat) for name, fn in stages.items()},
+    }
+
+
+def case_name(result):
+    return (
+        f"{result['width']}x{result['height']} {result['faces']:>3} faces "
+        f"{result['face_size']:>4}px {result['mode']}"
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def compare(results, baseline):
+    # Median time ratio against a previous run, per case and stage
+    previous = {case_name(result): result for result in baseline["results"]}
+    for result in results:
+        name = case_name(result)
+        if name not in previous:
+            continue
+        ratios = []
+        for stage, stats in result["stages"].items():
+            before = previous[name]["stages"].get(stage)
+            # The stub detector's microseconds are all noise
+            if before and before["p50_ms"] >= 0.01:
+                ratios.append(f"{stage} {stats['p50_ms'] / before['p50_ms']:.2f}x")
+        print(f"{name}: {', '.join(ratios)}")
+
+
+def parse_sizes(spec):
+    sizes = []
+    for part in spec.split(","):
+        width, height = part.lower().split("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def parse_ints(spec):
+    return [int(part) for part in spec.split(",") if part.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark decode, detect, swap and encode on synthetic images"
+    )
+    parser.add_argument("--resolutions", default="640x480,1920x1080,3840x2160")
+    parser.add_argument("--faces", default="1,8,32", help="Face counts")
+    parser.add_argument("--face-sizes", default="64,160", help="Face widths in px")
+    parser.add_argument("--modes", default=MODE_BBOX, help="Comma separated")
+    parser.add_argument("--detector", choices=("stub", "model"), default="stub")
+    parser.add_argument("--model-pack", default=DEFAULT_MODEL_PACK)
+    parser.add_argument("--det-size", type=int, default=DEFAULT_DET_SIZE[0])
+    parser.add_argument("--swapper-model", help="inswapper model for that mode")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Previous JSON results to compare with")
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in SWAP_MODES:
+            parser.error(f"Unknown mode: {mode}")
+    backend_options = {}
+    if args.swapper_model:
+        backend_options["model_path"] = args.swapper_model
+
+    if args.detector == "model":
+        tasks = set()
+        for mode in modes:
+            tasks.update(required_tasks(mode))
+        detector = create_face_analyzer(
+            name=args.model_pack,
+            det_size=(args.det_size, args.det_size),
+            allowed_modules=sorted(tasks),
+        )
+    else:
+        detector = StubDetector()
+
+    source = synthetic_source(args.seed)
+    cases = [
+        (width, height, faces, face_size)
+        for width, height in parse_sizes(args.resolutions)
+        for faces in parse_ints(args.faces)
+        for face_size in parse_ints(args.face_sizes)
+    ]
+
+    results = []
+    print(f"{'case':<40} " + " ".join(f"{stage:>16}" for stage in STAGES))
+    for mode in modes:
+        for case in cases:
+            result = run_case(
+                case,
+                detector,
+                source,
+                mode,
+                args.repeat,
+                args.seed,
+                backend_options if mode == MODE_INSWAPPER else {},
+            )
+            results.append(result)
+            cells = [
+                f"{result['stages'][stage]['p50_ms']:7.2f}/"
+                f"{result['stages'][stage]['p95_ms']:<7.2f}ms"
+                for stage in STAGES
+            ]
+            print(f"{case_name(result):<40} " + " ".join(cells))
+
+    # ru_maxrss is KB on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+    print(f"p50/p95 per stage; process peak RSS {max_rss_mb:.1f} MB")
+
+    report = {
+        "environment": environment(),
+        "settings": vars(args),
+        "max_rss_mb": round(max_rss_mb, 1),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from faceswap.blending import blend_into
+
+# Instead of stretching the source bbox onto the target bbox, the source face
+# is mapped with a similarity transform estimated from the five landmarks.
+# The source crop and its blurred mask are packed into one BGRA image once
+# per source, so each target face costs a single warpAffine into its ROI.
+
+
+class AlignedSource:
+    def __init__(self, source_image, source_face, margin=0.25):
+        x1, y1, x2, y2 = source_face.bbox[:4]
+        box_width, box_height = x2 - x1, y2 - y1
+
+        # Keep some context around the face so the warp has pixels to pull
+        height, width = source_image.shape[:2]
+        cx1 = max(0, int(x1 - box_width * margin))
+        cy1 = max(0, int(y1 - box_height * margin))
+        cx2 = min(width, int(x2 + box_width * margin))
+        cy2 = min(height, int(y2 + box_height * margin))
+        crop = source_image[cy1:cy2, cx1:cx2]
+
+        # Same elliptical mask as the bbox blend, drawn around the face box
+        mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+        center = (int((x1 + x2) / 2) - cx1, int((y1 + y2) / 2) - cy1)
+        axes = (
+            max(1, int(box_width) // 2 - 5),
+            max(1, int(box_height) // 2 - 5),
+        )
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)  # type: ignore
+        mask = cv2.GaussianBlur(mask, (19, 19), 11)
+
+        self.face_with_mask = np.dstack([crop, mask])
+        self.kps = np.asarray(source_face.kps, dtype=np.float32) - (cx1, cy1)
+
+    def transform_to(self, target_face):
+        # Similarity transform (rotation, uniform scale, shift) from crop
+        # coordinates to target image coordinates
+        matrix, _ = cv2.estimateAffinePartial2D(
+            self.kps, np.asarray(target_face.kps, dtype=np.float32), method=cv2.LMEDS
+        )
+        return matrix
+
+    def swap_into(self, result_image, target_face, color_match=False):
+        # Blend into result_image in place; False if nothing was changed
+        if target_face.kps is None:
+            return False
+
+        matrix = self.transform_to(target_face)
+        if matrix is None:
+            return False
+
+        return warp_blend_into(result_image, self.face_with_mask, matrix, color_match)
+
+
+def warp_blend_into(result_image, face_with_mask, matrix, color_match=False):
+    # Warp a BGRA face (alpha = blend mask) with the 2x3 matrix and blend it
+    # into result_image in place, touching only the warped face's ROI
+    height, width = face_with_mask.shape[:2]
+    corners = np.array(
+        [[0, 0, 1], [width, 0, 1], [0, height, 1], [width, height, 1]],
+        dtype=np.float64,
+    )
+    warped_corners = corners @ matrix.T
+    image_height, image_width = result_image.shape[:2]
+    x1 = max(0, int(np.floor(warped_corners[:, 0].min())))
+    y1 = max(0, int(np.floor(warped_corners[:, 1].min())))
+    x2 = min(image_width, int(np.ceil(warped_corners[:, 0].max())))
+    y2 = min(image_height, int(np.ceil(warped_corners[:, 1].max())))
+    if x2 <= x1 or y2 <= y1:
+        return False
+
+    # Warp face and mask together, straight into ROI coordinates
+    matrix = matrix.copy()
+    matrix[:, 2] -= (x1, y1)
+    warped = cv2.warpAffine(
+        face_with_mask,
+        matrix,
+        (x2 - x1, y2 - y1),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=0,
+    )
+
+    mask = warped[:, :, 3].astype(np.float32)
+    mask *= 1.0 / 255.0
+    blend_into(
+        result_image[y1:y2, x1:x2],
+        np.ascontiguousarray(warped[:, :, :3]),
+        mask,
+        1.0 - mask,
+        color_match,
+    )
+    return True
+
+
+# Recently prepared sources by (image, face) identity. Holding on to the
+# objects keeps their ids from being reused while they are cached.
+MAX_PREPARED_SOURCES = 16
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+
+
+def aligned_source(source_image, source_face):
+    # Prepared sources are reused while the same image and face objects are
+    # passed in, e.g. for every target of a batch run, or for each of the
+    # source faces of a many-to-many mapping
+    key = (id(source_image), id(source_face))
+    with _prepared_lock:
+        if key in _prepared:
+            _prepared.move_to_end(key)
+        else:
+            _prepared[key] = (
+                source_image,
+                source_face,
+                AlignedSource(source_image, source_face),
+            )
+            if len(_prepared) > MAX_PREPARED_SOURCES:
+                _prepared.popitem(last=False)
+        return _prepared[key][2]
@@ -0,0 +1,340 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from faceswap.alignment import aligned_source, warp_blend_into
+from faceswap.core import (
+    MODE_ALIGNED,
+    MODE_BBOX,
+    MODE_INSWAPPER,
+    MODE_SEAMLESS,
+    clip_bbox,
+    swap_face,
+    unique_pairs,
+)
+
+# A backend replaces the selected target faces of an image in place:
+#
+#     backend.swap_into(result_image, source_image, source_face, target_faces,
+#                       indices) -> number of faces swapped
+#
+# or, for several source faces at once, with (source index, target index)
+# pairs:
+#
+#     backend.swap_pairs_into(result_image, source_image, source_faces,
+#                             target_faces, pairs) -> number of faces swapped
+#
+# A target face listed in several pairs is swapped once, with the source of
+# its last pair (see core.unique_pairs).
+#
+# Instances are created once through get_backend and reused, so anything
+# expensive (model sessions, prepared sources) lives as long as the process.
+
+DEFAULT_INSWAPPER_PATH = os.path.join(
+    "~", ".insightface", "models", "inswapper_128.onnx"
+)
+
+
+class SwapBackend:
+    # Analyzer tasks the backend needs on detected faces
+    required_tasks = ("detection",)
+
+    def __init__(self, color_match=False):
+        # Recolor each face to the target's skin tone before blending
+        self.color_match = color_match
+
+    def swap_into(self, result_image, source_image, source_face, target_faces, indices):
+        raise NotImplementedError
+
+    def swap_pairs_into(
+        self, result_image, source_image, source_faces, target_faces, pairs
+    ):
+        # Grouped by source face, so each one is prepared once per image and
+        # every target face is blended exactly once
+        by_source = {}
+        for source_index, target_index in unique_pairs(pairs):
+            by_source.setdefault(source_index, []).append(target_index)
+
+        return sum(
+            self.swap_into(
+                result_image,
+                source_image,
+                source_faces[source_index],
+                target_faces,
+                indices,
+            )
+            for source_index, indices in by_source.items()
+        )
+
+    def _targets(self, target_faces, indices):
+        return [target_faces[idx] for idx in indices if idx < len(target_faces)]
+
+
+class BboxBlendBackend(SwapBackend):
+    # The original method: stretch the source box onto each target box
+    def swap_into(self, result_image, source_image, source_face, target_faces, indices):
+        swapped = 0
+        for target_face in self._targets(target_faces, indices):
+            if swap_face(
+                result_image, source_image, source_face, target_face, self.color_match
+            ):
+                swapped += 1
+        return swapped
+
+
+class AlignedBlendBackend(SwapBackend):
+    # Similarity warp fitted to the landmarks, see faceswap/alignment.py
+    def swap_into(self, result_image, source_image, source_face, target_faces, indices):
+        aligned = None
+        if source_face.kps is not None:
+            aligned = aligned_source(source_image, source_face)
+
+        swapped = 0
+        for target_face in self._targets(target_faces, indices):
+            # Faces without landmarks fall back to the bbox blend
+            if aligned is not None and aligned.swap_into(
+                result_image, target_face, self.color_match
+            ):
+                swapped += 1
+            elif swap_face(
+                result_image, source_image, source_face, target_face, self.color_match
+            ):
+                swapped += 1
+        return swapped
+
+
+@lru_cache(maxsize=256)
+def _clone_mask(width, height):
+    mask = np.zeros((height, width), dtype=np.uint8)
+    center = (width // 2, height // 2)
+    axes = (max(1, width // 2 - 5), max(1, height // 2 - 5))
+    cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)  # type: ignore
+    mask.setflags(write=False)
+    return mask
+
+
+class SeamlessCloneBackend(SwapBackend):
+    # Poisson blending: matches the target's lighting at the seam, slower
+    # than alpha blending. Solved on the face ROI, not the whole image.
+    # color_match only applies to the alpha blend fallback; the Poisson
+    # solve already takes its colors from the target.
+    padding = 8
+
+    def swap_into(self, result_image, source_image, source_face, target_faces, indices):
+        swapped = 0
+        for target_face in self._targets(target_faces, indices):
+            try:
+                done = self._clone(result_image, source_image, source_face, target_face)
+            except cv2.error:
+                done = False
+            # Poisson cloning needs room around the mask; use alpha otherwise
+            if done or swap_face(
+                result_image, source_image, source_face, target_face, self.color_match
+            ):
+                swapped += 1
+        return swapped
+
+    def _clone(self, result_image, source_image, source_face, target_face):
+        sx1, sy1, sx2, sy2 = clip_bbox(source_face.bbox, source_image.shape)
+        dst_bbox = target_face.bbox.astype(int)
+        dst_width = dst_bbox[2] - dst_bbox[0]
+        dst_height = dst_bbox[3] - dst_bbox[1]
+        if sx2 <= sx1 or sy2 <= sy1 or dst_width <= 10 or dst_height <= 10:
+            return False
+
+        # The whole box plus padding has to fit inside the image
+        height, width = result_image.shape[:2]
+        rx1, ry1 = dst_bbox[0] - self.padding, dst_bbox[1] - self.padding
+        rx2, ry2 = dst_bbox[2] + self.padding, dst_bbox[3] + self.padding
+        if rx1 < 0 or ry1 < 0 or rx2 > width or ry2 > height:
+            return False
+
+        src_face = cv2.resize(source_image[sy1:sy2, sx1:sx2], (dst_width, dst_height))
+        mask = _clone_mask(dst_width, dst_height)
+
+        # seamlessClone centers the mask's bounding box on this point
+        bx, by, bw, bh = cv2.boundingRect(mask)
+        center = (
+            self.padding + bx + bw // 2,
+            self.padding + by + bh // 2,
+        )
+
+        region = result_image[ry1:ry2, rx1:rx2]
+        region[...] = cv2.seamlessClone(
+            src_face, np.ascontiguousarray(region), mask, center, cv2.NORMAL_CLONE
+        )
+        return True
+
+
+@lru_cache(maxsize=4)
+def _swapper_mask(size):
+    # Soft edged square in the aligned crop, close to what insightface's
+    # paste_back builds per face in image space
+    mask = np.full((size, size), 255, dtype=np.uint8)
+    border = max(2, size // 10)
+    mask = cv2.erode(mask, np.ones((border, border), np.uint8), borderValue=0)
+    blur = 2 * max(5, size // 20) + 1
+    mask = cv2.GaussianBlur(mask, (blur, blur), 0)
+    mask.setflags(write=False)
+    return mask
+
+
+class InswapperBackend(SwapBackend):
+    # insightface's inswapper ONNX model on onnxruntime. One InferenceSession
+    # per backend instance; all selected faces of an image go through one
+    # run() call when the model accepts a batch dimension.
+    required_tasks = ("detection", "recognition")
+
+    def __init__(
+        self, model_path=DEFAULT_INSWAPPER_PATH, providers=None, color_match=False
+    ):
+        import onnxruntime
+        from insightface.model_zoo.inswapper import INSwapper
+
+        super().__init__(color_match)
+
+        model_path = os.path.expanduser(model_path)
+        if not os.path.isfile(model_path):
+            raise ValueError(f"Swapper model not found: {model_path}")
+
+        session = onnxruntime.InferenceSession(
+            model_path, providers=providers or ["CPUExecutionProvider"]
+        )
+        # INSwapper reads the embedding projection (emap) and the I/O names
+        self.model = INSwapper(model_file=model_path, session=session)
+        self.size = self.model.input_size[0]
+        batch = self.model.input_shape[0]
+        self.batched = not isinstance(batch, int) or batch != 1
+
+        # id(source face) -> (face, latent) of recently used source faces
+        self._latents = OrderedDict()
+        self._latent_lock = threading.Lock()
+
+    def latent(self, source_face):
+        # The embedding from detection time, projected once per source face
+        key = id(source_face)
+        with self._latent_lock:
+            if key in self._latents:
+                self._latents.move_to_end(key)
+            else:
+                if source_face.normed_embedding is None:
+                    raise ValueError(
+                        "The swapper needs face embeddings; load the recognition model"
+                    )
+                latent = source_face.normed_embedding.reshape((1, -1))
+                latent = np.dot(latent, self.model.emap)
+                latent /= np.linalg.norm(latent)
+                self._latents[key] = (source_face, latent.astype(np.float32))
+                if len(self._latents) > 16:
+                    self._latents.popitem(last=False)
+            return self._latents[key][1]
+
+    def _run(self, crops, latents):
+        # latents holds one row per crop
+        blob = cv2.dnn.blobFromImages(
+            crops,
+            1.0 / self.model.input_std,
+            (self.size, self.size),
+            (self.model.input_mean,) * 3,
+            swapRB=True,
+        )
+        names = self.model.input_names
+        if self.batched:
+            return self.model.session.run(
+                self.model.output_names, {names[0]: blob, names[1]: latents}
+            )[0]
+
+        # Fixed batch size of 1: same session, one run per face
+        return np.concatenate(
+            [
+                self.model.session.run(
+                    self.model.output_names,
+                    {names[0]: blob[i : i + 1], names[1]: latents[i : i + 1]},
+                )[0]
+                for i in range(len(crops))
+            ]
+        )
+
+    def swap_into(self, result_image, source_image, source_face, target_faces, indices):
+        pairs = [(0, idx) for idx in indices]
+        return self.swap_pairs_into(
+            result_image, source_image, [source_face], target_faces, pairs
+        )
+
+    def swap_pairs_into(
+        self, result_image, source_image, source_faces, target_faces, pairs
+    ):
+        # Every assigned face of the image, whatever its source, goes through
+        # one run() call with one latent row per face
+        from insightface.utils import face_align
+
+        pairs = [
+            (source_index, target_faces[target_index])
+            for source_index, target_index in unique_pairs(pairs)
+            if target_index < len(target_faces)
+            and target_faces[target_index].kps is not None
+        ]
+        if not pairs:
+            return 0
+
+        latents = np.vstack(
+            [self.latent(source_faces[source_index]) for source_index, _ in pairs]
+        )
+
+        crops = []
+        matrices = []
+        for _, target_face in pairs:
+            crop, matrix = face_align.norm_crop2(
+                result_image, target_face.kps, self.size
+            )
+            crops.append(crop)
+            matrices.append(matrix)
+
+        pred = self._run(crops, latents)
+
+        # NCHW RGB in [0, 1] -> NHWC BGR uint8
+        fakes = np.clip(pred.transpose((0, 2, 3, 1)) * 255, 0, 255).astype(np.uint8)
+        mask = _swapper_mask(self.size)
+
+        swapped = 0
+        for fake, matrix in zip(fakes, matrices):
+            face_with_mask = np.dstack([fake[:, :, ::-1], mask])
+            inverse = cv2.invertAffineTransform(matrix)
+            if warp_blend_into(result_image, face_with_mask, inverse, self.color_match):
+                swapped += 1
+        return swapped
+
+
+BACKENDS = {
+    MODE_BBOX: BboxBlendBackend,
+    MODE_ALIGNED: AlignedBlendBackend,
+    MODE_SEAMLESS: SeamlessCloneBackend,
+    MODE_INSWAPPER: InswapperBackend,
+}
+
+
+def required_tasks(name):
+    # Analyzer models a mode needs, without building the backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown swap mode: {name!r}")
+    return BACKENDS[name].required_tasks
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name, **options):
+    # Shared instance per name and options
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown swap mode: {name!r}")
+
+    key = (name, tuple(sorted(options.items())))
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = BACKENDS[name](**options)
+        return _instances[key]
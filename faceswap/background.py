@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, label, messages):
+        self.label = label
+        self.stage = label
+        self.started = time.perf_counter()
+        self.future = None
+        self.callbacks = (None, None)
+        self._cancelled = threading.Event()
+        self._messages = messages
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        # True when the job never started and won't report back
+        self._cancelled.set()
+        return self.future is not None and self.future.cancel()
+
+    def check(self):
+        # Called by the work function between steps to stop early
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def progress(self, stage):
+        # Safe to call from the worker thread
+        self.check()
+        self._messages.put((self, "progress", stage))
+
+
+class BackgroundJobs:
+    # Runs slow work (detection, swapping) on a worker thread so the Tk main
+    # loop keeps drawing. Results come back through a queue that the main
+    # loop polls with root.after, so callbacks, widgets and app state are only
+    # ever touched from the main thread. Submitting a job cancels the one
+    # before it; results of cancelled jobs are dropped.
+    def __init__(self, root, status_var, poll_ms=50, profiler=None):
+        self.root = root
+        self.status_var = status_var
+        self.poll_ms = poll_ms
+        self.profiler = profiler  # faceswap.metrics.Profiler for the work
+        self.current = None
+        self._outstanding = set()
+        self._messages = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._polling = False
+
+    @property
+    def busy(self):
+        return self.current is not None
+
+    def submit(self, label, fn, on_done, on_error=None):
+        # fn(job) runs on the worker thread; on_done(result) and
+        # on_error(exception) run on the main loop
+        self.cancel()
+        job = Job(label, self._messages)
+        job.callbacks = (on_done, on_error)
+        self._outstanding.add(job)
+        job.future = self._executor.submit(self._run, job, fn)
+        self.current = job
+        self._show_progress()
+        self._schedule_poll()
+        return job
+
+    def cancel(self):
+        if self.current is not None:
+            if self.current.cancel():
+                self._outstanding.discard(self.current)
+            self.current = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, fn):
+        try:
+            job.check()
+            if self.profiler is not None:
+                with self.profiler.running():
+                    result = fn(job)
+            else:
+                result = fn(job)
+            job.check()
+            self._messages.put((job, "done", result))
+        except JobCancelled:
+            self._messages.put((job, "cancelled", None))
+        except Exception as e:
+            self._messages.put((job, "error", e))
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        while True:
+            try:
+                job, kind, value = self._messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "progress":
+                job.stage = value
+                continue
+
+            self._outstanding.discard(job)
+            if job is not self.current or job.cancelled:
+                continue
+            self.current = None
+
+            on_done, on_error = job.callbacks
+            if kind == "done":
+                on_done(value)
+            elif kind == "error" and on_error is not None:
+                on_error(value)
+
+        if self.current is not None:
+            self._show_progress()
+            self._schedule_poll()
+        elif self._outstanding:
+            # Cancelled jobs still running; drain their messages later
+            self._schedule_poll()
+
+    def _show_progress(self):
+        job = self.current
+        elapsed = time.perf_counter() - job.started
+        self.status_var.set(f"{job.stage}... {elapsed:.1f}s")
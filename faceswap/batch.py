@@ -0,0 +1,700 @@
+import argparse
+import copy
+import glob
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+from faceswap.core import (
+    AUTO_DET_SIZES,
+    DEFAULT_DET_SIZE,
+    DEFAULT_MODEL_PACK,
+    MAP_MATCH,
+    MODE_BBOX,
+    MODE_INSWAPPER,
+    PRESETS,
+    SWAP_MODES,
+    LazyFaceAnalyzer,
+    det_size_option,
+    parse_det_size,
+    parse_mapping,
+    parse_selection,
+    select_faces,
+    unique_pairs,
+)
+from faceswap.backends import DEFAULT_INSWAPPER_PATH, get_backend, required_tasks
+from faceswap.detection_cache import DEFAULT_CACHE_BYTES, DEFAULT_CACHE_PATH
+from faceswap.identity import DEFAULT_MATCH_THRESHOLD, load_matcher, match_pairs
+from faceswap.image_io import (
+    add_encode_arguments,
+    encode_options,
+    load_image,
+    read_image,
+    write_image,
+)
+from faceswap.metrics import Profiler, count, metrics, timed
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+
+class TargetPath(str):
+    # A target path that also knows its output name: its path below the
+    # directory or glob root it was found under, so "photos/**/*.jpg" keeps
+    # photos/a/1.jpg and photos/b/1.jpg apart. Paths from @files only have
+    # their file name.
+    def __new__(cls, path, output_name=None):
+        target = super().__new__(cls, path)
+        target.output_name = output_name or os.path.basename(path)
+        return target
+
+
+def glob_root(pattern):
+    # The directories of a glob pattern before its first wildcard
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep)[:-1]:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def iter_target_paths(specs):
+    # Each spec is a directory, a glob pattern or "@file" with one path per line
+    for spec in specs:
+        if spec.startswith("@"):
+            with open(spec[1:], encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield TargetPath(line)
+        elif os.path.isdir(spec):
+            for name in sorted(os.listdir(spec)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield TargetPath(os.path.join(spec, name))
+        else:
+            root = glob_root(spec)
+            for path in sorted(glob.glob(spec, recursive=True)):
+                yield TargetPath(path, os.path.relpath(path, root))
+
+
+def output_path_for(target_path, output_dir, output_format=None):
+    name = getattr(target_path, "output_name", None) or os.path.basename(target_path)
+    if output_format:
+        name = os.path.splitext(name)[0] + "." + output_format
+    return os.path.join(output_dir, name)
+
+
+def check_outputs(target_paths, output_dir, output_format=None):
+    # Two targets writing the same output file would silently lose one of
+    # the results, so that is refused before anything runs
+    seen = {}
+    for target_path in target_paths:
+        output_path = output_path_for(target_path, output_dir, output_format)
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in seen:
+            raise ValueError(
+                f"{seen[key]} and {target_path} would both be written to "
+                f"{output_path}"
+            )
+        seen[key] = target_path
+
+
+class BatchStats:
+    def __init__(self):
+        self.swapped = 0
+        self.no_faces = 0
+        self.failed = 0
+        self.skipped = 0  # Already done by an earlier run
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def processed(self):
+        return self.swapped + self.no_faces + self.failed
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        summary = (
+            f"Processed {self.processed} images in {elapsed:.1f}s "
+            f"({rate:.2f} images/sec): {self.swapped} swapped, "
+            f"{self.no_faces} without faces, {self.failed} failed"
+        )
+        if self.skipped:
+            summary += f", {self.skipped} skipped as already done"
+        return summary
+
+
+class SourceFace:
+    # The source image is analyzed once and reused for every target, with
+    # one swap backend instance for the whole run. source_path may also be
+    # an already decoded BGR image.
+    #
+    # Without a mapping the first source face replaces every selected target
+    # face. A mapping is a list of 0-based (source, target) face pairs, or
+    # MAP_MATCH to give each target face the source face it resembles.
+    def __init__(
+        self,
+        analyzer,
+        source_path,
+        mode=MODE_BBOX,
+        mapping=None,
+        match_threshold=DEFAULT_MATCH_THRESHOLD,
+        **backend_options,
+    ):
+        self.mapping = mapping
+        self.match_threshold = match_threshold
+        self.backend = get_backend(mode, **backend_options)
+        if isinstance(source_path, np.ndarray):
+            self.image, source_path = source_path, "<image>"
+        else:
+            self.image, _ = load_image(source_path)
+        if self.image is None:
+            raise ValueError(f"Could not read source image: {source_path}")
+
+        faces = analyzer.get(self.image)
+        if not faces:
+            raise ValueError(f"No face detected in source image: {source_path}")
+
+        # Same choice the GUI makes: the first detected face
+        self.faces = faces
+        self.face = faces[0]
+
+    def with_mapping(self, mapping):
+        # The same detected faces and backend with another face mapping
+        source = copy.copy(self)
+        source.mapping = mapping
+        return source
+
+    def pairs(self, target_faces, indices):
+        if self.mapping is None:
+            return [(0, idx) for idx in indices]
+        if self.mapping == MAP_MATCH:
+            return match_pairs(self.faces, target_faces, indices, self.match_threshold)
+
+        selected = set(indices)
+        return unique_pairs(
+            (source_index, target_index)
+            for source_index, target_index in self.mapping
+            if source_index < len(self.faces) and target_index in selected
+        )
+
+    def select(self, target_faces, policy, indices):
+        # Selected target faces that will actually be swapped
+        selected = select_faces(target_faces, policy, indices)
+        if self.mapping is None:
+            return selected
+        return [target for _, target in self.pairs(target_faces, selected)]
+
+    def swap(self, target_image, target_faces, indices):
+        result_image = target_image.copy()
+        self.swap_into(result_image, target_faces, indices)
+        return result_image
+
+    def swap_into(self, image, target_faces, indices):
+        with timed("swap"):
+            swapped = self.backend.swap_pairs_into(
+                image,
+                self.image,
+                self.faces,
+                target_faces,
+                self.pairs(target_faces, indices),
+            )
+        count("faces_swapped", swapped)
+        return swapped
+
+
+def detect(analyzer, image):
+    with timed("detect"):
+        faces = analyzer.get(image)
+    count("faces_detected", len(faces))
+    return faces
+
+
+def swap_target(analyzer, source, target_image, policy, indices):
+    target_faces = detect(analyzer, target_image)
+    selected = source.select(target_faces, policy, indices)
+    if not selected:
+        return None
+
+    return source.swap(target_image, target_faces, selected)
+
+
+def read_target(target_path, image_options=None):
+    # image_options: max_size, output_format and encode_params() keywords
+    return read_image(target_path, (image_options or {}).get("max_size"))
+
+
+def write_result(target_path, output_dir, image, image_options=None):
+    options = dict(image_options or {})
+    options.pop("max_size", None)
+    output_path = output_path_for(
+        target_path, output_dir, options.pop("output_format", None)
+    )
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    write_image(output_path, image, **options)
+
+
+def process_path(
+    analyzer, source, target_path, output_dir, policy, indices, image_options=None
+):
+    # Returns "swapped", "no_faces" or raises on failure
+    target_image = read_target(target_path, image_options)
+
+    result = swap_target(analyzer, source, target_image, policy, indices)
+    if result is None:
+        return "no_faces"
+
+    write_result(target_path, output_dir, result, image_options)
+    return "swapped"
+
+
+def iter_serial(
+    analyzer, source, target_paths, output_dir, policy, indices, image_options=None
+):
+    # Yields (target_path, status, error), one image at a time
+    for target_path in target_paths:
+        try:
+            status = process_path(
+                analyzer,
+                source,
+                target_path,
+                output_dir,
+                policy,
+                indices,
+                image_options,
+            )
+            yield target_path, status, None
+        except Exception as e:
+            yield target_path, "failed", str(e)
+
+
+def collect_results(results, log=None):
+    # Consume (target_path, status, error) tuples from any engine
+    stats = BatchStats()
+
+    for target_path, status, error in results:
+        if status == "swapped":
+            stats.swapped += 1
+        elif status == "no_faces":
+            stats.no_faces += 1
+        elif status == "skipped":
+            stats.skipped += 1
+        else:
+            stats.failed += 1
+            if log:
+                log(f"Failed: {target_path}: {error}")
+
+    stats.stop()
+    return stats
+
+
+def run_batch(
+    analyzer,
+    source,
+    target_paths,
+    output_dir,
+    policy,
+    indices,
+    log=None,
+    image_options=None,
+):
+    os.makedirs(output_dir, exist_ok=True)
+    results = iter_serial(
+        analyzer, source, target_paths, output_dir, policy, indices, image_options
+    )
+    return collect_results(results, log)
+
+
+def add_mode_arguments(parser):
+    parser.add_argument(
+        "--mode",
+        choices=SWAP_MODES,
+        default=MODE_BBOX,
+        help="bbox stretches the source box onto each target box, aligned maps "
+        "it with a similarity transform fitted to the facial landmarks, "
+        "seamless uses Poisson blending and inswapper runs the ONNX face "
+        "swapper model",
+    )
+    parser.add_argument(
+        "--swapper-model",
+        default=DEFAULT_INSWAPPER_PATH,
+        help="inswapper ONNX model file for --mode inswapper",
+    )
+    parser.add_argument(
+        "--color-match",
+        action="store_true",
+        help="Match each swapped face's color and brightness to the target "
+        "face it replaces",
+    )
+
+
+def det_size_type(value):
+    try:
+        return parse_det_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_model_arguments(parser):
+    parser.add_argument(
+        "--preset",
+        choices=tuple(PRESETS),
+        help="fast: buffalo_s models, det size 320, bbox blend; balanced: "
+        "buffalo_l, det size auto, aligned blend; accurate: balanced with det "
+        "size auto:1280, tiled detection and color matching. Options given explicitly override it.",
+    )
+    parser.add_argument(
+        "--model-pack", default=DEFAULT_MODEL_PACK, help="InsightFace model pack"
+    )
+    parser.add_argument(
+        "--det-size",
+        type=det_size_type,
+        default=DEFAULT_DET_SIZE[0],
+        help='Square detector input size, or "auto" to choose it per image '
+        'from 320, 480 and 640 by the image size. "auto:N" allows sizes up '
+        f"to N from {', '.join(map(str, AUTO_DET_SIZES))}.",
+    )
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="Also detect large images in overlapping det-size tiles, which "
+        "finds small faces at one detector run per tile",
+    )
+
+
+def parse_args(parser, argv=None):
+    # A --preset replaces the defaults of the options it covers, so the
+    # arguments are parsed again once it is known
+    args, _ = parser.parse_known_args(argv)
+    if getattr(args, "preset", None):
+        parser.set_defaults(**PRESETS[args.preset])
+    return parser.parse_args(argv)
+
+
+def backend_options(args):
+    options = {}
+    if args.mode == MODE_INSWAPPER:
+        options["model_path"] = args.swapper_model
+    if args.color_match:
+        options["color_match"] = True
+    return options
+
+
+def source_options(args):
+    # Keyword arguments for SourceFace: the backend's plus the face mapping
+    options = backend_options(args)
+    if args.map:
+        options["mapping"] = parse_mapping(args.map)
+        options["match_threshold"] = args.match_threshold
+    return options
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Swap one source face into every image of a target set."
+    )
+    parser.add_argument("--source", required=True, help="Image with the source face")
+    parser.add_argument(
+        "targets",
+        nargs="+",
+        help="Target directory, glob pattern, or @file listing one path per line",
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="Directory for the swapped images"
+    )
+    parser.add_argument(
+        "--select",
+        default="all",
+        help='Faces to replace: "all", "largest" or 1-based numbers like "1,3"',
+    )
+    parser.add_argument(
+        "--map",
+        help='Source face for each target face: 1-based "source:target" pairs '
+        'like "1:2,2:1", or "match" to pair every target face with the most '
+        "similar source face (default: source face 1 onto every selected face)",
+    )
+    parser.add_argument(
+        "--match",
+        metavar="REFERENCE",
+        help="Replace only faces of the person in this reference image, or of "
+        "any identity in an index built with faceswap.identity (overrides "
+        "--select)",
+    )
+    parser.add_argument(
+        "--match-threshold",
+        type=float,
+        default=DEFAULT_MATCH_THRESHOLD,
+        help="Cosine similarity needed to count as the same person "
+        "(--match and --map match)",
+    )
+    add_mode_arguments(parser)
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        help="Downscale targets to at most this many pixels on the longer "
+        "side; JPEGs are decoded at reduced scale, which is much faster",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("jpg", "png", "webp"),
+        help="Output format (default: the target's own)",
+    )
+    add_encode_arguments(parser)
+    parser.add_argument(
+        "--roi",
+        action="store_true",
+        help="For targets too large to hold in memory: keep each one memory "
+        "mapped on disk and load only the regions around its faces (one image "
+        "at a time)",
+    )
+    parser.add_argument(
+        "--roi-detect-size",
+        type=int,
+        default=4096,
+        help="Longer side of the downscaled copy faces are detected on with --roi",
+    )
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_CACHE_PATH,
+        default=None,
+        metavar="PATH",
+        help="Reuse face detections of previously seen images "
+        f"(default location: {DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+        help="Detection cache size limit in MB",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes, each with its own face analyzer",
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=None,
+        help="onnxruntime intra-op threads per worker (default: cores / workers)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=None,
+        help="Maximum images in flight per stage (default: 4 per worker or I/O thread)",
+    )
+    parser.add_argument(
+        "--io-threads",
+        type=int,
+        default=2,
+        help="Decode and encode threads each for single-process runs "
+        "(0 processes one image at a time)",
+    )
+    parser.add_argument(
+        "--detect-batch",
+        type=int,
+        default=1,
+        help="Images per detector call in single-process runs",
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Let fast images overtake slow ones instead of finishing in input order",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Write stage timings and counters at the end: JSON for .json "
+        "files, Prometheus text format otherwise (this process only, not "
+        "--workers processes)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Run under cProfile and dump the stats to PATH (the main thread, "
+        "which includes detection and, without --io-threads, everything)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write every timed stage as a Chrome trace (chrome://tracing)",
+    )
+    return parser
+
+
+def analyzer_tasks(args):
+    # Only the models the swap mode uses are loaded, plus recognition for
+    # --match
+    tasks = list(required_tasks(args.mode))
+    matching = args.match or (args.map or "").strip().lower() == MAP_MATCH
+    if matching and "recognition" not in tasks:
+        tasks.append("recognition")
+    return tasks
+
+
+def analyzer_options(args):
+    return {
+        "name": args.model_pack,
+        "det_size": det_size_option(args.det_size),
+        "cache_path": args.cache,
+        "cache_bytes": args.cache_size * 1024 * 1024,
+        "detect_batch": args.detect_batch,
+        "tiled": args.tiled,
+        "allowed_modules": analyzer_tasks(args),
+    }
+
+
+def image_options(args):
+    options = {"max_size": args.max_size, "output_format": args.format}
+    options.update(encode_options(args))
+    return options
+
+
+def run_with_workers(args, target_paths, policy, indices, log):
+    # Imported here so the worker module isn't loaded for serial runs
+    from faceswap.parallel import run_parallel
+
+    return run_parallel(
+        args.source,
+        target_paths,
+        args.output,
+        policy,
+        indices,
+        (args.mode, source_options(args)),
+        args.workers,
+        analyzer_options(args),
+        log=log,
+        threads_per_worker=args.threads_per_worker,
+        queue_size=args.queue_size,
+        ordered=not args.unordered,
+        image_options=image_options(args),
+    )
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parse_args(parser, argv)
+    if args.roi and (args.workers > 1 or args.max_size):
+        parser.error("--roi runs in one process at full size")
+
+    try:
+        policy, indices = parse_selection(args.select)
+        options = source_options(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    # Built on first use: worker runs only need it to embed a --match image
+    analyzer = LazyFaceAnalyzer(**analyzer_options(args))
+    if args.match:
+        try:
+            policy = load_matcher(args.match, args.match_threshold, analyzer)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    log = lambda message: print(message, file=sys.stderr)
+
+    profiler = Profiler(args.profile) if args.profile else None
+    if args.trace:
+        metrics.start_trace()
+    try:
+        with profiler.running() if profiler else nullcontext():
+            return run(args, analyzer, policy, indices, options, log)
+    finally:
+        write_reports(args, profiler)
+
+
+def write_reports(args, profiler):
+    if args.metrics:
+        metrics.write(args.metrics)
+    if args.trace:
+        metrics.write_trace(args.trace)
+    if profiler is not None:
+        profiler.dump()
+
+
+def run(args, analyzer, policy, indices, options, log):
+    target_paths = list(iter_target_paths(args.targets))
+    try:
+        check_outputs(target_paths, args.output, args.format)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if args.workers > 1:
+        try:
+            stats = run_with_workers(args, target_paths, policy, indices, log)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(stats.summary())
+        return 0 if stats.failed == 0 else 1
+
+    try:
+        source = SourceFace(analyzer, args.source, args.mode, **options)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.roi:
+        from faceswap.large_image import run_large
+
+        stats = run_large(
+            analyzer,
+            source,
+            target_paths,
+            args.output,
+            policy,
+            indices,
+            log=log,
+            detect_size=args.roi_detect_size,
+            image_options=image_options(args),
+        )
+    elif args.io_threads > 0:
+        from faceswap.pipeline import run_pipeline
+
+        stats = run_pipeline(
+            analyzer,
+            source,
+            target_paths,
+            args.output,
+            policy,
+            indices,
+            log=log,
+            decode_threads=args.io_threads,
+            encode_threads=args.io_threads,
+            queue_size=args.queue_size
+            or max(4 * args.io_threads, 2 * args.detect_batch),
+            detect_batch=args.detect_batch,
+            image_options=image_options(args),
+        )
+    else:
+        stats = run_batch(
+            analyzer,
+            source,
+            target_paths,
+            args.output,
+            policy,
+            indices,
+            log=log,
+            image_options=image_options(args),
+        )
+    print(stats.summary())
+    return 0 if stats.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import cv2
+import numpy as np
+
+# FaceAnalysis.get runs the detector on one image at a time. Here N images
+# are letterboxed to the detector input size exactly like RetinaFace.detect
+# does, stacked into one NCHW blob and sent through a single session.run().
+# The outputs are split back per image and decoded with insightface's own
+# helpers, so boxes and landmarks match the one-by-one path. insightface is
+# imported where it is used: detect_many() is imported by every command line
+# tool, which shouldn't pay for it before an analyzer is built.
+
+
+def letterbox(image, input_size):
+    # Resize keeping the aspect ratio, pad right/bottom with black
+    input_width, input_height = input_size
+    image_ratio = image.shape[0] / image.shape[1]
+    if image_ratio > input_height / input_width:
+        new_height = input_height
+        new_width = int(new_height / image_ratio)
+    else:
+        new_width = input_width
+        new_height = int(new_width * image_ratio)
+
+    det_scale = new_height / image.shape[0]
+    det_image = np.zeros((input_height, input_width, 3), dtype=np.uint8)
+    det_image[:new_height, :new_width] = cv2.resize(image, (new_width, new_height))
+    return det_image, det_scale
+
+
+class BatchFaceAnalyzer:
+    # Wraps FaceAnalysis. get() is unchanged, get_many() detects a list of
+    # images in batches of batch_size.
+    def __init__(self, analyzer, batch_size=8):
+        self.analyzer = analyzer
+        self.batch_size = batch_size
+
+        det_model = analyzer.det_model
+        batch = det_model.session.get_inputs()[0].shape[0]
+        # Exports with a fixed batch of 1 can't take stacked inputs
+        self.batched = not isinstance(batch, int) or batch != 1
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+    def get(self, img, max_num=0):
+        return self.analyzer.get(img, max_num=max_num)
+
+    def get_many(self, images, max_num=0):
+        faces = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start : start + self.batch_size]
+            for image, (bboxes, kpss) in zip(chunk, self.detect(chunk, max_num)):
+                faces.append(self._analyze(image, bboxes, kpss))
+        return faces
+
+    def _analyze(self, image, bboxes, kpss):
+        # The rest of FaceAnalysis.get: the other models, face by face
+        from insightface.app.common import Face
+
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(
+                bbox=bboxes[i, 0:4],
+                kps=kpss[i] if kpss is not None else None,
+                det_score=bboxes[i, 4],
+            )
+            for taskname, model in self.analyzer.models.items():
+                if taskname != "detection":
+                    model.get(image, face)
+            faces.append(face)
+        return faces
+
+    def detect(self, images, max_num=0, threshold=None):
+        # Returns [(bboxes, kpss), ...] like det_model.detect for each image.
+        # threshold overrides the model's det_thresh.
+        det_model = self.analyzer.det_model
+        if threshold is None and (not self.batched or len(images) == 1):
+            return [det_model.detect(image, max_num=max_num) for image in images]
+        if not self.batched and len(images) > 1:
+            return [self.detect([image], max_num, threshold)[0] for image in images]
+
+        input_size = det_model.input_size
+        letterboxed = [letterbox(image, input_size) for image in images]
+        blob = cv2.dnn.blobFromImages(
+            [det_image for det_image, _ in letterboxed],
+            1.0 / det_model.input_std,
+            input_size,
+            (det_model.input_mean,) * 3,
+            swapRB=True,
+        )
+        net_outs = det_model.session.run(
+            det_model.output_names, {det_model.input_name: blob}
+        )
+
+        results = []
+        for i, (image, (_, det_scale)) in enumerate(zip(images, letterboxed)):
+            outs = [self._image_output(out, i, len(images)) for out in net_outs]
+            results.append(
+                self._decode(
+                    outs, blob.shape[2:], det_scale, image.shape, max_num, threshold
+                )
+            )
+        return results
+
+    @staticmethod
+    def _image_output(out, index, count):
+        # Batched exports either keep the batch axis or flatten it into rows
+        if out.ndim == 3:
+            return out[index]
+        rows = out.shape[0] // count
+        return out[index * rows : (index + 1) * rows]
+
+    def _decode(
+        self, net_outs, input_shape, det_scale, image_shape, max_num, threshold=None
+    ):
+        # Same steps as RetinaFace.forward + detect, for one image
+        from insightface.model_zoo.retinaface import distance2bbox, distance2kps
+
+        det_model = self.analyzer.det_model
+        input_height, input_width = input_shape
+        fmc = det_model.fmc
+        if threshold is None:
+            threshold = det_model.det_thresh
+
+        scores_list, bboxes_list, kpss_list = [], [], []
+        for idx, stride in enumerate(det_model._feat_stride_fpn):
+            scores = net_outs[idx]
+            bbox_preds = net_outs[idx + fmc] * stride
+            anchor_centers = self._anchor_centers(
+                input_height // stride, input_width // stride, stride
+            )
+
+            pos_inds = np.where(scores >= threshold)[0]
+            bboxes = distance2bbox(anchor_centers, bbox_preds)
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(bboxes[pos_inds])
+            if det_model.use_kps:
+                kps_preds = net_outs[idx + fmc * 2] * stride
+                kpss = distance2kps(anchor_centers, kps_preds)
+                kpss = kpss.reshape((kpss.shape[0], -1, 2))
+                kpss_list.append(kpss[pos_inds])
+
+        scores = np.vstack(scores_list)
+        order = scores.ravel().argsort()[::-1]
+        bboxes = np.vstack(bboxes_list) / det_scale
+        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
+        pre_det = pre_det[order, :]
+        keep = det_model.nms(pre_det)
+        det = pre_det[keep, :]
+
+        kpss = None
+        if det_model.use_kps:
+            kpss = (np.vstack(kpss_list) / det_scale)[order][keep]
+
+        if max_num > 0 and det.shape[0] > max_num:
+            # Large faces near the center first, like detect(metric="default")
+            area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
+            center_y, center_x = image_shape[0] // 2, image_shape[1] // 2
+            offsets = np.vstack(
+                [
+                    (det[:, 0] + det[:, 2]) / 2 - center_x,
+                    (det[:, 1] + det[:, 3]) / 2 - center_y,
+                ]
+            )
+            values = area - np.sum(np.power(offsets, 2.0), 0) * 2.0
+            bindex = np.argsort(values)[::-1][:max_num]
+            det = det[bindex]
+            if kpss is not None:
+                kpss = kpss[bindex]
+        return det, kpss
+
+    def _anchor_centers(self, height, width, stride):
+        det_model = self.analyzer.det_model
+        key = (height, width, stride)
+        if key in det_model.center_cache:
+            return det_model.center_cache[key]
+
+        centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1)
+        centers = (centers.astype(np.float32) * stride).reshape((-1, 2))
+        if det_model._num_anchors > 1:
+            centers = np.stack([centers] * det_model._num_anchors, axis=1)
+            centers = centers.reshape((-1, 2))
+        if len(det_model.center_cache) < 100:
+            det_model.center_cache[key] = centers
+        return centers
+
+
+def detect_many(analyzer, images, max_num=0):
+    # Batched when the analyzer supports it, one by one otherwise
+    get_many = getattr(analyzer, "get_many", None)
+    if get_many is not None:
+        return get_many(images, max_num=max_num)
+    return [analyzer.get(image, max_num=max_num) for image in images]
@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from faceswap.metrics import metrics, timed
+
+# Blurred ellipse masks are built once per face size and reused, instead of
+# drawing and blurring a new mask for every face. Masks aren't resized from a
+# nearby size: the blur is a fixed 19 pixels, so a resized mask moves the
+# ellipse edge by the size difference, which shows as a seam on large faces.
+# Sizes repeat in video and the GUI, where the cache pays off. It holds at
+# most MASK_CACHE_BYTES of masks; least recently used ones are dropped
+# first. Masks are single channel float32 and blendLinear applies them to
+# all three channels, writing straight into the result image without
+# float64 temporaries.
+#
+# Color matching moves the face's LAB mean and standard deviation onto the
+# target's, per channel (Reinhard et al. color transfer). Both regions are
+# sampled on a grid of at most COLOR_STATS_SIZE points a side, so measuring
+# costs the same for any face size. The transfer is worked out on the face
+# samples (LAB, a lookup table per channel, back to BGR) and fitted with one
+# 3x4 BGR matrix, which cv2.transform applies to the whole face in a single
+# pass instead of two full size LAB conversions.
+
+MASK_CACHE_BYTES = 64 * 2**20
+
+COLOR_STATS_SIZE = 32
+MIN_COLOR_SAMPLES = 16
+
+# Limits on the per channel contrast change, so a flat region (a face in
+# shadow, a blown out highlight) can't stretch the face's colors to noise
+MIN_COLOR_GAIN = 0.5
+MAX_COLOR_GAIN = 2.0
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+# (width, height) -> (mask, 1 - mask), least recently used first
+_masks = OrderedDict()
+_masks_lock = threading.Lock()
+_mask_stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+
+def draw_ellipse_weights(width, height):
+    # (mask, 1 - mask) for a width x height face, drawn and blurred. The
+    # "mask" timer counts masks actually built.
+    with timed("mask"):
+        mask = np.zeros((height, width), dtype=np.uint8)
+        center = (width // 2, height // 2)
+        axes = (
+            max(1, width // 2 - 5),
+            max(1, height // 2 - 5),
+        )  # Slightly smaller than face
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)  # type: ignore
+
+        # Blur the mask for smoother blending
+        mask = cv2.GaussianBlur(mask, (19, 19), 11)
+        mask = mask.astype(np.float32) / 255.0
+
+    return _read_only(mask), _read_only(1.0 - mask)
+
+
+def ellipse_weights(width, height):
+    # Returns read-only (mask, 1 - mask) for a width x height face
+    key = (int(width), int(height))
+    with _masks_lock:
+        weights = _masks.get(key)
+        if weights is not None:
+            _masks.move_to_end(key)
+            _mask_stats["hits"] += 1
+            return weights
+        _mask_stats["misses"] += 1
+
+    weights = draw_ellipse_weights(*key)
+    with _masks_lock:
+        if key not in _masks:
+            _masks[key] = weights
+            _mask_stats["bytes"] += 2 * weights[0].nbytes
+            while _mask_stats["bytes"] > MASK_CACHE_BYTES and len(_masks) > 1:
+                _, (mask, _) = _masks.popitem(last=False)
+                _mask_stats["bytes"] -= 2 * mask.nbytes
+    return weights
+
+
+def clear_mask_cache():
+    with _masks_lock:
+        _masks.clear()
+        _mask_stats.update(hits=0, misses=0, bytes=0)
+
+
+def _mask_cache_counters():
+    with _masks_lock:
+        return {
+            "mask_cache_hits": _mask_stats["hits"],
+            "mask_cache_misses": _mask_stats["misses"],
+            "mask_cache_bytes": _mask_stats["bytes"],
+        }
+
+
+metrics.add_collector(_mask_cache_counters, gauges=["mask_cache_bytes"])
+
+
+def color_table(source_stats, target_stats):
+    # 256 x 1 x 3 lookup table moving each 8 bit LAB channel from the source
+    # statistics to the target's
+    source_mean, source_std = source_stats
+    target_mean, target_std = target_stats
+    gain = np.clip(
+        target_std / np.maximum(source_std, 1.0), MIN_COLOR_GAIN, MAX_COLOR_GAIN
+    )
+    values = np.arange(256, dtype=np.float64)[:, None]
+    table = (values - source_mean) * gain + target_mean
+    return np.clip(np.rint(table), 0, 255).astype(np.uint8).reshape(256, 1, 3)
+
+
+def color_matrix(face, region, mask):
+    # 3x4 BGR matrix recoloring face to the LAB statistics of region, both
+    # measured where mask > 0.5; None without enough samples there
+    height, width = face.shape[:2]
+    scale = min(1.0, COLOR_STATS_SIZE / max(width, height))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    face = cv2.resize(face, size, interpolation=cv2.INTER_NEAREST)
+    region = cv2.resize(region, size, interpolation=cv2.INTER_NEAREST)
+    inside = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST) > 0.5
+    if np.count_nonzero(inside) < MIN_COLOR_SAMPLES:
+        return None
+
+    face_lab = cv2.cvtColor(face, cv2.COLOR_BGR2LAB)
+    region_lab = cv2.cvtColor(region, cv2.COLOR_BGR2LAB)
+    stats = [
+        tuple(v.ravel() for v in cv2.meanStdDev(lab, mask=inside.view(np.uint8)))
+        for lab in (face_lab, region_lab)
+    ]
+    corrected = cv2.cvtColor(cv2.LUT(face_lab, color_table(*stats)), cv2.COLOR_LAB2BGR)
+
+    samples = face[inside].astype(np.float64)
+    samples = np.hstack([samples, np.ones((len(samples), 1))])
+    fit, _, _, _ = np.linalg.lstsq(samples, corrected[inside], rcond=None)
+    return fit.T.astype(np.float32)
+
+
+def match_color(face, region, mask):
+    # face recolored to match the part of region that mask covers
+    with timed("color"):
+        matrix = color_matrix(face, region, mask)
+        if matrix is None:
+            return face
+        return cv2.transform(face, matrix)
+
+
+def blend_into(region, face, mask, inverse, color_match=False):
+    # region = face * mask + region * (1 - mask), computed in place. With
+    # color_match the face first takes on the colors of the region it covers.
+    if color_match:
+        face = match_color(face, region, mask)
+    with timed("blend"):
+        blended = cv2.blendLinear(face, region, mask, inverse, dst=region)
+        if blended is not region:
+            region[...] = blended
+    return region
@@ -0,0 +1,428 @@
+import threading
+
+import cv2
+
+from faceswap.blending import blend_into, ellipse_weights
+
+DEFAULT_MODEL_PACK = "buffalo_l"
+DEFAULT_DET_SIZE = (640, 640)
+
+# det_size="auto" picks the detector input per image: the smallest of
+# AUTO_DET_SIZES up to 640 the image fits into without shrinking, or 640. A
+# thumbnail isn't blown up to 640x640, and a camera photo costs no more than
+# the fixed default. "auto:1280" goes up to 1280 instead, which keeps more
+# small faces in large photos at about 4x the detector work. All sizes share
+# the loaded models.
+DET_SIZE_AUTO = "auto"
+AUTO_DET_SIZES = (320, 480, 640, 960, 1280)
+
+# Swap backends, see faceswap/backends.py
+MODE_BBOX = "bbox"
+MODE_ALIGNED = "aligned"
+MODE_SEAMLESS = "seamless"
+MODE_INSWAPPER = "inswapper"
+SWAP_MODES = (MODE_BBOX, MODE_ALIGNED, MODE_SEAMLESS, MODE_INSWAPPER)
+
+SELECT_ALL = "all"
+SELECT_LARGEST = "largest"
+SELECT_INDICES = "indices"
+
+# Source to target assignment by embedding similarity, see parse_mapping
+MAP_MATCH = "match"
+
+# Named settings for the command line tools; options given explicitly win.
+# buffalo_s has a smaller detector and recognition model than buffalo_l.
+PRESETS = {
+    "fast": {"model_pack": "buffalo_s", "det_size": 320, "mode": MODE_BBOX},
+    "balanced": {
+        "model_pack": DEFAULT_MODEL_PACK,
+        "det_size": DET_SIZE_AUTO,
+        "mode": MODE_ALIGNED,
+    },
+    "accurate": {
+        "model_pack": DEFAULT_MODEL_PACK,
+        "det_size": f"{DET_SIZE_AUTO}:{AUTO_DET_SIZES[-1]}",
+        "mode": MODE_ALIGNED,
+        "tiled": True,
+        "color_match": True,
+    },
+}
+
+
+def parse_det_size(value):
+    # --det-size: a number of pixels, "auto" or "auto:<largest size>"
+    value = value.strip().lower()
+    if value == DET_SIZE_AUTO:
+        return DET_SIZE_AUTO
+    auto = value.startswith(DET_SIZE_AUTO + ":")
+    if auto:
+        value = value[len(DET_SIZE_AUTO) + 1 :]
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid detector size: {value!r}")
+    if size <= 0 or size % 32:
+        raise ValueError(f"Detector size must be a positive multiple of 32: {size}")
+    return f"{DET_SIZE_AUTO}:{size}" if auto else size
+
+
+def is_auto_det_size(size):
+    return isinstance(size, str) and size.startswith(DET_SIZE_AUTO)
+
+
+def auto_det_sizes(size=DET_SIZE_AUTO):
+    # The sizes an "auto" or "auto:N" det_size picks from
+    _, _, largest = size.partition(":")
+    largest = int(largest) if largest else DEFAULT_DET_SIZE[0]
+    return tuple(s for s in AUTO_DET_SIZES if s < largest) + (largest,)
+
+
+def det_size_option(size):
+    # create_face_analyzer's det_size for a parse_det_size() value
+    return size if is_auto_det_size(size) else (size, size)
+
+
+def auto_det_size(shape, sizes=None):
+    sizes = sizes or auto_det_sizes()
+    longest = max(shape[:2])
+    for size in sizes:
+        if size >= longest:
+            return size
+    return sizes[-1]
+
+
+def create_face_analyzer(
+    name=DEFAULT_MODEL_PACK,
+    det_size=DEFAULT_DET_SIZE,
+    ctx_id=0,
+    intra_op_threads=None,
+    cache_path=None,
+    cache_bytes=None,
+    detect_batch=1,
+    allowed_modules=None,
+    tiled=False,
+    **kwargs,
+):
+    # insightface and onnxruntime take seconds to import, so they are only
+    # loaded once an analyzer is actually built
+    from faceswap.models import SelectiveFaceAnalysis, session_options
+
+    analyzer = SelectiveFaceAnalysis(
+        name,
+        allowed_modules=allowed_modules,
+        sess_options=session_options(intra_op_threads),
+        **kwargs,
+    )
+    cache = None
+    if cache_path:
+        from faceswap.detection_cache import DEFAULT_CACHE_BYTES, DetectionCache
+
+        cache = DetectionCache(cache_path, cache_bytes or DEFAULT_CACHE_BYTES)
+
+    wrap_options = {"cache": cache, "detect_batch": detect_batch, "tiled": tiled}
+    if is_auto_det_size(det_size):
+        analyzer.prepare(ctx_id=ctx_id, det_size=DEFAULT_DET_SIZE)
+        sizes = auto_det_sizes(det_size)
+        return AutoSizeFaceAnalyzer(analyzer, sizes=sizes, **wrap_options)
+
+    analyzer.prepare(ctx_id=ctx_id, det_size=det_size)
+    return wrap_analyzer(analyzer, **wrap_options)
+
+
+def wrap_analyzer(analyzer, cache=None, detect_batch=1, tiled=False):
+    # The batching, tiling and caching layers around a prepared analyzer.
+    # cache is a DetectionCache, shared by every analyzer built from the
+    # same models.
+    if detect_batch > 1:
+        from faceswap.batch_detection import BatchFaceAnalyzer
+
+        analyzer = BatchFaceAnalyzer(analyzer, batch_size=detect_batch)
+
+    if tiled:
+        from faceswap.tiled_detection import TiledFaceAnalyzer
+
+        analyzer = TiledFaceAnalyzer(analyzer, batch_size=max(detect_batch, 8))
+
+    if cache is not None:
+        from faceswap.detection_cache import CachedFaceAnalyzer
+
+        analyzer = CachedFaceAnalyzer(analyzer, cache)
+
+    return analyzer
+
+
+class AutoSizeFaceAnalyzer:
+    # Detects each image at auto_det_size() of its dimensions. There is one
+    # prepared analyzer per size, built on first use around the same loaded
+    # models and detection cache, so changing sizes never loads a model
+    # again.
+    def __init__(self, analyzer, sizes=None, **wrap_options):
+        self.analyzer = analyzer
+        self.sizes = sizes or auto_det_sizes()
+        self.wrap_options = wrap_options
+        self._sized = {}
+        self._lock = threading.Lock()
+
+    def for_size(self, size):
+        from faceswap.models import SizedFaceAnalysis
+
+        with self._lock:
+            if size not in self._sized:
+                sized = SizedFaceAnalysis(self.analyzer, (size, size))
+                self._sized[size] = wrap_analyzer(sized, **self.wrap_options)
+            return self._sized[size]
+
+    def for_image(self, img):
+        return self.for_size(auto_det_size(img.shape, self.sizes))
+
+    def get(self, img, max_num=0):
+        return self.for_image(img).get(img, max_num=max_num)
+
+    def get_many(self, images, max_num=0):
+        # Batched per size, returned in input order
+        from faceswap.batch_detection import detect_many
+
+        by_size = {}
+        for i, image in enumerate(images):
+            size = auto_det_size(image.shape, self.sizes)
+            by_size.setdefault(size, []).append(i)
+
+        faces = [None] * len(images)
+        for size, indices in by_size.items():
+            detected = detect_many(
+                self.for_size(size), [images[i] for i in indices], max_num
+            )
+            for i, image_faces in zip(indices, detected):
+                faces[i] = image_faces
+        return faces
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+
+class LazyFaceAnalyzer:
+    # Builds the analyzer on first use, or ahead of time on a background
+    # thread after start(). Safe to call from several threads.
+    def __init__(self, **options):
+        self.options = options
+        self.error = None
+        self._analyzer = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    @property
+    def ready(self):
+        # True once loading finished, successfully or with self.error set
+        return self._loaded.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and not self._loaded.is_set():
+                self._thread = threading.Thread(target=self._load_quietly, daemon=True)
+                self._thread.start()
+
+    def _load_quietly(self):
+        try:
+            self.load()
+        except Exception:
+            pass  # kept in self.error and raised again by the next load()
+
+    def load(self):
+        with self._lock:
+            if self._analyzer is None:
+                try:
+                    self._analyzer = create_face_analyzer(**self.options)
+                    self.error = None
+                except Exception as e:
+                    self.error = e
+                    raise
+                finally:
+                    self._loaded.set()
+            return self._analyzer
+
+    def get(self, img, max_num=0):
+        return self.load().get(img, max_num=max_num)
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+def parse_selection(spec):
+    # "all", "largest" or a comma separated list of 1-based face numbers
+    # (the same numbers the GUI draws above each face)
+    spec = spec.strip().lower()
+    if spec in (SELECT_ALL, SELECT_LARGEST):
+        return spec, []
+
+    try:
+        indices = [int(part) - 1 for part in spec.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid face selection: {spec!r}")
+
+    if not indices or min(indices) < 0:
+        raise ValueError(f"Invalid face selection: {spec!r}")
+
+    return SELECT_INDICES, indices
+
+
+def parse_mapping(spec):
+    # "match" or comma separated 1-based "source:target" pairs like "1:2,2:1",
+    # returned as 0-based (source index, target index) pairs
+    spec = spec.strip().lower()
+    if spec == MAP_MATCH:
+        return MAP_MATCH
+
+    try:
+        pairs = []
+        for part in spec.split(","):
+            if part.strip():
+                source, target = part.split(":")
+                pairs.append((int(source) - 1, int(target) - 1))
+    except ValueError:
+        raise ValueError(f"Invalid face mapping: {spec!r}")
+
+    if not pairs or min(min(pair) for pair in pairs) < 0:
+        raise ValueError(f"Invalid face mapping: {spec!r}")
+
+    return pairs
+
+
+def unique_pairs(pairs):
+    # (source index, target index) pairs with one source per target face: a
+    # target listed more than once takes the source of its last pair
+    assigned = {target: source for source, target in pairs}
+    return [(source, target) for target, source in assigned.items()]
+
+
+def face_area(face):
+    x1, y1, x2, y2 = face.bbox[:4]
+    return max(0.0, x2 - x1) * max(0.0, y2 - y1)
+
+
+def select_faces(faces, policy=SELECT_ALL, indices=None):
+    if not faces:
+        return []
+
+    if not isinstance(policy, str):
+        # Policy objects, e.g. faceswap.identity.IdentityMatcher
+        return policy.select(faces)
+
+    if policy == SELECT_ALL:
+        return list(range(len(faces)))
+
+    if policy == SELECT_LARGEST:
+        return [max(range(len(faces)), key=lambda i: face_area(faces[i]))]
+
+    if policy == SELECT_INDICES:
+        return [i for i in indices or [] if i < len(faces)]
+
+    raise ValueError(f"Unknown face selection policy: {policy!r}")
+
+
+def clip_bbox(bbox, shape):
+    # Detector boxes may extend past the image border
+    height, width = shape[:2]
+    x1, y1, x2, y2 = bbox.astype(int)[:4]
+    return max(0, x1), max(0, y1), min(width, x2), min(height, y2)
+
+
+def swap_face(result_image, source_image, source_face, target_face, color_match=False):
+    # Blend source_face into target_face's region of result_image in place
+    sx1, sy1, sx2, sy2 = clip_bbox(source_face.bbox, source_image.shape)
+    dst_bbox = target_face.bbox.astype(int)
+
+    # Calculate dimensions for target face
+    dst_width = dst_bbox[2] - dst_bbox[0]
+    dst_height = dst_bbox[3] - dst_bbox[1]
+
+    if sx2 <= sx1 or sy2 <= sy1 or dst_width <= 0 or dst_height <= 0:
+        return False
+
+    # Extract source face and resize it to match target face dimensions
+    src_face = source_image[sy1:sy2, sx1:sx2]
+    src_face_resized = cv2.resize(src_face, (dst_width, dst_height))
+
+    # Blurred elliptical mask, cached per size
+    mask, inverse = ellipse_weights(dst_width, dst_height)
+
+    # Only the part of the target box that lies inside the image is blended
+    x1, y1, x2, y2 = clip_bbox(dst_bbox, result_image.shape)
+    if x2 <= x1 or y2 <= y1:
+        return False
+
+    crop = (
+        slice(y1 - dst_bbox[1], y2 - dst_bbox[1]),
+        slice(x1 - dst_bbox[0], x2 - dst_bbox[0]),
+    )
+
+    # Blend the faces directly into the result image
+    blend_into(
+        result_image[y1:y2, x1:x2],
+        src_face_resized[crop],
+        mask[crop],
+        inverse[crop],
+        color_match,
+    )
+    return True
+
+
+def swap_faces_into(
+    result_image,
+    source_image,
+    source_face,
+    target_faces,
+    indices,
+    mode=MODE_BBOX,
+    **backend_options,
+):
+    # Swap in place with the chosen backend and return how many faces were
+    # replaced
+    from faceswap.backends import get_backend
+
+    backend = get_backend(mode, **backend_options)
+    return backend.swap_into(
+        result_image, source_image, source_face, target_faces, indices
+    )
+
+
+def swap_face_pairs_into(
+    result_image,
+    source_image,
+    source_faces,
+    target_faces,
+    pairs,
+    mode=MODE_BBOX,
+    **backend_options,
+):
+    # Many-to-many: (source index, target index) pairs, all applied in place
+    # in one pass over result_image
+    from faceswap.backends import get_backend
+
+    backend = get_backend(mode, **backend_options)
+    return backend.swap_pairs_into(
+        result_image, source_image, source_faces, target_faces, pairs
+    )
+
+
+def swap_faces(
+    source_image,
+    source_face,
+    target_image,
+    target_faces,
+    indices,
+    mode=MODE_BBOX,
+    **backend_options,
+):
+    # Create a copy of target image for the result
+    result_image = target_image.copy()
+    swap_faces_into(
+        result_image,
+        source_image,
+        source_face,
+        target_faces,
+        indices,
+        mode,
+        **backend_options,
+    )
+    return result_image
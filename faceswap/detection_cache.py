@@ -0,0 +1,241 @@
+import atexit
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from faceswap.metrics import metrics
+
+DEFAULT_CACHE_PATH = os.path.join("~", ".cache", "faceswap", "detections.sqlite3")
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+# Hits whose last_used update is written in one transaction
+TOUCH_BATCH = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    key TEXT PRIMARY KEY,
+    faces BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM detections;
+"""
+
+
+def image_key(image, *settings):
+    # Content address: the pixel buffer plus everything that changes the result
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((image.shape, image.dtype.str) + settings).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def pack_faces(faces):
+    # One .npy entry per face attribute, e.g. "0/bbox", "0/kps", "0/embedding"
+    arrays = {"count": np.array(len(faces))}
+    for i, face in enumerate(faces):
+        for name, value in face.items():
+            if value is not None:
+                arrays[f"{i}/{name}"] = np.asarray(value)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def unpack_faces(blob):
+    from insightface.app.common import Face
+
+    with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+        fields = [{} for _ in range(int(arrays["count"]))]
+        for entry in arrays.files:
+            if entry == "count":
+                continue
+            i, name = entry.split("/", 1)
+            value = arrays[entry]
+            # 0-d arrays were scalars such as det_score or age
+            fields[int(i)][name] = value[()] if value.ndim == 0 else value
+
+    return [Face(**face) for face in fields]
+
+
+class DetectionCache:
+    # LRU store of detection results in SQLite, capped at max_bytes. Safe to
+    # share between threads, and between processes through the database file.
+    #
+    # The byte total lives in the one-row totals table, so a put only touches
+    # the oldest rows (through the last_used index) when it goes over the
+    # cap. Hits update last_used TOUCH_BATCH at a time; pending updates are
+    # written before any eviction and on close.
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_BYTES):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched = {}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A lost last commit after a power cut only costs a detection
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(SCHEMA)
+        metrics.add_collector(self.counters)
+        atexit.register(self.close)
+
+    def counters(self):
+        return {
+            "detection_cache_hits": self.hits,
+            "detection_cache_misses": self.misses,
+        }
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT faces FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                with self._db:
+                    self._touch()
+
+        return unpack_faces(row[0])
+
+    def put(self, key, faces):
+        blob = pack_faces(faces)
+        with self._lock, self._db:
+            self._touch()
+            # The UPDATE starts the write transaction, so the replaced row's
+            # size can't change before the INSERT
+            self._db.execute(
+                """
+                UPDATE totals SET bytes = bytes + ? - COALESCE(
+                    (SELECT size FROM detections WHERE key = ?), 0
+                )
+                """,
+                (len(blob), key),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self._evict()
+
+    def _touch(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE detections SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched = {}
+
+    def _evict(self):
+        # Drop least recently used entries until the total fits the cap
+        (total,) = self._db.execute("SELECT bytes FROM totals").fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        keys, freed = [], 0
+        rows = self._db.execute("SELECT key, size FROM detections ORDER BY last_used")
+        for key, size in rows:
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        rows.close()
+
+        self._db.executemany("DELETE FROM detections WHERE key = ?", keys)
+        self._db.execute("UPDATE totals SET bytes = bytes - ?", (freed,))
+
+    def size(self):
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM detections").fetchone()
+            (total,) = self._db.execute("SELECT bytes FROM totals").fetchone()
+        return count, total
+
+    def clear(self):
+        with self._lock, self._db:
+            self._touched = {}
+            self._db.execute("DELETE FROM detections")
+            self._db.execute("UPDATE totals SET bytes = 0")
+
+    def close(self):
+        with self._lock:
+            try:
+                with self._db:
+                    self._touch()
+            except sqlite3.ProgrammingError:
+                # Already closed
+                pass
+            self._db.close()
+
+
+class CachedFaceAnalyzer:
+    # Drop-in wrapper around FaceAnalysis: get() only runs the detector for
+    # images it hasn't seen with the same model pack and settings
+    def __init__(self, analyzer, cache):
+        self.analyzer = analyzer
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+    def settings(self):
+        settings = (
+            os.path.basename(self.analyzer.model_dir),
+            tuple(sorted(self.analyzer.models)),
+            tuple(self.analyzer.det_size),
+            float(self.analyzer.det_thresh),
+        )
+        # Tiled detection finds more faces in the same image
+        tiling = getattr(self.analyzer, "tiling", None)
+        if tiling is not None:
+            settings += (tiling,)
+        return settings
+
+    def get(self, img, max_num=0):
+        key = image_key(img, max_num, *self.settings())
+        faces = self.cache.get(key)
+        if faces is None:
+            faces = self.analyzer.get(img, max_num=max_num)
+            self.cache.put(key, faces)
+        return faces
+
+    def get_many(self, images, max_num=0):
+        # Only the images missing from the cache go to the detector, batched
+        # if the wrapped analyzer supports it
+        from faceswap.batch_detection import detect_many
+
+        settings = self.settings()
+        keys = [image_key(image, max_num, *settings) for image in images]
+        results = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, faces in enumerate(results) if faces is None]
+        if missing:
+            detected = detect_many(
+                self.analyzer, [images[i] for i in missing], max_num=max_num
+            )
+            for i, faces in zip(missing, detected):
+                self.cache.put(keys[i], faces)
+                results[i] = faces
+        return results
@@ -0,0 +1,221 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from faceswap.core import DEFAULT_MODEL_PACK, create_face_analyzer, face_area
+from faceswap.image_io import load_image
+
+# Selecting faces by who they are. insightface's recognition model gives every
+# face a unit length embedding, so cosine similarity is a dot product: all
+# faces of an image are compared against every reference identity with one
+# (faces x dim) @ (dim x identities) matmul, which stays fast for thousands
+# of identities.
+#
+#     python -m faceswap.identity refs/ -o refs.npz
+#     python -m faceswap.batch --source me.jpg photos/ -o out/ --match refs.npz
+
+# Cosine similarity above which two buffalo_l embeddings are the same person
+DEFAULT_MATCH_THRESHOLD = 0.4
+
+
+def normed_embedding(face):
+    embedding = getattr(face, "normed_embedding", None)
+    if embedding is None:
+        raise ValueError(
+            "Face has no embedding; the recognition model has to be loaded"
+        )
+    return embedding
+
+
+class IdentityIndex:
+    # Reference embeddings as rows of one float32 matrix, one name per row.
+    # Several rows may share a name (e.g. photos from different years).
+    def __init__(self, dim=512, capacity=64):
+        self.names = []
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def matrix(self):
+        return self._matrix[: len(self.names)]
+
+    def add(self, name, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        if embedding.shape[0] != self._matrix.shape[1]:
+            raise ValueError(
+                f"Embedding size {embedding.shape[0]} does not match the index "
+                f"({self._matrix.shape[1]})"
+            )
+
+        # Grow by doubling so adding n identities copies O(n) rows in total
+        if len(self.names) == self._matrix.shape[0]:
+            rows, dim = self._matrix.shape
+            grown = np.zeros((2 * rows, dim), dtype=np.float32)
+            grown[: len(self.names)] = self._matrix
+            self._matrix = grown
+
+        self._matrix[len(self.names)] = embedding / np.linalg.norm(embedding)
+        self.names.append(name)
+
+    def add_face(self, name, face):
+        self.add(name, normed_embedding(face))
+
+    def search(self, embeddings):
+        # Best reference row and its cosine similarity for each embedding
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(
+            -1, self._matrix.shape[1]
+        )
+        if not self.names or not len(embeddings):
+            count = len(embeddings)
+            return np.full(count, -1), np.full(count, -1.0, dtype=np.float32)
+
+        scores = embeddings @ self.matrix.T
+        best = scores.argmax(axis=1)
+        return best, scores[np.arange(len(best)), best]
+
+    def match(self, faces, threshold=DEFAULT_MATCH_THRESHOLD):
+        # [(face index, name, similarity)] for faces that match any identity
+        if not faces:
+            return []
+        embeddings = np.stack([normed_embedding(face) for face in faces])
+        best, scores = self.search(embeddings)
+        return [
+            (i, self.names[best[i]], float(scores[i]))
+            for i in range(len(faces))
+            if best[i] >= 0 and scores[i] >= threshold
+        ]
+
+    def save(self, path):
+        np.savez(path, names=np.array(self.names, dtype=str), matrix=self.matrix)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            matrix = data["matrix"].astype(np.float32)
+            names = [str(name) for name in data["names"]]
+
+        index = cls(dim=matrix.shape[1], capacity=max(1, len(names)))
+        index._matrix[: len(names)] = matrix
+        index.names = names
+        return index
+
+
+class IdentityMatcher:
+    # Face selection policy for select_faces: every face that matches one of
+    # the reference identities, optionally limited to some names
+    def __init__(self, index, threshold=DEFAULT_MATCH_THRESHOLD, names=None):
+        self.index = index
+        self.threshold = threshold
+        self.names = set(names) if names else None
+
+    def select(self, faces):
+        return [
+            i
+            for i, name, _ in self.index.match(faces, self.threshold)
+            if self.names is None or name in self.names
+        ]
+
+
+def match_pairs(
+    source_faces, target_faces, indices=None, threshold=DEFAULT_MATCH_THRESHOLD
+):
+    # (source index, target index) for each target face that looks like one
+    # of the source faces, paired with the most similar one
+    if indices is None:
+        indices = range(len(target_faces))
+    index = IdentityIndex()
+    for i, face in enumerate(source_faces):
+        index.add_face(i, face)
+
+    targets = [target_faces[i] for i in indices]
+    return [
+        (source_index, indices[i])
+        for i, source_index, _ in index.match(targets, threshold)
+    ]
+
+
+def reference_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def build_index(analyzer, named_paths):
+    # named_paths are (name, image path) pairs; the largest face of each
+    # image is added under its name
+    index = IdentityIndex()
+    for name, path in named_paths:
+        image, _ = load_image(path)
+        if image is None:
+            raise ValueError(f"Could not read reference image: {path}")
+
+        faces = analyzer.get(image)
+        if not faces:
+            raise ValueError(f"No face detected in reference image: {path}")
+        index.add_face(name, max(faces, key=face_area))
+    return index
+
+
+def load_matcher(spec, threshold=DEFAULT_MATCH_THRESHOLD, analyzer=None):
+    # spec is a saved index (.npz) or a reference image; images need an
+    # analyzer with the recognition model
+    if spec.lower().endswith(".npz"):
+        return IdentityMatcher(IdentityIndex.load(spec), threshold)
+    index = build_index(analyzer, [(reference_name(spec), spec)])
+    return IdentityMatcher(index, threshold)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Build an identity index from reference face images."
+    )
+    parser.add_argument(
+        "references",
+        nargs="+",
+        help="Reference directory, glob pattern, or @file listing one path per "
+        "line. Images are named after their file, or after their directory "
+        "for refs/<name>/ subdirectories.",
+    )
+    parser.add_argument("-o", "--output", required=True, help="Index file (.npz)")
+    parser.add_argument(
+        "--model-pack", default=DEFAULT_MODEL_PACK, help="InsightFace model pack"
+    )
+    return parser
+
+
+def main(argv=None):
+    from faceswap.batch import iter_target_paths
+
+    args = build_parser().parse_args(argv)
+    named_paths = []
+    for spec in args.references:
+        if os.path.isdir(spec):
+            # refs/<name>/*.jpg are all stored under <name>
+            for name in sorted(os.listdir(spec)):
+                if os.path.isdir(os.path.join(spec, name)):
+                    named_paths.extend(
+                        (name, path)
+                        for path in iter_target_paths([os.path.join(spec, name)])
+                    )
+        named_paths.extend(
+            (reference_name(path), path) for path in iter_target_paths([spec])
+        )
+
+    analyzer = create_face_analyzer(
+        name=args.model_pack, allowed_modules=["detection", "recognition"]
+    )
+    try:
+        index = build_index(analyzer, named_paths)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    index.save(args.output)
+    print(f"Indexed {len(index)} faces of {len(set(index.names))} identities")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
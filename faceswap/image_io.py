@@ -0,0 +1,180 @@
+import io
+
+import cv2
+import numpy as np
+
+from faceswap.metrics import timed
+
+# Reading and writing images, in BGR like the rest of the package.
+#
+# The JPEG header is read first (through PIL, which only parses the header at
+# that point) for the size and the EXIF orientation. When the caller needs
+# less than full resolution, libjpeg decodes straight to 1/2, 1/4 or 1/8 scale
+# (IMREAD_REDUCED_*), which skips most of the IDCT work and never allocates
+# the full size image. OpenCV only honours EXIF orientation for some formats
+# and decode flags, so it is always told to ignore it and the rotation is
+# applied here instead, the same way for every format. TIFFs are the
+# exception: OpenCV's TIFF decoder applies orientations 2-4 regardless and
+# fails on 5-8, so oriented TIFFs are decoded by PIL, which returns them
+# upright.
+
+REDUCTIONS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+EXIF_ORIENTATION = 0x0112
+
+
+def image_header(source):
+    # (width, height, format, EXIF orientation) from a path or encoded bytes,
+    # or None when PIL can't parse it
+    from PIL import Image
+
+    try:
+        with Image.open(
+            io.BytesIO(source) if isinstance(source, bytes) else source
+        ) as image:
+            orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+            return image.width, image.height, image.format, orientation
+    except Exception:
+        return None
+
+
+def apply_orientation(image, orientation):
+    # EXIF orientations 2-8 as flips and 90 degree rotations
+    if orientation in (2, 4, 5, 7):
+        image = cv2.flip(image, 1 if orientation == 2 else 0)
+    if orientation == 3:
+        image = cv2.rotate(image, cv2.ROTATE_180)
+    elif orientation in (5, 6):
+        image = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    elif orientation in (7, 8):
+        image = cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def decode_upright_tiff(source):
+    # BGR image of a TIFF with its Orientation tag applied, or None
+    from PIL import Image
+
+    try:
+        with Image.open(
+            io.BytesIO(source) if isinstance(source, bytes) else source
+        ) as image:
+            rgb = np.asarray(image.convert("RGB"))
+    except Exception:
+        return None
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def reduction_for(width, height, min_size):
+    # Largest JPEG scale denominator that keeps the longer side >= min_size
+    for factor, flag in REDUCTIONS:
+        if max(width, height) // factor >= min_size:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def load_image(source, min_size=None):
+    # Returns (image, scale) for a path or encoded bytes. With min_size, JPEGs
+    # are decoded at reduced scale as long as the longer side stays at least
+    # min_size; scale is decoded size / full size, for mapping coordinates.
+    header = image_header(source)
+    if header is not None and header[2] == "TIFF" and header[3] != 1:
+        with timed("read"):
+            return decode_upright_tiff(source), 1.0
+
+    factor, flag = 1, cv2.IMREAD_COLOR
+    if min_size and header is not None and header[2] == "JPEG":
+        factor, flag = reduction_for(header[0], header[1], min_size)
+
+    flag |= cv2.IMREAD_IGNORE_ORIENTATION
+    with timed("read"):
+        if isinstance(source, bytes):
+            image = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flag)
+        else:
+            image = cv2.imread(source, flag)
+    if image is None:
+        return None, 1.0
+
+    if header is not None and header[3] != 1:
+        image = apply_orientation(image, header[3])
+    return image, 1.0 / factor
+
+
+def fit_size(image, max_size):
+    # Downscaled so the longer side is at most max_size
+    height, width = image.shape[:2]
+    if not max_size or max(width, height) <= max_size:
+        return image
+    scale = max_size / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def read_image(source, max_size=None):
+    # Full resolution, or at most max_size on the longer side: decoded at the
+    # smallest JPEG scale that is still larger, then resized
+    image, _ = load_image(source, max_size)
+    if image is None:
+        name = source if isinstance(source, str) else "<bytes>"
+        raise ValueError(f"Could not read image: {name}")
+    return fit_size(image, max_size)
+
+
+def encode_params(
+    extension, jpeg_quality=None, png_compression=None, webp_quality=None
+):
+    # cv2.imwrite/imencode parameters for the format; None keeps OpenCV's
+    # default (JPEG 95, PNG 1, WebP 100 = lossless)
+    extension = extension.lower().lstrip(".")
+    if extension in ("jpg", "jpeg", "jpe") and jpeg_quality is not None:
+        return [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+    if extension == "png" and png_compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    if extension == "webp" and webp_quality is not None:
+        return [cv2.IMWRITE_WEBP_QUALITY, int(webp_quality)]
+    return []
+
+
+def encode_image(image, extension, **encode_options):
+    params = encode_params(extension, **encode_options)
+    with timed("encode"):
+        ok, encoded = cv2.imencode("." + extension.lower().lstrip("."), image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {extension}")
+    return encoded.tobytes()
+
+
+def write_image(path, image, **encode_options):
+    params = encode_params(path.rsplit(".", 1)[-1], **encode_options)
+    with timed("write"):
+        written = cv2.imwrite(path, image, params)
+    if not written:
+        raise ValueError(f"Could not write image: {path}")
+
+
+def add_encode_arguments(parser):
+    parser.add_argument(
+        "--jpeg-quality", type=int, help="JPEG quality 0-100 (default 95)"
+    )
+    parser.add_argument(
+        "--png-compression",
+        type=int,
+        help="PNG compression level 0-9; lower is faster and larger (default 1)",
+    )
+    parser.add_argument(
+        "--webp-quality",
+        type=int,
+        help="WebP quality 1-100, 100 is lossless (default 100)",
+    )
+
+
+def encode_options(args):
+    return {
+        "jpeg_quality": args.jpeg_quality,
+        "png_compression": args.png_compression,
+        "webp_quality": args.webp_quality,
+    }
@@ -0,0 +1,177 @@
+import threading
+
+import numpy as np
+
+from faceswap.backends import get_backend
+from faceswap.core import MODE_BBOX, clip_bbox, unique_pairs
+
+# Interactive re-swapping. Instead of copying the whole target and blending
+# every selected face again on each change, IncrementalSwap keeps the pristine
+# target and one swapped layer per target face and source face (a small patch
+# around the target face plus the pixels it changed). A change restores only
+# the boxes of the faces that were added, removed or given another source face
+# and composites the layers that overlap them, so toggling one face costs one
+# face no matter how many are selected.
+#
+# The GUI shows result while it changes: prepare() does the swapping on a
+# worker thread and only adds layers, update() on the main thread then only
+# composites, so the displayed image never changes under a redraw or save.
+
+# Room around the face box for what the backends draw outside of it
+# (landmark warps, Poisson seams, the inswapper crop)
+LAYER_MARGIN = 0.5
+
+LANDMARK_KEYS = ("kps", "landmark_2d_106", "landmark_3d_68")
+
+
+def shifted_face(face, dx, dy):
+    # Copy of face with its box and landmarks moved into a patch at (dx, dy)
+    moved = type(face)(face)  # insightface Face is a dict of its attributes
+    moved.bbox = face.bbox - np.array([dx, dy, dx, dy], dtype=face.bbox.dtype)
+    for key in LANDMARK_KEYS:
+        points = getattr(face, key, None)
+        if points is not None:
+            points = points.copy()
+            points[:, :2] -= (dx, dy)
+            setattr(moved, key, points)
+    return moved
+
+
+def expand_bbox(bbox, margin, shape):
+    x1, y1, x2, y2 = bbox[:4]
+    pad = margin * max(x2 - x1, y2 - y1)
+    return clip_bbox(np.array([x1 - pad, y1 - pad, x2 + pad, y2 + pad]), shape)
+
+
+def intersect(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2, y2
+
+
+class FaceLayer:
+    def __init__(self, rect, patch, changed):
+        self.rect = rect  # (x1, y1, x2, y2) in target coordinates
+        self.patch = patch
+        self.changed = changed  # bool mask of the pixels the swap touched
+
+
+class IncrementalSwap:
+    def __init__(
+        self,
+        source_image,
+        source_faces,
+        target_image,
+        target_faces,
+        mode=MODE_BBOX,
+        margin=LAYER_MARGIN,
+        **backend_options,
+    ):
+        self.mode = mode
+        self.backend_options = backend_options
+        self.backend = get_backend(mode, **backend_options)
+        self.source_image = source_image
+        self.source_faces = source_faces
+        self.target_faces = target_faces
+        self.margin = margin
+
+        # The target is never written to; result starts as its copy
+        self.pristine = target_image
+        self.result = target_image.copy()
+        self.pairs = []  # (source index, target index), in drawing order
+        self.layers = {}
+
+        self._dirty = []
+        self._dirty_lock = threading.Lock()
+
+    def layer(self, source_index, target_index):
+        key = (source_index, target_index)
+        if key not in self.layers:
+            face = self.target_faces[target_index]
+            x1, y1, x2, y2 = self._target_rect(target_index)
+            original = self.pristine[y1:y2, x1:x2]
+            patch = original.copy()
+            if x2 > x1 and y2 > y1:
+                self.backend.swap_into(
+                    patch,
+                    self.source_image,
+                    self.source_faces[source_index],
+                    [shifted_face(face, x1, y1)],
+                    [0],
+                )
+            changed = np.any(patch != original, axis=2)
+            self.layers[key] = FaceLayer((x1, y1, x2, y2), patch, changed)
+        return self.layers[key]
+
+    def _assigned(self, pairs):
+        # {target index: source index}, the last pair winning for a target
+        # as in the backends' swap_pairs_into
+        pairs = unique_pairs(
+            (source, target)
+            for source, target in pairs
+            if source < len(self.source_faces) and target < len(self.target_faces)
+        )
+        return {target: source for source, target in pairs}
+
+    def prepare(self, pairs):
+        # Builds the missing layers for update(pairs) without touching result
+        for target, source in self._assigned(pairs).items():
+            self.layer(source, target)
+
+    def update(self, pairs):
+        # Shows each target face of the (source index, target index) pairs
+        # swapped with its source face. Returns how many faces had to be
+        # recomposited.
+        assigned = self._assigned(pairs)
+        previous = {target: source for source, target in self.pairs}
+        dirty = [
+            target
+            for target in sorted(set(assigned) | set(previous))
+            if assigned.get(target) != previous.get(target)
+        ]
+
+        # Layers first, so the composite below never waits on a swap
+        pairs = [(source, target) for target, source in assigned.items()]
+        for source, target in pairs:
+            self.layer(source, target)
+
+        self.pairs = pairs
+        # A target's box is the same whichever source face it shows
+        rects = [self._target_rect(target) for target in dirty]
+        for rect in rects:
+            self._composite(rect)
+
+        with self._dirty_lock:
+            self._dirty.extend(rects)
+        return len(dirty)
+
+    def _target_rect(self, target_index):
+        face = self.target_faces[target_index]
+        return expand_bbox(face.bbox, self.margin, self.pristine.shape)
+
+    def take_dirty(self):
+        # Regions of result changed since the last call, for redrawing
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, []
+        return dirty
+
+    def _composite(self, rect):
+        x1, y1, x2, y2 = rect
+        self.result[y1:y2, x1:x2] = self.pristine[y1:y2, x1:x2]
+
+        # Later faces are drawn over earlier ones, like a full swap does
+        for key in self.pairs:
+            layer = self.layers[key]
+            overlap = intersect(rect, layer.rect)
+            if overlap is None:
+                continue
+            ox1, oy1, ox2, oy2 = overlap
+            lx1, ly1 = layer.rect[:2]
+            inner = (slice(oy1 - ly1, oy2 - ly1), slice(ox1 - lx1, ox2 - lx1))
+            np.copyto(
+                self.result[oy1:oy2, ox1:ox2],
+                layer.patch[inner],
+                where=layer.changed[inner][..., None],
+            )
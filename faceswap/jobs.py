@@ -0,0 +1,338 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+from itertools import groupby
+
+from faceswap.backends import required_tasks
+from faceswap.batch import (
+    SourceFace,
+    add_mode_arguments,
+    add_model_arguments,
+    backend_options,
+    collect_results,
+    parse_args,
+    read_target,
+    swap_target,
+)
+from faceswap.core import (
+    MAP_MATCH,
+    SELECT_ALL,
+    LazyFaceAnalyzer,
+    det_size_option,
+    parse_mapping,
+    parse_selection,
+)
+from faceswap.detection_cache import DEFAULT_CACHE_BYTES, DEFAULT_CACHE_PATH
+from faceswap.identity import DEFAULT_MATCH_THRESHOLD
+from faceswap.image_io import add_encode_arguments, encode_options, write_image
+
+# Batch runs described by a manifest instead of a source and a directory:
+# one job per row, each with its own source, target, face selection and
+# output path.
+#
+#     source,target,output,select,map
+#     me.jpg,party/001.jpg,out/001.jpg,largest,
+#     us.jpg,party/002.jpg,out/002.png,all,match
+#
+# or the same keys as JSON lines. Relative paths are relative to the
+# manifest; select defaults to "all" and map to source face 1 everywhere.
+#
+#     python -m faceswap.jobs manifest.csv --mode aligned
+#
+# Jobs are grouped by source image, so each source is read and detected
+# once per run however its jobs are spread over the manifest. A job's key
+# hashes the source and target file contents with everything that changes
+# the result, and finished keys are appended to a checkpoint file as they
+# complete, with the output each one wrote. A rerun after a crash skips a
+# job only when the checkpoint says its output was written under the same
+# key; a file left by another manifest or other options is redone. A job
+# whose key was already produced under another output path gets a copy of
+# that file instead of a second swap. Outputs are written to a temporary
+# file and renamed into place, so a crash never leaves a truncated one.
+
+MANIFEST_COLUMNS = ("source", "target", "output", "select", "map")
+HASH_CHUNK = 1024 * 1024
+
+
+class Job:
+    def __init__(self, number, source, target, output, select=None, mapping=None):
+        self.number = number  # Row in the manifest, for messages
+        self.source = source
+        self.target = target
+        self.output = output
+        self.select = (select or SELECT_ALL).strip().lower()
+        self.map = (mapping or "").strip().lower() or None
+        self.policy, self.indices = parse_selection(self.select)
+        self.mapping = parse_mapping(self.map) if self.map else None
+
+
+def read_rows(path):
+    # (row number, {column: value}) of a CSV file with a header row, or of
+    # a file of JSON objects, one per line
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".json")):
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield number, json.loads(line)
+        else:
+            # The header is row 1
+            yield from enumerate(csv.DictReader(f), 2)
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for number, row in read_rows(path):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+        missing = [key for key in MANIFEST_COLUMNS[:3] if not row.get(key)]
+        if missing:
+            raise ValueError(f"{path}:{number}: missing {', '.join(missing)}")
+
+        paths = [os.path.join(base, row[key]) for key in MANIFEST_COLUMNS[:3]]
+        try:
+            jobs.append(Job(number, *paths, row.get("select"), row.get("map")))
+        except ValueError as e:
+            raise ValueError(f"{path}:{number}: {e}")
+    return jobs
+
+
+class FileHashes:
+    # Content hash per path, each file read once per run
+    def __init__(self):
+        self._hashes = {}
+
+    def get(self, path):
+        if path not in self._hashes:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                    digest.update(chunk)
+            self._hashes[path] = digest.hexdigest()
+        return self._hashes[path]
+
+
+def job_key(source_hash, target_hash, job, settings):
+    # The output extension is part of the key: it picks the encoder
+    digest = hashlib.blake2b(digest_size=12)
+    extension = os.path.splitext(job.output)[1].lower()
+    parts = [source_hash, target_hash, job.select, job.map, extension, settings]
+    digest.update(json.dumps(parts, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    # Append-only "key<TAB>status<TAB>output" lines, one per finished job.
+    # Each line is flushed to disk before the next job starts, so a crash
+    # loses at most the job that was running.
+    def __init__(self, path):
+        self.path = path
+        self.done = {}  # key -> status
+        self.outputs = {}  # output path -> key of the job that last wrote it
+        self.produced = {}  # key -> output paths written for it
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    # A torn last line from a crash is ignored
+                    if len(parts) == 3:
+                        self._add(*parts)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _add(self, key, status, output):
+        self.done[key] = status
+        if status == "swapped":
+            self.outputs[output] = key
+            self.produced.setdefault(key, []).append(output)
+
+    def written_by(self, output, key):
+        # True when output exists and was last written by a job with key
+        return self.outputs.get(output) == key and os.path.exists(output)
+
+    def record(self, key, status, output):
+        self._add(key, status, output)
+        self._file.write(f"{key}\t{status}\t{output}\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def temp_path_for(path):
+    # Hidden file next to path, with the same extension for the encoder
+    directory, name = os.path.split(path)
+    stem, extension = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{os.getpid()}.tmp{extension}")
+
+
+def replace_output(path, write):
+    # write(temp_path), then the temporary file is renamed over path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = temp_path_for(path)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def reuse_result(checkpoint, key, output):
+    # True when the job's result already exists: at its own output path, or
+    # at another path written under the same key, which is copied over
+    if checkpoint.done[key] == "no_faces" or checkpoint.written_by(output, key):
+        return True
+    for produced in checkpoint.produced.get(key, ()):
+        if checkpoint.written_by(produced, key):
+            replace_output(output, lambda path: shutil.copyfile(produced, path))
+            checkpoint.record(key, "swapped", output)
+            return True
+    return False  # Deleted or overwritten since; run it again
+
+
+def run_job(analyzer, source, job, encode):
+    target_image = read_target(job.target)
+    result = swap_target(analyzer, source, target_image, job.policy, job.indices)
+    if result is None:
+        return "no_faces"
+
+    replace_output(job.output, lambda path: write_image(path, result, **encode))
+    return "swapped"
+
+
+def iter_jobs(analyzer, jobs, checkpoint, mode, settings, encode=None, **options):
+    # Yields (target_path, status, error) per job, one source group at a
+    # time. options are SourceFace keywords (backend options, threshold).
+    encode = encode or {}
+    hashes = FileHashes()
+
+    def source_hash(job):
+        try:
+            return hashes.get(job.source)
+        except OSError:
+            return ""  # Reported when the group's source fails to load
+
+    for _, group in groupby(sorted(jobs, key=source_hash), key=source_hash):
+        # Jobs that are done already don't need the source, so it is only
+        # detected for the first one that isn't
+        source = source_error = None
+        for job in group:
+            try:
+                key = job_key(
+                    hashes.get(job.source), hashes.get(job.target), job, settings
+                )
+                if key in checkpoint.done and reuse_result(checkpoint, key, job.output):
+                    yield job.target, "skipped", None
+                    continue
+
+                if source is None and source_error is None:
+                    try:
+                        source = SourceFace(analyzer, job.source, mode, **options)
+                    except ValueError as e:
+                        source_error = e
+                if source_error is not None:
+                    raise source_error
+
+                status = run_job(
+                    analyzer, source.with_mapping(job.mapping), job, encode
+                )
+                checkpoint.record(key, status, job.output)
+                yield job.target, status, None
+            except Exception as e:
+                yield job.target, "failed", f"row {job.number}: {e}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the swap jobs listed in a CSV or JSON lines manifest."
+    )
+    parser.add_argument(
+        "manifest",
+        help="CSV with a header row or JSON lines, with source, target, output "
+        "and optional select and map per job",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="File recording finished jobs (default: the manifest path + .done)",
+    )
+    add_mode_arguments(parser)
+    add_encode_arguments(parser)
+    parser.add_argument(
+        "--match-threshold",
+        type=float,
+        default=DEFAULT_MATCH_THRESHOLD,
+        help="Cosine similarity needed to count as the same person (map match)",
+    )
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_CACHE_PATH,
+        default=None,
+        metavar="PATH",
+        help="Reuse face detections of previously seen images "
+        f"(default location: {DEFAULT_CACHE_PATH})",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = parse_args(build_parser(), argv)
+    try:
+        jobs = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    tasks = list(required_tasks(args.mode))
+    if any(job.mapping == MAP_MATCH for job in jobs) and "recognition" not in tasks:
+        tasks.append("recognition")
+    analyzer = LazyFaceAnalyzer(
+        name=args.model_pack,
+        det_size=det_size_option(args.det_size),
+        tiled=args.tiled,
+        cache_path=args.cache,
+        cache_bytes=DEFAULT_CACHE_BYTES,
+        allowed_modules=tasks,
+    )
+
+    options = backend_options(args)
+    encode = encode_options(args)
+    # Everything besides the job's own columns that changes its output
+    settings = {
+        "mode": args.mode,
+        "backend": options,
+        "encode": encode,
+        "model_pack": args.model_pack,
+        "det_size": args.det_size,
+        "tiled": args.tiled,
+        "match_threshold": args.match_threshold,
+    }
+
+    checkpoint = Checkpoint(args.checkpoint or args.manifest + ".done")
+    log = lambda message: print(message, file=sys.stderr)
+    try:
+        results = iter_jobs(
+            analyzer,
+            jobs,
+            checkpoint,
+            args.mode,
+            settings,
+            encode,
+            match_threshold=args.match_threshold,
+            **options,
+        )
+        stats = collect_results(results, log)
+    finally:
+        checkpoint.close()
+    print(stats.summary())
+    return 0 if stats.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from faceswap.batch import collect_results, detect, output_path_for
+from faceswap.image_io import apply_orientation, load_image, write_image
+from faceswap.incremental import (
+    LANDMARK_KEYS,
+    LAYER_MARGIN,
+    expand_bbox,
+    shifted_face,
+)
+from faceswap.metrics import count, timed
+
+# Targets too large to hold in memory several times over. The regular path
+# decodes the target, copies it for the result and encodes the copy, so a
+# 2 GB TIFF needs 4 GB or more. Here the target lives in a disk-backed memory
+# map, detection runs on a downscaled copy built one strip at a time, and
+# only a patch around each face (plus the blend margin) is read, swapped and
+# written back. Mapped pages are dropped from the process after every strip
+# and patch, so resident memory is bounded by the strip size, the patches
+# and the models instead of the image.
+#
+# An uncompressed TIFF written as TIFF is never decoded: the output file
+# starts as a copy of the target and is patched in place. Compressed TIFFs
+# are decoded strip by strip into a temporary map. OpenCV has no partial
+# decoder for other formats, so they are decoded once (peak: one image) and
+# moved to the map before anything else happens.
+#
+# A TIFF with an Orientation tag other than top-left is turned upright into
+# a new map block by block, the same way image_io turns every other image,
+# so --roi output is oriented like normal processing.
+
+DEFAULT_DETECT_SIZE = 4096
+STRIP_BYTES = 16 * 2**20
+ORIENT_BLOCK = 2048
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+
+def is_tiff(path):
+    return path.lower().endswith(TIFF_EXTENSIONS)
+
+
+def release(array):
+    # Drops the mapped pages from this process; they stay in the page cache
+    # and dirty ones are still written back to the file
+    mapping = getattr(array, "_mmap", None)
+    if mapping is not None and hasattr(mmap, "MADV_DONTNEED"):
+        mapping.madvise(mmap.MADV_DONTNEED)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS; None where it isn't available
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def scaled_face(face, factor):
+    # Copy of face with its box and landmarks scaled by factor
+    scaled = type(face)(face)  # insightface Face is a dict of its attributes
+    scaled.bbox = face.bbox * factor
+    for key in LANDMARK_KEYS:
+        points = getattr(face, key, None)
+        if points is not None:
+            points = points.copy()
+            points[:, :2] *= factor
+            setattr(scaled, key, points)
+    return scaled
+
+
+class MappedImage:
+    # A (height, width, 3) uint8 image in a memory map. rgb is True when the
+    # channels are in TIFF order instead of OpenCV's BGR; read() and write()
+    # convert patches. in_place means the map is the output file itself.
+    def __init__(self, pixels, rgb=False, temp_path=None, in_place=False):
+        self.pixels = pixels
+        self.rgb = rgb
+        self.temp_path = temp_path
+        self.in_place = in_place
+
+    @property
+    def shape(self):
+        return self.pixels.shape
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes
+
+    def strips(self):
+        # (y1, y2) row ranges of about STRIP_BYTES each
+        height, width = self.shape[:2]
+        rows = max(1, STRIP_BYTES // (width * 3))
+        for y in range(0, height, rows):
+            yield y, min(height, y + rows)
+
+    def read(self, rect):
+        x1, y1, x2, y2 = rect
+        patch = self.pixels[y1:y2, x1:x2]
+        return np.ascontiguousarray(patch[..., ::-1] if self.rgb else patch)
+
+    def write(self, rect, patch):
+        x1, y1, x2, y2 = rect
+        self.pixels[y1:y2, x1:x2] = patch[..., ::-1] if self.rgb else patch
+
+    def release(self):
+        release(self.pixels)
+
+    def downscaled(self, max_size):
+        # (BGR image, scale) with the longer side at most max_size; each
+        # strip of output rows is resized from its own strip of input rows
+        height, width = self.shape[:2]
+        scale = min(1.0, max_size / max(width, height))
+        out_width = max(1, round(width * scale))
+        out_height = max(1, round(height * scale))
+        small = np.empty((out_height, out_width, 3), dtype=np.uint8)
+
+        rows = max(1, int(STRIP_BYTES // (width * 3) * scale))
+        for out_y in range(0, out_height, rows):
+            out_y2 = min(out_height, out_y + rows)
+            y1 = int(out_y / scale)
+            y2 = min(height, max(y1 + 1, round(out_y2 / scale)))
+            strip = self.read((0, y1, width, y2))
+            small[out_y:out_y2] = cv2.resize(
+                strip, (out_width, out_y2 - out_y), interpolation=cv2.INTER_AREA
+            )
+            self.release()
+        return small, out_width / width
+
+    def to_bgr(self):
+        # Converts the map in place, one strip at a time
+        if self.rgb:
+            for y1, y2 in self.strips():
+                self.pixels[y1:y2] = self.pixels[y1:y2, :, ::-1]
+                self.release()
+            self.rgb = False
+
+    def close(self):
+        if self.pixels is not None:
+            self.pixels.flush()
+            self.pixels = None
+        if self.temp_path is not None:
+            os.remove(self.temp_path)
+            self.temp_path = None
+
+
+def temp_map(shape, temp_dir=None):
+    # A writable raw map; temp_dir should be on disk, not on a tmpfs that is
+    # backed by memory
+    fd, path = tempfile.mkstemp(suffix=".raw", dir=temp_dir)
+    os.close(fd)
+    return np.memmap(path, dtype=np.uint8, mode="w+", shape=shape), path
+
+
+def open_tiff(path, output_path, temp_dir=None):
+    # MappedImage of an 8 bit RGB TIFF, or None for other layouts (left to
+    # OpenCV, which converts them)
+    import tifffile
+
+    with tifffile.TiffFile(path) as tiff:
+        series = tiff.series[0]
+        shape = series.shape
+        if series.dtype != np.uint8 or len(shape) != 3 or shape[2] != 3:
+            return None
+
+        tag = tiff.pages[0].tags.get("Orientation")
+        orientation = int(tag.value) if tag is not None else 1
+        if series.dataoffset is not None:
+            if orientation != 1:
+                # Read from the file as it is, written upright to a new map
+                pixels = tifffile.memmap(path, mode="r")
+                return oriented(MappedImage(pixels, rgb=True), orientation, temp_dir)
+            if is_tiff(output_path):
+                shutil.copyfile(path, output_path)
+                pixels = tifffile.memmap(output_path, mode="r+")
+                return MappedImage(pixels, rgb=True, in_place=True)
+
+        pixels, temp_path = temp_map(shape, temp_dir)
+        image = MappedImage(pixels, rgb=True, temp_path=temp_path)
+        try:
+            decode_segments(tiff.pages[0], pixels)
+        except Exception:
+            image.close()
+            raise
+        return oriented(image, orientation, temp_dir)
+
+
+def oriented_point(x, y, width, height, orientation):
+    # Where the corner point (x, y) of a width x height image lands once
+    # apply_orientation() has turned it upright
+    return {
+        1: (x, y),
+        2: (width - x, y),
+        3: (width - x, height - y),
+        4: (x, height - y),
+        5: (y, x),
+        6: (height - y, x),
+        7: (height - y, width - x),
+        8: (y, width - x),
+    }[orientation]
+
+
+def oriented(image, orientation, temp_dir=None):
+    # image turned upright into a new map, ORIENT_BLOCK pixels square at a
+    # time; image is closed. Orientations 1 and unknown ones return it as is.
+    if orientation not in range(2, 9):
+        return image
+
+    height, width = image.shape[:2]
+    shape = (width, height, 3) if orientation >= 5 else (height, width, 3)
+    pixels, temp_path = temp_map(shape, temp_dir)
+    upright = MappedImage(pixels, rgb=image.rgb, temp_path=temp_path)
+    try:
+        for y1 in range(0, height, ORIENT_BLOCK):
+            y2 = min(height, y1 + ORIENT_BLOCK)
+            for x1 in range(0, width, ORIENT_BLOCK):
+                x2 = min(width, x1 + ORIENT_BLOCK)
+                ax, ay = oriented_point(x1, y1, width, height, orientation)
+                bx, by = oriented_point(x2, y2, width, height, orientation)
+                block = apply_orientation(image.pixels[y1:y2, x1:x2], orientation)
+                pixels[min(ay, by) : max(ay, by), min(ax, bx) : max(ax, bx)] = block
+            image.release()
+            upright.release()
+    except Exception:
+        upright.close()
+        raise
+    finally:
+        image.close()
+    return upright
+
+
+def decode_segments(page, pixels):
+    # Decodes a TIFF page strip by strip (or tile by tile) into the map
+    height, width = pixels.shape[:2]
+    written = 0
+    for segment, (_, _, y, x, _), _ in page.segments(
+        maxworkers=1, buffersize=STRIP_BYTES
+    ):
+        if segment is None:
+            continue  # Empty segments stay zero
+        # Tiles at the border are decoded at full tile size
+        segment = segment[0, : height - y, : width - x]
+        pixels[y : y + segment.shape[0], x : x + segment.shape[1]] = segment
+        written += segment.nbytes
+        if written >= STRIP_BYTES:
+            release(pixels)
+            written = 0
+    release(pixels)
+
+
+def open_target(path, output_path, temp_dir=None):
+    with timed("read"):
+        if is_tiff(path):
+            image = open_tiff(path, output_path, temp_dir)
+            if image is not None:
+                return image
+
+        decoded, _ = load_image(path)
+        if decoded is None:
+            raise ValueError(f"Could not read image: {path}")
+        pixels, temp_path = temp_map(decoded.shape, temp_dir)
+        image = MappedImage(pixels, temp_path=temp_path)
+        for y1, y2 in image.strips():
+            pixels[y1:y2] = decoded[y1:y2]
+            image.release()
+        return image
+
+
+def save_mapped(image, output_path, **encode_options):
+    if image.in_place:
+        image.pixels.flush()
+        return
+
+    if is_tiff(output_path):
+        import tifffile
+
+        with timed("write"):
+            output = tifffile.memmap(
+                output_path, shape=image.shape, dtype=np.uint8, photometric="rgb"
+            )
+            for y1, y2 in image.strips():
+                strip = image.pixels[y1:y2]
+                output[y1:y2] = strip if image.rgb else strip[..., ::-1]
+                image.release()
+                release(output)
+            output.flush()
+        return
+
+    # The encoder reads the whole map; its pages are file backed, so the
+    # kernel can drop them again under memory pressure
+    image.to_bgr()
+    write_image(output_path, image.pixels, **encode_options)
+    image.release()
+
+
+def swap_regions(image, source, target_faces, indices, margin=LAYER_MARGIN):
+    # Swaps each face of the (source, target) pairs in a patch around it,
+    # one patch in memory at a time. Later patches are read after earlier
+    # ones were written, so overlapping faces compose like a full swap.
+    swapped = 0
+    with timed("swap"):
+        for source_index, target_index in source.pairs(target_faces, indices):
+            face = target_faces[target_index]
+            x1, y1, x2, y2 = rect = expand_bbox(face.bbox, margin, image.shape)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            patch = image.read(rect)
+            swapped += source.backend.swap_pairs_into(
+                patch,
+                source.image,
+                source.faces,
+                [shifted_face(face, x1, y1)],
+                [(source_index, 0)],
+            )
+            image.write(rect, patch)
+            image.release()
+    count("faces_swapped", swapped)
+    return swapped
+
+
+def process_large(
+    analyzer,
+    source,
+    target_path,
+    output_dir,
+    policy,
+    indices,
+    detect_size=DEFAULT_DETECT_SIZE,
+    image_options=None,
+    log=None,
+):
+    # Same contract as batch.process_path: "swapped", "no_faces" or raises.
+    # The temporary map goes next to the output, which is on disk.
+    options = dict(image_options or {})
+    options.pop("max_size", None)
+    output_path = output_path_for(
+        target_path, output_dir, options.pop("output_format", None)
+    )
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    image = open_target(target_path, output_path, output_dir)
+    status = "failed"
+    try:
+        with timed("downscale"):
+            small, scale = image.downscaled(detect_size)
+        faces = [scaled_face(face, 1 / scale) for face in detect(analyzer, small)]
+        del small
+
+        selected = source.select(faces, policy, indices)
+        if not selected:
+            status = "no_faces"
+            return status
+
+        swap_regions(image, source, faces, selected)
+        save_mapped(image, output_path, **options)
+        status = "swapped"
+        return status
+    finally:
+        height, width = image.shape[:2]
+        image_mb = image.nbytes / 2**20
+        image.close()
+        if image.in_place and status != "swapped" and os.path.exists(output_path):
+            os.remove(output_path)
+        if log:
+            message = f"{target_path}: {width}x{height} ({image_mb:.0f} MB decoded)"
+            peak_mb = peak_rss_mb()
+            if peak_mb is not None:
+                message += f", peak RSS so far {peak_mb:.0f} MB"
+            log(message)
+
+
+def iter_large(
+    analyzer,
+    source,
+    target_paths,
+    output_dir,
+    policy,
+    indices,
+    detect_size=DEFAULT_DETECT_SIZE,
+    image_options=None,
+    log=None,
+):
+    # Yields (target_path, status, error), one image at a time
+    for target_path in target_paths:
+        try:
+            status = process_large(
+                analyzer,
+                source,
+                target_path,
+                output_dir,
+                policy,
+                indices,
+                detect_size,
+                image_options,
+                log,
+            )
+            yield target_path, status, None
+        except Exception as e:
+            yield target_path, "failed", str(e)
+
+
+def run_large(
+    analyzer,
+    source,
+    target_paths,
+    output_dir,
+    policy,
+    indices,
+    log=None,
+    detect_size=DEFAULT_DETECT_SIZE,
+    image_options=None,
+):
+    os.makedirs(output_dir, exist_ok=True)
+    results = iter_large(
+        analyzer,
+        source,
+        target_paths,
+        output_dir,
+        policy,
+        indices,
+        detect_size,
+        image_options,
+        log,
+    )
+    return collect_results(results, log)
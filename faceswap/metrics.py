@@ -0,0 +1,210 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Process wide stage timers and counters. Call sites wrap each stage in
+# timed("detect") etc.; a timer costs two perf_counter calls and a lock, so
+# it stays on. Values are read through snapshot(), a status line for the GUI,
+# JSON, or Prometheus text format.
+#
+# Stages: read (including decode), detect, swap, mask, blend, encode/write
+#
+# Libraries that keep their own statistics (detection cache, mask cache)
+# register a collector that is only called at export time. Its values are
+# counters unless named as gauges, for values that can go down such as a
+# cache's size in bytes.
+
+MAX_TRACE_EVENTS = 1_000_000
+
+
+class LatencyWindow:
+    # The most recent samples (seconds) for percentiles, plus totals
+    def __init__(self, size=1024):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+
+    def summary(self):
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64) * 1000
+            count, total = self.count, self.total
+        summary = {"count": count, "total_s": round(total, 4)}
+        for percentile in (50, 95, 99):
+            value = np.percentile(samples, percentile) if len(samples) else 0.0
+            summary[f"p{percentile}_ms"] = round(float(value), 2)
+        return summary
+
+
+class Metrics:
+    def __init__(self, window=1024):
+        self.window = window
+        self.timers = {}
+        self.counters = {}
+        self.collectors = []
+        self.gauges = set()
+        self.trace = None  # Chrome trace events while tracing
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        with self._lock:
+            if name not in self.timers:
+                self.timers[name] = LatencyWindow(self.window)
+            return self.timers[name]
+
+    @contextmanager
+    def timed(self, name):
+        window = self.timer(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            window.add(elapsed)
+            trace = self.trace
+            if trace is not None:
+                trace.append((name, started, elapsed, threading.get_ident()))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_collector(self, collector, gauges=()):
+        # collector() returns {name: value}; names in gauges are gauges, the
+        # rest counters
+        with self._lock:
+            self.collectors.append(collector)
+            self.gauges.update(gauges)
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def snapshot(self):
+        with self._lock:
+            timers = dict(self.timers)
+            counters = dict(self.counters)
+            collectors = list(self.collectors)
+            gauge_names = set(self.gauges)
+        # Several collectors may report the same name, e.g. one per detection
+        # cache; their values add up
+        gauges = {}
+        for collector in collectors:
+            for name, value in collector().items():
+                values = gauges if name in gauge_names else counters
+                values[name] = values.get(name, 0) + value
+        return {
+            "timers": {name: timers[name].summary() for name in sorted(timers)},
+            "counters": dict(sorted(counters.items())),
+            "gauges": dict(sorted(gauges.items())),
+        }
+
+    def status_text(self, names):
+        # Last duration of each stage that ran, e.g. "detect 812 ms | swap 35 ms"
+        with self._lock:
+            timers = dict(self.timers)
+        parts = [
+            f"{name} {timers[name].last * 1000:.0f} ms"
+            for name in names
+            if name in timers
+        ]
+        return " | ".join(parts)
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="faceswap"):
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per stage",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, summary in snapshot["timers"].items():
+            for percentile in (50, 95, 99):
+                seconds = summary[f"p{percentile}_ms"] / 1000
+                lines.append(
+                    f'{prefix}_stage_seconds{{stage="{name}",'
+                    f'quantile="{percentile / 100:g}"}} {seconds:.6f}'
+                )
+            lines.append(
+                f'{prefix}_stage_seconds_sum{{stage="{name}"}} {summary["total_s"]}'
+            )
+            lines.append(
+                f'{prefix}_stage_seconds_count{{stage="{name}"}} {summary["count"]}'
+            )
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in snapshot["gauges"].items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # JSON for .json files, Prometheus text format otherwise
+        if path.lower().endswith(".json"):
+            text = self.to_json()
+        else:
+            text = self.to_prometheus()
+        with open(path, "w") as f:
+            f.write(text)
+
+    def start_trace(self):
+        self.trace = deque(maxlen=MAX_TRACE_EVENTS)
+
+    def write_trace(self, path):
+        # Chrome trace format: open in chrome://tracing or ui.perfetto.dev
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": round(started * 1e6, 1),
+                "dur": round(elapsed * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": thread,
+            }
+            for name, started, elapsed, thread in list(self.trace or ())
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
+
+
+class Profiler:
+    # cProfile over the code run inside running(), from any thread (one at a
+    # time), dumped to path for pstats/snakeviz
+    def __init__(self, path):
+        self.path = path
+        self._profile = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def running(self):
+        with self._lock:
+            self._profile.enable()
+            try:
+                yield
+            finally:
+                self._profile.disable()
+
+    def dump(self):
+        self._profile.dump_stats(self.path)
+
+
+metrics = Metrics()
+timed = metrics.timed
+count = metrics.count
@@ -0,0 +1,108 @@
+import glob
+import os
+
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.model_zoo import model_zoo
+from insightface.utils import ensure_available
+
+# Model files of the insightface packs and the task each one serves. Known
+# files that aren't needed are skipped before an onnxruntime session is
+# created for them; unknown files are routed by loading them, like
+# insightface does.
+KNOWN_MODEL_TASKS = {
+    "det_10g.onnx": "detection",
+    "det_2.5g.onnx": "detection",
+    "det_500m.onnx": "detection",
+    "scrfd_10g_bnkps.onnx": "detection",
+    "w600k_r50.onnx": "recognition",
+    "w600k_mbf.onnx": "recognition",
+    "glintr100.onnx": "recognition",
+    "genderage.onnx": "genderage",
+    "1k3d68.onnx": "landmark_3d_68",
+    "2d106det.onnx": "landmark_2d_106",
+}
+
+
+def session_options(intra_op_threads=None):
+    options = onnxruntime.SessionOptions()
+    if intra_op_threads:
+        # Needed when several analyzers share one machine, otherwise each
+        # grabs every core
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+class SelectiveFaceAnalysis(FaceAnalysis):
+    # FaceAnalysis that honours allowed_modules before loading anything and
+    # passes session options through to onnxruntime
+    def __init__(
+        self,
+        name,
+        root="~/.insightface",
+        allowed_modules=None,
+        providers=None,
+        provider_options=None,
+        sess_options=None,
+    ):
+        onnxruntime.set_default_logger_severity(3)
+        self.models = {}
+        self.model_dir = ensure_available("models", name, root=root)
+
+        for onnx_file in sorted(glob.glob(os.path.join(self.model_dir, "*.onnx"))):
+            task = KNOWN_MODEL_TASKS.get(os.path.basename(onnx_file))
+            if allowed_modules is not None and task is not None:
+                if task not in allowed_modules:
+                    continue
+
+            model = model_zoo.ModelRouter(onnx_file).get_model(
+                providers=providers or model_zoo.get_default_providers(),
+                provider_options=provider_options,
+                sess_options=sess_options,
+            )
+            if model is None:
+                continue
+            if allowed_modules is not None and model.taskname not in allowed_modules:
+                continue
+            if model.taskname not in self.models:
+                self.models[model.taskname] = model
+
+        if "detection" not in self.models:
+            raise ValueError(f"No detection model found in {self.model_dir}")
+        self.det_model = self.models["detection"]
+
+
+class SizedDetector:
+    # The shared detection model with its own input size
+    def __init__(self, model, input_size):
+        self.model = model
+        self.input_size = input_size
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        return self.model.detect(
+            img,
+            input_size=input_size or self.input_size,
+            max_num=max_num,
+            metric=metric,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class SizedFaceAnalysis:
+    # A prepared analyzer detecting at det_size instead of the size it was
+    # prepared with. Every model is shared, so it costs nothing to keep one
+    # per size.
+    def __init__(self, analyzer, det_size):
+        self.base = analyzer
+        self.det_size = tuple(det_size)
+        self.det_model = SizedDetector(analyzer.det_model, self.det_size)
+
+    def get(self, img, max_num=0):
+        # FaceAnalysis.get only uses det_model and models
+        return FaceAnalysis.get(self, img, max_num=max_num)
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+from faceswap.batch import SourceFace, collect_results, process_path
+from faceswap.core import create_face_analyzer
+
+# Per-process state, filled in by _init_worker
+_worker = {}
+
+
+def default_threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_worker(
+    source_path,
+    swap_mode,
+    analyzer_options,
+    intra_op_threads,
+    policy,
+    indices,
+    image_options,
+):
+    # Each worker owns its analyzer and prepares it exactly once
+    cv2.setNumThreads(1)
+    try:
+        analyzer = create_face_analyzer(
+            intra_op_threads=intra_op_threads, **analyzer_options
+        )
+        _worker["source"] = SourceFace(
+            analyzer, source_path, swap_mode[0], **swap_mode[1]
+        )
+        _worker["analyzer"] = analyzer
+    except Exception as e:
+        # Reported with the first task instead of breaking the pool silently
+        _worker["error"] = str(e)
+    _worker["policy"] = policy
+    _worker["indices"] = indices
+    _worker["image_options"] = image_options
+
+
+def _process(target_path, output_dir):
+    if "error" in _worker:
+        return target_path, "init_error", _worker["error"]
+
+    try:
+        status = process_path(
+            _worker["analyzer"],
+            _worker["source"],
+            target_path,
+            output_dir,
+            _worker["policy"],
+            _worker["indices"],
+            _worker["image_options"],
+        )
+        return target_path, status, None
+    except Exception as e:
+        return target_path, "failed", str(e)
+
+
+def bounded_map(executor, fn, items, max_pending, ordered=True):
+    # Like executor.map, but never submits more than max_pending items ahead,
+    # so huge (or endless) inputs don't pile up in memory
+    if ordered:
+        pending = deque()
+        for item in items:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fn, *item))
+        while pending:
+            yield pending.popleft().result()
+    else:
+        pending = set()
+        for item in items:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(fn, *item))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def iter_parallel(
+    source_path,
+    target_paths,
+    output_dir,
+    policy,
+    indices,
+    swap_mode,
+    workers,
+    analyzer_options,
+    threads_per_worker=None,
+    queue_size=None,
+    ordered=True,
+    image_options=None,
+):
+    # Yields (target_path, status, error) as workers finish. swap_mode is a
+    # (mode, SourceFace options) pair and analyzer_options are keyword arguments
+    # for create_face_analyzer in every worker.
+    os.makedirs(output_dir, exist_ok=True)
+    threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+    queue_size = queue_size or workers * 4
+
+    # spawn keeps onnxruntime state from leaking into the workers
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(
+            source_path,
+            swap_mode,
+            analyzer_options,
+            threads_per_worker,
+            policy,
+            indices,
+            image_options,
+        ),
+    )
+    with executor:
+        items = ((path, output_dir) for path in target_paths)
+        for result in bounded_map(executor, _process, items, queue_size, ordered):
+            if result[1] == "init_error":
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise ValueError(result[2])
+            yield result
+
+
+def run_parallel(*args, log=None, **kwargs):
+    return collect_results(iter_parallel(*args, **kwargs), log)
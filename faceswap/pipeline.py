@@ -0,0 +1,137 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from faceswap.batch import collect_results, read_target, write_result
+from faceswap.batch_detection import detect_many
+from faceswap.metrics import count, timed
+from faceswap.parallel import bounded_map
+
+# decode (thread pool) -> detect (calling thread) -> blend + encode (thread pool)
+#
+# With detect_batch > 1 the detector stage collects that many decoded images
+# and detects them in one call.
+# OpenCV releases the GIL while decoding, resizing and encoding, so the I/O
+# pools overlap with the detector. Every hand-off is bounded by queue_size,
+# which keeps memory flat and makes a slow stage stall the ones before it
+# instead of buffering images.
+
+
+def _decode(path, image_options):
+    try:
+        return path, read_target(path, image_options), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class SwapPipeline:
+    def __init__(
+        self,
+        analyzer,
+        source,
+        output_dir,
+        policy,
+        indices,
+        decode_threads=2,
+        encode_threads=2,
+        queue_size=8,
+        detect_batch=1,
+        image_options=None,
+    ):
+        self.analyzer = analyzer
+        self.source = source
+        self.output_dir = output_dir
+        self.policy = policy
+        self.indices = indices
+        self.decode_threads = decode_threads
+        self.encode_threads = encode_threads
+        self.queue_size = queue_size
+        self.detect_batch = detect_batch
+        self.image_options = image_options
+
+    def _blend_and_write(self, path, image, faces, selected):
+        try:
+            result = self.source.swap(image, faces, selected)
+            write_result(path, self.output_dir, result, self.image_options)
+            return path, "swapped", None
+        except Exception as e:
+            return path, "failed", str(e)
+
+    def _detect(self, batch, encoder):
+        # One detector call for the whole batch of (path, image) pairs
+        if not batch:
+            return []
+
+        try:
+            with timed("detect"):
+                if len(batch) == 1:
+                    faces_list = [self.analyzer.get(batch[0][1])]
+                else:
+                    images = [image for _, image in batch]
+                    faces_list = detect_many(self.analyzer, images)
+        except Exception as e:
+            return [_done((path, "failed", str(e))) for path, _ in batch]
+        count("faces_detected", sum(len(faces) for faces in faces_list))
+
+        futures = []
+        for (path, image), faces in zip(batch, faces_list):
+            selected = self.source.select(faces, self.policy, self.indices)
+            if not selected:
+                futures.append(_done((path, "no_faces", None)))
+            else:
+                futures.append(
+                    encoder.submit(self._blend_and_write, path, image, faces, selected)
+                )
+        return futures
+
+    def run(self, target_paths):
+        # Yields (target_path, status, error) in input order
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        with ThreadPoolExecutor(self.decode_threads) as decoder, ThreadPoolExecutor(
+            self.encode_threads
+        ) as encoder:
+            decoded = bounded_map(
+                decoder,
+                _decode,
+                ((path, self.image_options) for path in target_paths),
+                self.queue_size,
+            )
+            pending = deque()
+            batch = []
+
+            for path, image, error in decoded:
+                if error is None:
+                    batch.append((path, image))
+                    if len(batch) >= self.detect_batch:
+                        pending.extend(self._detect(batch, encoder))
+                        batch = []
+                else:
+                    # Flush the partial batch first to keep input order
+                    pending.extend(self._detect(batch, encoder))
+                    batch = []
+                    pending.append(_done((path, "failed", error)))
+
+                # Hand back finished images without waiting on the rest, and
+                # block on the encoder only when it has fallen behind
+                while pending and (
+                    pending[0].done() or len(pending) >= self.queue_size
+                ):
+                    yield pending.popleft().result()
+
+            pending.extend(self._detect(batch, encoder))
+            while pending:
+                yield pending.popleft().result()
+
+
+def run_pipeline(
+    analyzer, source, target_paths, output_dir, policy, indices, log=None, **kwargs
+):
+    pipeline = SwapPipeline(analyzer, source, output_dir, policy, indices, **kwargs)
+    return collect_results(pipeline.run(target_paths), log)
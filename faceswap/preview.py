@@ -0,0 +1,189 @@
+import tkinter as tk
+
+import cv2
+from PIL import Image, ImageTk
+
+# Redrawing a large image for every canvas change is what made the GUI slow:
+# each resize scaled the full image down again. DisplayPyramid keeps halved
+# copies so a preview is always scaled from the smallest copy that is still
+# big enough, and CanvasPreview only rebuilds the PhotoImage when the image
+# or the canvas size actually changed.
+
+
+class DisplayPyramid:
+    def __init__(self, image, min_size=256):
+        self.image = image
+        self.min_size = min_size
+        self.levels = [image]
+
+    def _level_for(self, width, height):
+        # Smallest level that is at least width x height, halving lazily
+        level = self.levels[0]
+        for level in self._iter_levels():
+            h, w = level.shape[:2]
+            if w // 2 < width or h // 2 < height or min(w, h) // 2 < self.min_size:
+                return level
+        return level
+
+    def _iter_levels(self):
+        i = 0
+        while True:
+            if i == len(self.levels):
+                h, w = self.levels[-1].shape[:2]
+                if min(w, h) // 2 < 1:
+                    return
+                # An odd last row or column is dropped to keep the 2x2 blocks
+                self.levels.append(
+                    cv2.resize(
+                        self.levels[-1][: h // 2 * 2, : w // 2 * 2],
+                        (w // 2, h // 2),
+                        interpolation=cv2.INTER_AREA,
+                    )
+                )
+            yield self.levels[i]
+            i += 1
+
+    def update(self, rects):
+        # Rebuild the levels under regions of the image that changed in place.
+        # Halving is a 2x2 average, so even-aligned regions come out exactly
+        # as a full rebuild would.
+        for x1, y1, x2, y2 in rects:
+            for k in range(1, len(self.levels)):
+                h, w = self.levels[k].shape[:2]
+                x1, y1 = x1 // 2, y1 // 2
+                x2, y2 = min(w, (x2 + 1) // 2), min(h, (y2 + 1) // 2)
+                if x2 <= x1 or y2 <= y1:
+                    break
+                self.levels[k][y1:y2, x1:x2] = cv2.resize(
+                    self.levels[k - 1][2 * y1 : 2 * y2, 2 * x1 : 2 * x2],
+                    (x2 - x1, y2 - y1),
+                    interpolation=cv2.INTER_AREA,
+                )
+
+    def fit(self, width, height):
+        level = self._level_for(width, height)
+        h, w = level.shape[:2]
+        if (w, h) == (width, height):
+            return level
+        # The level is less than twice the target size, so bilinear doesn't
+        # alias and costs far less than INTER_AREA at a fractional scale
+        return cv2.resize(level, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+class CanvasPreview:
+    # One image centred on a canvas plus box overlays that stay on the canvas
+    # as persistent items: a redraw moves them and a selection change only
+    # recolours them
+    def __init__(self, canvas, default_size=(400, 400)):
+        self.canvas = canvas
+        self.default_size = default_size
+        self.image = None
+        self.pyramid = None
+        self.photo = None
+        self.image_item = None
+        self.size = None
+        self.scale = 1.0
+        self.offset = (0.0, 0.0)
+        self.boxes = []
+        self.box_items = []
+
+    def canvas_size(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1:  # Canvas not realized yet
+            return self.default_size
+        return width, height
+
+    def show(self, image):
+        # Returns False when nothing changed since the last call
+        canvas_width, canvas_height = self.canvas_size()
+        if image is self.image and (canvas_width, canvas_height) == self.size:
+            return False
+
+        if image is not self.image:
+            self.image = image
+            self.pyramid = DisplayPyramid(image)
+        self.size = (canvas_width, canvas_height)
+
+        # Resize image to fit canvas
+        img_height, img_width = image.shape[:2]
+        self.scale = min(canvas_width / img_width, canvas_height / img_height)
+        new_width = max(1, int(img_width * self.scale))
+        new_height = max(1, int(img_height * self.scale))
+        self.offset = (
+            (canvas_width - img_width * self.scale) / 2,
+            (canvas_height - img_height * self.scale) / 2,
+        )
+
+        # Images are BGR; only the small fitted copy is converted for Tk
+        resized_image = self.pyramid.fit(new_width, new_height)
+        rgb = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
+        self.photo = ImageTk.PhotoImage(image=Image.fromarray(rgb))
+
+        if self.image_item is None:
+            self.image_item = self.canvas.create_image(
+                canvas_width // 2,
+                canvas_height // 2,
+                image=self.photo,
+                anchor=tk.CENTER,
+            )
+        else:
+            self.canvas.itemconfig(self.image_item, image=self.photo)
+            self.canvas.coords(self.image_item, canvas_width // 2, canvas_height // 2)
+        self.canvas.tag_lower(self.image_item)
+
+        self._place_boxes()
+        return True
+
+    def refresh(self, rects):
+        # The shown image was modified in place inside rects
+        if self.pyramid is not None:
+            self.pyramid.update(rects)
+            self.size = None
+            self.show(self.image)
+
+    def to_canvas(self, x, y):
+        return (
+            int(x * self.scale + self.offset[0]),
+            int(y * self.scale + self.offset[1]),
+        )
+
+    def to_image(self, x, y):
+        return (x - self.offset[0]) / self.scale, (y - self.offset[1]) / self.scale
+
+    def set_boxes(self, boxes, labels=False):
+        # boxes are (x1, y1, x2, y2) in image coordinates. Items are only
+        # created or deleted when the number of boxes changes.
+        while len(self.box_items) > len(boxes):
+            for item in self.box_items.pop():
+                if item is not None:
+                    self.canvas.delete(item)
+        while len(self.box_items) < len(boxes):
+            i = len(self.box_items)
+            rect = self.canvas.create_rectangle(0, 0, 0, 0, width=2)
+            text = None
+            if labels:
+                # Display index number for easier reference
+                text = self.canvas.create_text(
+                    0, 0, text=str(i + 1), font=("Arial", 12, "bold")
+                )
+            self.box_items.append((rect, text))
+
+        self.boxes = [[int(v) for v in box[:4]] for box in boxes]
+        self._place_boxes()
+
+    def style_box(self, i, color, width=2, label=None):
+        rect, text = self.box_items[i]
+        self.canvas.itemconfig(rect, outline=color, width=width)
+        if text is not None:
+            self.canvas.itemconfig(text, fill=color)
+            if label is not None:
+                self.canvas.itemconfig(text, text=label)
+
+    def _place_boxes(self):
+        for (x1, y1, x2, y2), (rect, text) in zip(self.boxes, self.box_items):
+            x1, y1 = self.to_canvas(x1, y1)
+            x2, y2 = self.to_canvas(x2, y2)
+            self.canvas.coords(rect, x1, y1, x2, y2)
+            if text is not None:
+                self.canvas.coords(text, (x1 + x2) // 2, y1 - 10)
@@ -0,0 +1,521 @@
+import argparse
+import hashlib
+import json
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from faceswap import image_io
+from faceswap.backends import required_tasks
+from faceswap.batch import (
+    SourceFace,
+    add_mode_arguments,
+    add_model_arguments,
+    backend_options,
+    parse_args,
+)
+from faceswap.batch_detection import detect_many
+from faceswap.core import (
+    DEFAULT_DET_SIZE,
+    auto_det_sizes,
+    create_face_analyzer,
+    det_size_option,
+    is_auto_det_size,
+    parse_mapping,
+    parse_selection,
+)
+from faceswap.image_io import load_image
+from faceswap.metrics import LatencyWindow, count, metrics, timed
+
+# Swapping as a local HTTP service, so other programs don't need the GUI or a
+# temp directory. The face analyzer is built once at startup and stays warm.
+# Requests arrive on their own threads; their detections are collected for a
+# few milliseconds and sent to the detector as one batch, which is where
+# concurrent requests get their throughput. Images travel as raw encoded
+# bytes in the request and response bodies.
+#
+#     python -m faceswap.server --source me.jpg --port 8000
+#     curl --data-binary @photo.jpg localhost:8000/swap -o swapped.jpg
+#
+# GET  /health                 {"status": "ok"}
+# GET  /stats                  queue depth, batch sizes, latency percentiles
+# GET  /metrics                stage timers, counters and gauges, Prometheus format
+# POST /detect                 faces of the image in the body, as JSON
+# POST /sources?map=1:2,2:1    registers the source image in the body
+# POST /swap?source=ID&select=all&format=jpg&quality=90
+#                              swapped image in the body; quality applies to
+#                              jpg and webp, compression=0-9 to png
+
+DEFAULT_PORT = 8000
+DEFAULT_SOURCE_ID = "default"
+ENCODE_FORMATS = ("jpg", "png", "webp")
+
+
+class DetectionBatcher:
+    # Drop-in for the analyzer in request threads: get() queues the image
+    # and blocks until its faces are back. One thread drains the queue,
+    # waiting up to max_wait after the first image for up to max_batch more.
+    def __init__(self, analyzer, max_batch=8, max_wait=0.005):
+        self.analyzer = analyzer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.images = 0
+        self.in_flight = 0
+        self.wait_times = LatencyWindow()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def get(self, img, max_num=0):
+        future = Future()
+        self._queue.put((img, max_num, future, time.perf_counter()))
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = self._collect(item)
+            started = time.perf_counter()
+            self.in_flight = len(batch)
+            for _, _, _, queued in batch:
+                self.wait_times.add(started - queued)
+
+            # Requests with different max_num can't share a detector call
+            groups = {}
+            for entry in batch:
+                groups.setdefault(entry[1], []).append(entry)
+            for max_num, entries in groups.items():
+                try:
+                    with timed("detect"):
+                        results = detect_many(
+                            self.analyzer,
+                            [image for image, _, _, _ in entries],
+                            max_num=max_num,
+                        )
+                except Exception as e:
+                    for _, _, future, _ in entries:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future, _), faces in zip(entries, results):
+                    count("faces_detected", len(faces))
+                    future.set_result(faces)
+
+            self.batches += 1
+            self.images += len(batch)
+            self.in_flight = 0
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_image(data, min_size=None):
+    # (image, scale); with min_size a JPEG may be decoded at reduced scale.
+    # load_image times the decode itself, as the "read" stage.
+    image, scale = load_image(data, min_size)
+    if image is None:
+        raise ServiceError(400, "Could not decode image")
+    return image, scale
+
+
+def parse_encoding(params):
+    # (format, quality, compression) of a /swap request, checked before any
+    # work is done on the image
+    image_format = params.get("format", "jpg").lower().lstrip(".")
+    if image_format == "jpeg":
+        image_format = "jpg"
+    if image_format not in ENCODE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format!r}")
+
+    quality = int(params["quality"]) if "quality" in params else None
+    if quality is not None and not 1 <= quality <= 100:
+        raise ValueError(f"Quality must be 1-100: {quality}")
+    compression = int(params["compression"]) if "compression" in params else None
+    if compression is not None and not 0 <= compression <= 9:
+        raise ValueError(f"Compression must be 0-9: {compression}")
+    return image_format, quality, compression
+
+
+def encode_image(image, image_format, quality=None, compression=None):
+    try:
+        return image_io.encode_image(
+            image,
+            image_format,
+            jpeg_quality=quality,
+            png_compression=compression,
+            webp_quality=quality,
+        )
+    except ValueError as e:
+        raise ServiceError(500, str(e))
+
+
+def face_json(face, scale=1.0):
+    # Coordinates are in the full size image even when it was decoded smaller
+    info = {
+        "bbox": [round(float(v) / scale, 1) for v in face.bbox[:4]],
+        "det_score": round(float(face.det_score), 4),
+    }
+    if face.kps is not None:
+        info["kps"] = np.round(face.kps / scale, 1).tolist()
+    return info
+
+
+class SwapService:
+    # Everything the HTTP handler calls; safe to use from many threads.
+    # Registered sources are keyed by a hash of their bytes and mapping, so
+    # posting the same source again costs nothing.
+    def __init__(
+        self,
+        analyzer,
+        mode,
+        max_batch=8,
+        max_wait=0.005,
+        max_sources=32,
+        detect_size=None,
+        **backend_options,
+    ):
+        self.mode = mode
+        # /detect only needs this many pixels on the longer side
+        self.detect_size = detect_size
+        self.backend_options = backend_options
+        self.detector = DetectionBatcher(analyzer, max_batch, max_wait)
+        self.max_sources = max_sources
+        self.latency = {}
+        self.active_requests = 0
+        self._sources = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_source(self, image, mapping=None, source_id=None):
+        if source_id is None:
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(np.ascontiguousarray(image).data)
+            digest.update(repr(mapping).encode())
+            source_id = digest.hexdigest()
+
+        with self._lock:
+            if source_id in self._sources:
+                self._sources.move_to_end(source_id)
+                return source_id, self._sources[source_id]
+
+        try:
+            source = SourceFace(
+                self.detector, image, self.mode, mapping, **self.backend_options
+            )
+        except ValueError as e:
+            raise ServiceError(422, str(e))
+
+        with self._lock:
+            self._sources[source_id] = source
+            # The startup source is never evicted
+            while len(self._sources) > self.max_sources:
+                oldest = next(
+                    (key for key in self._sources if key != DEFAULT_SOURCE_ID), None
+                )
+                if oldest is None:
+                    break
+                del self._sources[oldest]
+        return source_id, source
+
+    def source(self, source_id):
+        with self._lock:
+            if source_id not in self._sources:
+                raise ServiceError(404, f"Unknown source: {source_id}")
+            self._sources.move_to_end(source_id)
+            return self._sources[source_id]
+
+    def detect(self, image):
+        return self.detector.get(image)
+
+    def swap(self, source_id, image, policy, indices):
+        # Swapped copy of image, or None when no face was selected
+        source = self.source(source_id)
+        faces = self.detector.get(image)
+        selected = source.select(faces, policy, indices)
+        if not selected:
+            return None, 0
+        return source.swap(image, faces, selected), len(selected)
+
+    @contextmanager
+    def request(self, name):
+        # Counts the request as active and records its latency under name
+        started = time.perf_counter()
+        with self._lock:
+            self.active_requests += 1
+            window = self.latency.setdefault(name, LatencyWindow())
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active_requests -= 1
+            window.add(time.perf_counter() - started)
+
+    def stats(self):
+        detector = self.detector
+        with self._lock:
+            latency = dict(self.latency)
+            sources = len(self._sources)
+        return {
+            "mode": self.mode,
+            "sources": sources,
+            "active_requests": self.active_requests,
+            "queue_depth": detector.queue_depth,
+            "in_flight": detector.in_flight,
+            "batches": detector.batches,
+            "mean_batch_size": round(detector.images / max(1, detector.batches), 2),
+            "detect_wait": detector.wait_times.summary(),
+            "latency": {name: window.summary() for name, window in latency.items()},
+        }
+
+    def close(self):
+        self.detector.close()
+
+
+class SwapRequestHandler(BaseHTTPRequestHandler):
+    # self.server.service is the SwapService
+    protocol_version = "HTTP/1.1"
+    max_body_bytes = 64 * 1024 * 1024
+    quiet = True
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._handle(
+            {"/health": self._health, "/stats": self._stats, "/metrics": self._metrics}
+        )
+
+    def do_POST(self):
+        self._handle(
+            {"/detect": self._detect, "/sources": self._sources, "/swap": self._swap}
+        )
+
+    def _handle(self, routes):
+        service = self.server.service
+        url = urlparse(self.path)
+        route = routes.get(url.path)
+        if route is None:
+            self._send_json(404, {"error": f"Not found: {url.path}"})
+            return
+
+        with service.request(url.path.strip("/")):
+            try:
+                body = self._body() if self.command == "POST" else None
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                route(service, params, body)
+            except ServiceError as e:
+                self._send_json(e.status, {"error": str(e)})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+    def _body(self):
+        # Read before anything can fail, so an error response doesn't leave
+        # the body in the kept-alive connection
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.max_body_bytes:
+            self.close_connection = True
+            raise ServiceError(413, "Image too large")
+        body = self.rfile.read(length)
+        if not body:
+            raise ServiceError(400, "Request body must be an encoded image")
+        return body
+
+    def _send(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode(), "application/json")
+
+    def _health(self, service, params, body):
+        self._send_json(200, {"status": "ok"})
+
+    def _stats(self, service, params, body):
+        self._send_json(200, service.stats())
+
+    def _metrics(self, service, params, body):
+        text = metrics.to_prometheus()
+        self._send(200, text.encode(), "text/plain; version=0.0.4")
+
+    def _detect(self, service, params, body):
+        image, scale = decode_image(body, service.detect_size)
+        faces = service.detect(image)
+        self._send_json(200, {"faces": [face_json(face, scale) for face in faces]})
+
+    def _sources(self, service, params, body):
+        try:
+            mapping = parse_mapping(params["map"]) if "map" in params else None
+        except ValueError as e:
+            raise ServiceError(400, str(e))
+
+        image, _ = decode_image(body)
+        source_id, source = service.add_source(image, mapping)
+        self._send_json(200, {"id": source_id, "faces": len(source.faces)})
+
+    def _swap(self, service, params, body):
+        try:
+            policy, indices = parse_selection(params.get("select", "all"))
+            image_format, quality, compression = parse_encoding(params)
+        except ValueError as e:
+            raise ServiceError(400, str(e))
+
+        image, _ = decode_image(body)
+        source_id = params.get("source", DEFAULT_SOURCE_ID)
+        result, swapped = service.swap(source_id, image, policy, indices)
+        if result is None:
+            raise ServiceError(422, "No faces to swap in target image")
+
+        body = encode_image(result, image_format, quality, compression)
+        content_type = (
+            "image/jpeg" if image_format == "jpg" else f"image/{image_format}"
+        )
+        self._send(200, body, content_type, [("X-Faces-Swapped", str(swapped))])
+
+
+def create_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), SwapRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Serve face detection and swapping over HTTP."
+    )
+    parser.add_argument(
+        "--source",
+        help="Image with the source face, used when /swap names no source",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind to")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port")
+    add_mode_arguments(parser)
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=8,
+        help="Most concurrent images per detector call",
+    )
+    parser.add_argument(
+        "--batch-wait",
+        type=float,
+        default=5.0,
+        help="Milliseconds to wait for more images before running a batch",
+    )
+    parser.add_argument(
+        "--max-sources",
+        type=int,
+        default=32,
+        help="Registered source images kept in memory",
+    )
+    parser.add_argument(
+        "--log-requests", action="store_true", help="Log every request to stderr"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = parse_args(build_parser(), argv)
+
+    analyzer = create_face_analyzer(
+        name=args.model_pack,
+        det_size=det_size_option(args.det_size),
+        detect_batch=args.batch,
+        tiled=args.tiled,
+        allowed_modules=list(required_tasks(args.mode)),
+    )
+    # The first run allocates the sessions' buffers; do it before the first
+    # request instead of during it. With det_size auto, requests decode at
+    # up to the largest size it picks; tiled detection needs full size.
+    if is_auto_det_size(args.det_size):
+        warmup_size = DEFAULT_DET_SIZE[0]
+        detect_size = auto_det_sizes(args.det_size)[-1]
+    else:
+        warmup_size = detect_size = args.det_size
+    if args.tiled:
+        detect_size = None
+    analyzer.get(np.zeros((warmup_size, warmup_size, 3), dtype=np.uint8))
+
+    service = SwapService(
+        analyzer,
+        args.mode,
+        max_batch=args.batch,
+        max_wait=args.batch_wait / 1000,
+        max_sources=args.max_sources,
+        detect_size=detect_size,
+        **backend_options(args),
+    )
+    if args.source:
+        image, _ = load_image(args.source)
+        if image is None:
+            print(f"Could not read source image: {args.source}", file=sys.stderr)
+            return 1
+        try:
+            service.add_source(image, source_id=DEFAULT_SOURCE_ID)
+        except ServiceError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    SwapRequestHandler.quiet = not args.log_requests
+    server = create_server(service, args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
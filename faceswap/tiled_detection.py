@@ -0,0 +1,192 @@
+import numpy as np
+
+from faceswap.batch_detection import BatchFaceAnalyzer
+
+# The detector sees the whole image letterboxed into det_size, so in an
+# 8000x6000 crowd shot a 40 pixel face shrinks to 3 pixels and is gone.
+# Raising det_size costs time and memory quadratically. Instead the image is
+# also cut into overlapping det_size tiles that are detected at full
+# resolution (in batches when the model allows it), and the tile results are
+# merged with the downscaled whole-image pass by NMS. The whole-image pass
+# keeps faces too large for one tile; the tiles find the small ones. Cost is
+# one detector run per tile, linear in image area.
+
+DEFAULT_TILE_OVERLAP = 128
+
+
+def tile_origins(length, tile, stride):
+    # Start offsets covering [0, length); the last tile is pushed back to end
+    # at the border instead of hanging over it
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def tile_grid(shape, tile_size, overlap):
+    # (x1, y1, x2, y2) of every tile, row by row
+    height, width = shape[:2]
+    tile_width, tile_height = tile_size
+    return [
+        (x, y, min(width, x + tile_width), min(height, y + tile_height))
+        for y in tile_origins(height, tile_height, max(1, tile_height - overlap))
+        for x in tile_origins(width, tile_width, max(1, tile_width - overlap))
+    ]
+
+
+class TiledFaceAnalyzer:
+    # Wraps FaceAnalysis (or BatchFaceAnalyzer). Images that fit the detector
+    # input without shrinking much go through get() unchanged.
+    #
+    # With coarse_threshold set, the whole-image pass also keeps candidates
+    # down to that score, and only tiles containing a candidate are detected.
+    # Faster on sparse images, but faces the coarse pass misses entirely stay
+    # missed.
+    def __init__(
+        self,
+        analyzer,
+        tile_overlap=DEFAULT_TILE_OVERLAP,
+        batch_size=8,
+        coarse_threshold=None,
+        min_scale=0.5,
+    ):
+        self.analyzer = analyzer
+        self.detector = BatchFaceAnalyzer(getattr(analyzer, "analyzer", analyzer))
+        self.batch_size = batch_size
+        self.tile_overlap = tile_overlap
+        self.coarse_threshold = coarse_threshold
+        self.min_scale = min_scale
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+    @property
+    def tiling(self):
+        # Part of the detection cache key
+        return (self.tile_size, self.tile_overlap, self.coarse_threshold)
+
+    @property
+    def tile_size(self):
+        return tuple(self.detector.analyzer.det_model.input_size)
+
+    def get(self, img, max_num=0):
+        tile_width, tile_height = self.tile_size
+        height, width = img.shape[:2]
+        if min(tile_width / width, tile_height / height) >= self.min_scale:
+            return self.analyzer.get(img, max_num=max_num)
+
+        bboxes, kpss = self.detect(img, max_num)
+        return self.detector._analyze(img, bboxes, kpss)
+
+    def get_many(self, images, max_num=0):
+        return [self.get(image, max_num=max_num) for image in images]
+
+    def detect(self, img, max_num=0):
+        det_model = self.detector.analyzer.det_model
+
+        # Whole image, downscaled: large faces and the optional coarse filter
+        threshold = self.coarse_threshold
+        if threshold is not None and threshold < det_model.det_thresh:
+            candidates, candidate_kpss = self.detector.detect([img], 0, threshold)[0]
+            keep = candidates[:, 4] >= det_model.det_thresh
+            tiles = [
+                rect
+                for rect in tile_grid(img.shape, self.tile_size, self.tile_overlap)
+                if _contains_any(rect, candidates)
+            ]
+            dets = [candidates[keep]]
+            kps = [candidate_kpss[keep] if candidate_kpss is not None else None]
+        else:
+            bboxes, kpss = self.detector.detect([img])[0]
+            tiles = tile_grid(img.shape, self.tile_size, self.tile_overlap)
+            dets, kps = [bboxes], [kpss]
+        cuts = [np.zeros(len(dets[0]), dtype=bool)]
+
+        for start in range(0, len(tiles), self.batch_size):
+            chunk = tiles[start : start + self.batch_size]
+            crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in chunk]
+            for rect, (bboxes, tile_kpss) in zip(chunk, self.detector.detect(crops)):
+                bboxes, tile_kpss, cut = _tile_detections(
+                    rect, img.shape, bboxes, tile_kpss
+                )
+                dets.append(bboxes)
+                kps.append(tile_kpss)
+                cuts.append(cut)
+
+        det = np.vstack(dets).astype(np.float32, copy=False)
+        kpss = None
+        if det_model.use_kps:
+            kpss = np.vstack([k for k in kps if k is not None])
+
+        keep = _merge(det, np.concatenate(cuts), det_model.nms_thresh)
+        det = det[keep]
+        if kpss is not None:
+            kpss = kpss[keep]
+
+        if max_num > 0 and det.shape[0] > max_num:
+            # Largest faces first
+            area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
+            bindex = np.argsort(area)[::-1][:max_num]
+            det = det[bindex]
+            if kpss is not None:
+                kpss = kpss[bindex]
+        return det, kpss
+
+
+def _contains_any(rect, boxes):
+    x1, y1, x2, y2 = rect
+    centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    inside_x = (centers_x >= x1) & (centers_x < x2)
+    inside_y = (centers_y >= y1) & (centers_y < y2)
+    return bool((inside_x & inside_y).any())
+
+
+def _tile_detections(rect, shape, bboxes, kpss, border=2):
+    # Tile detections in image coordinates, and which of them touch a tile
+    # edge inside the image. Those may be part of a face: one no wider than
+    # the overlap is seen whole by a neighbouring tile, a larger one across
+    # a seam by no tile at all, so they are kept for _merge to sort out.
+    x1, y1, x2, y2 = rect
+    height, width = shape[:2]
+    bboxes = bboxes.copy()
+    bboxes[:, [0, 2]] += x1
+    bboxes[:, [1, 3]] += y1
+
+    cut = np.zeros(len(bboxes), dtype=bool)
+    if x1 > 0:
+        cut |= bboxes[:, 0] <= x1 + border
+    if y1 > 0:
+        cut |= bboxes[:, 1] <= y1 + border
+    if x2 < width:
+        cut |= bboxes[:, 2] >= x2 - border
+    if y2 < height:
+        cut |= bboxes[:, 3] >= y2 - border
+
+    if kpss is not None:
+        kpss = kpss + np.array([x1, y1], dtype=kpss.dtype)
+    return bboxes, kpss, cut
+
+
+def _merge(det, cut, iou_threshold, cover=0.6):
+    # Indices of the detections to keep. Greedy NMS over the whole faces by
+    # score, then over the cut ones: the same face seen by two tiles, or by
+    # a tile and the whole-image pass, keeps one box, and a complete box
+    # wins over a fragment. A cut box mostly inside a kept box is a fragment
+    # of that face and is dropped even when their IoU is low.
+    x1, y1, x2, y2 = det[:, 0], det[:, 1], det[:, 2], det[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    keep = []
+    for i in np.lexsort((-det[:, 4], cut)):
+        if keep:
+            width = np.minimum(x2[keep], x2[i]) - np.maximum(x1[keep], x1[i])
+            height = np.minimum(y2[keep], y2[i]) - np.maximum(y1[keep], y1[i])
+            inter = np.maximum(width, 0) * np.maximum(height, 0)
+            iou = inter / np.maximum(areas[keep] + areas[i] - inter, 1e-6)
+            if (iou > iou_threshold).any():
+                continue
+            if cut[i] and (inter >= cover * areas[i]).any():
+                continue
+        keep.append(i)
+    return np.array(keep, dtype=int)
@@ -0,0 +1,363 @@
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from faceswap.backends import required_tasks
+from faceswap.batch import (
+    SourceFace,
+    add_mode_arguments,
+    add_model_arguments,
+    backend_options,
+    parse_args,
+)
+from faceswap.core import (
+    SELECT_INDICES,
+    create_face_analyzer,
+    det_size_option,
+    parse_selection,
+    select_faces,
+)
+
+# Faces are detected with the full analyzer only every N frames. In between,
+# boxes and landmarks are carried forward with sparse optical flow on a
+# downscaled grayscale frame, which costs a small fraction of a detection.
+# A face whose points can't be followed counts as lost and forces a new
+# detection on that frame. Frames without any tracked face (intros,
+# cutaways) are checked for new faces every reacquire_every frames, which
+# defaults to detect_every.
+
+
+def iou_matrix(boxes_a, boxes_b):
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)[None, :, :]
+
+    x1 = np.maximum(a[..., 0], b[..., 0])
+    y1 = np.maximum(a[..., 1], b[..., 1])
+    x2 = np.minimum(a[..., 2], b[..., 2])
+    y2 = np.minimum(a[..., 3], b[..., 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class Track:
+    def __init__(self, track_id, face):
+        self.id = track_id
+        self.face = face
+
+
+class FaceTracker:
+    def __init__(
+        self,
+        analyzer,
+        detect_every=10,
+        iou_threshold=0.3,
+        min_points=4,
+        flow_width=640,
+        reacquire_every=None,
+    ):
+        self.analyzer = analyzer
+        self.detect_every = max(1, detect_every)
+        self.reacquire_every = max(1, reacquire_every or detect_every)
+        self.iou_threshold = iou_threshold
+        self.min_points = min_points
+        self.flow_width = flow_width
+
+        self.tracks = []
+        self.next_id = 0
+        self.frames = 0
+        self.detections = 0
+        self.since_detection = 0
+        self.prev_gray = None
+        self.flow_scale = 1.0
+
+    def _gray(self, frame):
+        self.flow_scale = min(1.0, self.flow_width / frame.shape[1])
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.flow_scale < 1.0:
+            gray = cv2.resize(
+                gray,
+                None,
+                fx=self.flow_scale,
+                fy=self.flow_scale,
+                interpolation=cv2.INTER_AREA,
+            )
+        return gray
+
+    def update(self, frame):
+        # Returns the tracks present in this frame
+        gray = self._gray(frame)
+        self.frames += 1
+
+        interval = self.detect_every if self.tracks else self.reacquire_every
+        due = self.detections == 0 or self.since_detection + 1 >= interval
+        if due or (self.tracks and not self._propagate(gray)):
+            self._detect(frame)
+        else:
+            self.since_detection += 1
+
+        self.prev_gray = gray
+        return self.tracks
+
+    def _detect(self, frame):
+        faces = self.analyzer.get(frame)
+        self.detections += 1
+        self.since_detection = 0
+
+        # Keep track ids stable by matching new boxes to the old ones
+        ids = [None] * len(faces)
+        if faces and self.tracks:
+            overlap = iou_matrix(
+                [face.bbox[:4] for face in faces],
+                [track.face.bbox[:4] for track in self.tracks],
+            )
+            while overlap.size and overlap.max() >= self.iou_threshold:
+                i, j = np.unravel_index(overlap.argmax(), overlap.shape)
+                ids[i] = self.tracks[j].id
+                overlap[i, :] = -1
+                overlap[:, j] = -1
+
+        tracks = []
+        for face, track_id in zip(faces, ids):
+            if track_id is None:
+                track_id = self.next_id
+                self.next_id += 1
+            tracks.append(Track(track_id, face))
+        self.tracks = sorted(tracks, key=lambda track: track.id)
+
+    def _track_points(self, track):
+        # Landmarks plus a few corners inside the box, in flow coordinates
+        scale = self.flow_scale
+        points = []
+        if track.face.kps is not None:
+            points.append(np.asarray(track.face.kps, dtype=np.float32) * scale)
+
+        height, width = self.prev_gray.shape
+        x1, y1, x2, y2 = (track.face.bbox[:4] * scale).astype(int)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 - x1 > 4 and y2 - y1 > 4:
+            corners = cv2.goodFeaturesToTrack(self.prev_gray[y1:y2, x1:x2], 20, 0.01, 3)
+            if corners is not None:
+                points.append(corners.reshape(-1, 2) + (x1, y1))
+
+        if not points:
+            return np.empty((0, 2), dtype=np.float32)
+        return np.concatenate(points).astype(np.float32)
+
+    def _propagate(self, gray):
+        # Move every track with the flow; False if any of them got lost
+        if self.prev_gray is None:
+            return False
+
+        point_sets = [self._track_points(track) for track in self.tracks]
+        counts = [len(points) for points in point_sets]
+        if min(counts) < self.min_points:
+            return False
+
+        # One flow call for all faces
+        prev_points = np.concatenate(point_sets).reshape(-1, 1, 2)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, prev_points, None, winSize=(21, 21), maxLevel=3
+        )
+        status = status.ravel().astype(bool)
+
+        moved = []
+        start = 0
+        for track, count in zip(self.tracks, counts):
+            end = start + count
+            good = status[start:end]
+            if good.sum() < self.min_points:
+                return False
+
+            matrix, _ = cv2.estimateAffinePartial2D(
+                prev_points[start:end][good], next_points[start:end][good]
+            )
+            if matrix is None:
+                return False
+            moved.append(self._moved_face(track.face, matrix))
+            start = end
+
+        for track, face in zip(self.tracks, moved):
+            track.face = face
+        return True
+
+    def _moved_face(self, face, matrix):
+        # matrix maps flow coordinates; bring it to full resolution
+        from insightface.app.common import Face
+
+        matrix = matrix.copy()
+        matrix[:, 2] /= self.flow_scale
+        zoom = float(np.hypot(matrix[0, 0], matrix[1, 0]))
+
+        x1, y1, x2, y2 = face.bbox[:4]
+        cx, cy = matrix @ np.array([(x1 + x2) / 2, (y1 + y2) / 2, 1.0])
+        half_w, half_h = (x2 - x1) * zoom / 2, (y2 - y1) * zoom / 2
+
+        moved = Face(face)
+        moved.bbox = np.array(
+            [cx - half_w, cy - half_h, cx + half_w, cy + half_h], dtype=np.float32
+        )
+        if face.kps is not None:
+            kps = np.asarray(face.kps, dtype=np.float32)
+            moved.kps = (kps @ matrix[:, :2].T + matrix[:, 2]).astype(np.float32)
+        return moved
+
+
+class VideoStats:
+    def __init__(self):
+        self.frames = 0
+        self.detections = 0
+        self.swapped_faces = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def summary(self):
+        fps = self.frames / self.elapsed if self.elapsed > 0 else 0.0
+        skipped = 1.0 - self.detections / self.frames if self.frames else 0.0
+        return (
+            f"Processed {self.frames} frames in {self.elapsed:.1f}s ({fps:.2f} fps), "
+            f"{self.swapped_faces} faces swapped, detector ran on "
+            f"{self.detections} frames ({skipped:.0%} skipped)"
+        )
+
+
+def selected_tracks(tracks, policy, indices):
+    if policy == SELECT_INDICES:
+        # Face numbers refer to track ids, i.e. the order faces first appeared
+        wanted = set(indices)
+        return [track for track in tracks if track.id in wanted]
+
+    faces = [track.face for track in tracks]
+    return [tracks[i] for i in select_faces(faces, policy, indices)]
+
+
+def swap_video(
+    analyzer,
+    source,
+    input_path,
+    output_path,
+    policy,
+    indices,
+    detect_every=10,
+    codec="mp4v",
+    reacquire_every=None,
+):
+    capture = cv2.VideoCapture(input_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {input_path}")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = cv2.VideoWriter(
+        output_path, cv2.VideoWriter_fourcc(*codec), fps, (width, height)
+    )
+    if not writer.isOpened():
+        capture.release()
+        raise ValueError(f"Could not create video: {output_path}")
+
+    tracker = FaceTracker(
+        analyzer, detect_every=detect_every, reacquire_every=reacquire_every
+    )
+    stats = VideoStats()
+
+    try:
+        # One frame in memory at a time
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+
+            tracks = selected_tracks(tracker.update(frame), policy, indices)
+            faces = [track.face for track in tracks]
+            stats.swapped_faces += source.swap_into(frame, faces, range(len(faces)))
+
+            writer.write(frame)
+    finally:
+        capture.release()
+        writer.release()
+
+    stats.frames = tracker.frames
+    stats.detections = tracker.detections
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Swap one source face into the faces of a video."
+    )
+    parser.add_argument("--source", required=True, help="Image with the source face")
+    parser.add_argument("input", help="Video to process")
+    parser.add_argument("-o", "--output", required=True, help="Output video file")
+    parser.add_argument(
+        "--select",
+        default="all",
+        help='Faces to replace: "all", "largest" or 1-based numbers in order of '
+        'first appearance, like "1,3"',
+    )
+    parser.add_argument(
+        "--detect-every",
+        type=int,
+        default=10,
+        help="Run the full detector every N frames and track faces in between",
+    )
+    parser.add_argument(
+        "--reacquire-every",
+        type=int,
+        help="Look for new faces every N frames while none are tracked "
+        "(default: --detect-every)",
+    )
+    add_mode_arguments(parser)
+    parser.add_argument(
+        "--codec", default="mp4v", help="FourCC code of the output video"
+    )
+    add_model_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = parse_args(build_parser(), argv)
+
+    try:
+        policy, indices = parse_selection(args.select)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    analyzer = create_face_analyzer(
+        name=args.model_pack,
+        det_size=det_size_option(args.det_size),
+        tiled=args.tiled,
+        allowed_modules=list(required_tasks(args.mode)),
+    )
+
+    try:
+        source = SourceFace(analyzer, args.source, args.mode, **backend_options(args))
+        stats = swap_video(
+            analyzer,
+            source,
+            args.input,
+            args.output,
+            policy,
+            indices,
+            detect_every=args.detect_every,
+            codec=args.codec,
+            reacquire_every=args.reacquire_every,
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-import cv2
-import numpy as np
-from insightface.app import FaceAnalysis
 import os
 
+from faceswap.background import BackgroundJobs
+from faceswap.backends import required_tasks
+from faceswap.core import DET_SIZE_AUTO, MODE_BBOX, SWAP_MODES, LazyFaceAnalyzer
+from faceswap.detection_cache import DEFAULT_CACHE_PATH
+from faceswap.identity import match_pairs
+from faceswap.image_io import read_image, write_image
+from faceswap.incremental import IncrementalSwap
+from faceswap.metrics import Profiler, count, metrics, timed
+from faceswap.preview import CanvasPreview
+
+# Stages shown with their last duration in the status bar
+STATUS_STAGES = ("read", "detect", "swap", "write")
+
 
 class FaceSwapApp:
     def __init__(self, root):
@@ -13,29 +22,68 @@ class FaceSwapApp:
         self.root.title("Face Swap Application")
         self.root.geometry("1200x800")
 
-        # Initialize InsightFace
-        self.face_analyzer = FaceAnalysis()
-        self.face_analyzer.prepare(ctx_id=0, det_size=(640, 640))
+        # InsightFace analyzers, one per set of models a swap method needs.
+        # Loaded in the background so the window shows up right away.
+        self.face_analyzers = {}
 
         # Variables
         self.source_image = None  # Face image
-        self.target_image = None  # Image with humans
-        self.source_tk_image = None
-        self.target_tk_image = None
+        self.target_image = None  # Image with humans, never swapped into
         self.result_image = None
+        self.swap_engine = None  # Per-face swap layers for the result
 
         self.source_faces = []
         self.target_faces = []
         self.selected_face_indices = []
+        # Source face swapped into each selected target face; new selections
+        # get the active source face
+        self.face_sources = {}
+        self.active_source_index = 0
 
         self.is_cropping_source = False
         self.is_cropping_target = False
         self.crop_start_x = 0
         self.crop_start_y = 0
         self.crop_rect = None
+        self.resize_job = None
 
         # Create UI
         self.create_ui()
+        self.root.after(200, lambda: self.current_face_analyzer().start())
+
+        # FACESWAP_PROFILE=path runs the background jobs under cProfile and
+        # FACESWAP_METRICS=path writes the stage timings, both on exit
+        profile_path = os.environ.get("FACESWAP_PROFILE")
+        self.profiler = Profiler(profile_path) if profile_path else None
+
+        # Detection and swapping run off the main loop; only the result
+        # callbacks touch the faces and images above
+        self.jobs = BackgroundJobs(self.root, self.status_var, profiler=self.profiler)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.jobs.shutdown()
+        if self.profiler is not None:
+            self.profiler.dump()
+        metrics_path = os.environ.get("FACESWAP_METRICS")
+        if metrics_path:
+            metrics.write(metrics_path)
+        self.root.destroy()
+
+    def current_face_analyzer(self):
+        return self.face_analyzer_for(required_tasks(self.mode_var.get()))
+
+    def face_analyzer_for(self, tasks):
+        tasks = tuple(tasks)
+        if tasks not in self.face_analyzers:
+            # Reuse detections of images seen before; the detector size
+            # follows the size of each opened image
+            self.face_analyzers[tasks] = LazyFaceAnalyzer(
+                det_size=DET_SIZE_AUTO,
+                cache_path=DEFAULT_CACHE_PATH,
+                allowed_modules=list(tasks),
+            )
+        return self.face_analyzers[tasks]
 
     def create_ui(self):
         # Main frames
@@ -61,13 +109,31 @@ class FaceSwapApp:
         ttk.Button(top_frame, text="Detect Faces", command=self.detect_faces).grid(
             row=0, column=4, padx=5
         )
+        ttk.Button(
+            top_frame, text="Select Matching", command=self.select_matching_faces
+        ).grid(row=0, column=5, padx=5)
         ttk.Button(top_frame, text="Swap Faces", command=self.swap_faces).grid(
-            row=0, column=5, padx=5
+            row=0, column=6, padx=5
         )
         ttk.Button(top_frame, text="Save Result", command=self.save_result).grid(
-            row=0, column=6, padx=5
+            row=0, column=7, padx=5
         )
 
+        # Swap method: box blend, landmark aligned, Poisson clone or ONNX swapper
+        ttk.Label(top_frame, text="Method:").grid(row=0, column=8, padx=(15, 5))
+        self.mode_var = tk.StringVar(value=MODE_BBOX)
+        ttk.Combobox(
+            top_frame,
+            textvariable=self.mode_var,
+            values=SWAP_MODES,
+            state="readonly",
+            width=10,
+        ).grid(row=0, column=9, padx=5)
+        self.color_match_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            top_frame, text="Match Colors", variable=self.color_match_var
+        ).grid(row=0, column=10, padx=5)
+
         # Image canvases
         left_frame = ttk.LabelFrame(main_frame, text="Source Face")
         left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
@@ -81,13 +147,24 @@ class FaceSwapApp:
         self.target_canvas = tk.Canvas(right_frame, bg="light gray")
         self.target_canvas.pack(fill=tk.BOTH, expand=True)
 
-        # Status bar
+        # Cached previews, so redraws don't rescale the full images
+        self.source_preview = CanvasPreview(self.source_canvas)
+        self.target_preview = CanvasPreview(self.target_canvas)
+
+        # Status bar, with the time of the last run of each stage on the right
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.metrics_var = tk.StringVar()
+        metrics_bar = ttk.Label(
+            status_frame, textvariable=self.metrics_var, relief=tk.SUNKEN, anchor=tk.E
+        )
+        metrics_bar.pack(side=tk.RIGHT)
         self.status_var = tk.StringVar()
         self.status_var.set("Ready")
         status_bar = ttk.Label(
-            self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W
+            status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W
         )
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
         # Bind events
         self.source_canvas.bind("<ButtonPress-1>", self.on_canvas_click)
@@ -101,11 +178,31 @@ class FaceSwapApp:
         self.root.bind("<Configure>", self.on_window_resize)
 
     def on_window_resize(self, event=None):
-        if hasattr(self, "source_canvas") and hasattr(self, "target_canvas"):
-            if self.source_image is not None:
-                self.display_source_image()
-            if self.target_image is not None:
-                self.display_target_image()
+        # <Configure> fires for every widget and many times while dragging,
+        # so redraw once the size has settled
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(100, self.redraw_images)
+
+    def redraw_images(self):
+        self.resize_job = None
+        if self.source_image is not None:
+            self.display_source_image()
+        if self.target_image is not None:
+            self.display_target_image()
+
+    def reset_swap(self):
+        # The result no longer matches the images or faces
+        self.swap_engine = None
+        self.result_image = None
+
+    def show_metrics(self):
+        self.metrics_var.set(metrics.status_text(STATUS_STAGES))
+
+    def displayed_target(self):
+        if self.result_image is not None:
+            return self.result_image
+        return self.target_image
 
     def load_source_image(self):
         file_path = filedialog.askopenfilename(
@@ -113,10 +210,17 @@ class FaceSwapApp:
         )
         if file_path:
             try:
-                self.source_image = cv2.imread(file_path)
-                self.source_image = cv2.cvtColor(self.source_image, cv2.COLOR_BGR2RGB)
-                self.display_source_image()
+                self.jobs.cancel()  # Results for the old image are stale
+                # Kept in BGR like the models expect; only previews convert
+                self.source_image = read_image(file_path)
+                self.show_metrics()
                 self.source_faces = []  # Reset face detection
+                self.face_sources = {}
+                self.active_source_index = 0
+                self.display_source_image()
+                if self.result_image is not None:
+                    self.reset_swap()
+                    self.display_target_image()
                 self.status_var.set(
                     f"Source face image loaded: {os.path.basename(file_path)}"
                 )
@@ -129,11 +233,13 @@ class FaceSwapApp:
         )
         if file_path:
             try:
-                self.target_image = cv2.imread(file_path)
-                self.target_image = cv2.cvtColor(self.target_image, cv2.COLOR_BGR2RGB)
-                self.display_target_image()
+                self.jobs.cancel()  # Results for the old image are stale
+                self.target_image = read_image(file_path)
+                self.show_metrics()
                 self.target_faces = []  # Reset face detection
                 self.selected_face_indices = []  # Reset selections
+                self.reset_swap()
+                self.display_target_image()
                 self.status_var.set(
                     f"Target image loaded: {os.path.basename(file_path)}"
                 )
@@ -144,69 +250,15 @@ class FaceSwapApp:
         if self.source_image is None:
             return
 
-        canvas_width = self.source_canvas.winfo_width()
-        canvas_height = self.source_canvas.winfo_height()
-
-        if canvas_width <= 1:  # Canvas not realized yet
-            canvas_width = 400
-            canvas_height = 400
-
-        # Resize image to fit canvas
-        img_height, img_width = self.source_image.shape[:2]
-        scale = min(canvas_width / img_width, canvas_height / img_height)
-
-        new_width = int(img_width * scale)
-        new_height = int(img_height * scale)
-
-        resized_image = cv2.resize(self.source_image, (new_width, new_height))
-        self.source_tk_image = ImageTk.PhotoImage(image=Image.fromarray(resized_image))
-
-        # Clear and display image
-        self.source_canvas.delete("all")
-        self.source_canvas.create_image(
-            canvas_width // 2,
-            canvas_height // 2,
-            image=self.source_tk_image,
-            anchor=tk.CENTER,
-        )
-
-        # Draw faces if detected
-        if self.source_faces:
-            self.draw_source_faces()
+        self.source_preview.show(self.source_image)
+        self.draw_source_faces()
 
     def display_target_image(self):
         if self.target_image is None:
             return
 
-        canvas_width = self.target_canvas.winfo_width()
-        canvas_height = self.target_canvas.winfo_height()
-
-        if canvas_width <= 1:  # Canvas not realized yet
-            canvas_width = 400
-            canvas_height = 400
-
-        # Resize image to fit canvas
-        img_height, img_width = self.target_image.shape[:2]
-        scale = min(canvas_width / img_width, canvas_height / img_height)
-
-        new_width = int(img_width * scale)
-        new_height = int(img_height * scale)
-
-        resized_image = cv2.resize(self.target_image, (new_width, new_height))
-        self.target_tk_image = ImageTk.PhotoImage(image=Image.fromarray(resized_image))
-
-        # Clear and display image
-        self.target_canvas.delete("all")
-        self.target_canvas.create_image(
-            canvas_width // 2,
-            canvas_height // 2,
-            image=self.target_tk_image,
-            anchor=tk.CENTER,
-        )
-
-        # Draw faces if detected
-        if self.target_faces:
-            self.draw_target_faces()
+        self.target_preview.show(self.displayed_target())
+        self.draw_target_faces()
 
     def start_crop_source(self):
         if self.source_image is not None:
@@ -249,6 +301,13 @@ class FaceSwapApp:
         ):
             # Face selection in target image
             self.toggle_face_selection(event.x, event.y)
+        elif (
+            canvas == self.source_canvas
+            and not self.is_cropping_source
+            and self.source_faces
+        ):
+            # Pick the source face for the next selected target faces
+            self.select_source_face(event.x, event.y)
 
     def on_canvas_drag(self, event):
         canvas = event.widget
@@ -293,8 +352,9 @@ class FaceSwapApp:
                     )
                     self.is_cropping_source = False
                 else:
+                    # Cropping keeps the swapped faces
                     self.crop_image(
-                        self.target_image,
+                        self.displayed_target(),
                         self.target_canvas,
                         x1,
                         y1,
@@ -309,25 +369,16 @@ class FaceSwapApp:
                 self.status_var.set("Image cropped")
 
     def crop_image(self, image, canvas, x1, y1, x2, y2, is_source):
-        # Get canvas and image dimensions
-        canvas_width = canvas.winfo_width()
-        canvas_height = canvas.winfo_height()
+        preview = self.source_preview if is_source else self.target_preview
         img_height, img_width = image.shape[:2]
 
-        # Calculate scale and offset
-        scale = min(canvas_width / img_width, canvas_height / img_height)
-
-        # Calculate offset for centering
-        scaled_width = img_width * scale
-        scaled_height = img_height * scale
-        offset_x = (canvas_width - scaled_width) / 2
-        offset_y = (canvas_height - scaled_height) / 2
-
         # Convert canvas coordinates to image coordinates
-        img_x1 = max(0, int((x1 - offset_x) / scale))
-        img_y1 = max(0, int((y1 - offset_y) / scale))
-        img_x2 = min(img_width, int((x2 - offset_x) / scale))
-        img_y2 = min(img_height, int((y2 - offset_y) / scale))
+        img_x1, img_y1 = preview.to_image(x1, y1)
+        img_x2, img_y2 = preview.to_image(x2, y2)
+        img_x1 = max(0, int(img_x1))
+        img_y1 = max(0, int(img_y1))
+        img_x2 = min(img_width, int(img_x2))
+        img_y2 = min(img_height, int(img_y2))
 
         # Ensure we have a valid crop area
         if img_x1 >= img_x2 or img_y1 >= img_y2:
@@ -336,173 +387,222 @@ class FaceSwapApp:
 
         # Crop the image
         cropped = image[img_y1:img_y2, img_x1:img_x2]
+        self.jobs.cancel()  # Results for the uncropped image are stale
 
         if is_source:
             self.source_image = cropped
-            self.display_source_image()
             self.source_faces = []  # Reset face detection
+            self.face_sources = {}
+            self.active_source_index = 0
+            self.display_source_image()
+            if self.result_image is not None:
+                self.reset_swap()
+                self.display_target_image()
         else:
             self.target_image = cropped
-            self.display_target_image()
             self.target_faces = []  # Reset face detection
             self.selected_face_indices = []  # Reset selections
+            self.face_sources = {}
+            self.reset_swap()
+            self.display_target_image()
 
     def detect_faces(self):
         if self.source_image is None or self.target_image is None:
             messagebox.showerror("Error", "Please load both source and target images")
             return
 
-        try:
-            # Detect faces in source image
-            self.source_faces = self.face_analyzer.get(self.source_image)
-
-            # Detect faces in target image
-            self.target_faces = self.face_analyzer.get(self.target_image)
-
-            # Reset selections
-            self.selected_face_indices = []
-
-            # Display images with face boxes
-            self.display_source_image()
-            self.display_target_image()
+        face_analyzer = self.current_face_analyzer()
+        source_image = self.source_image
+        target_image = self.target_image
+
+        def detect(job):
+            # Runs on the worker thread and must not touch self
+            if not face_analyzer.ready:
+                job.progress("Loading face models")
+                face_analyzer.load()
+
+            with timed("detect"):
+                job.progress("Detecting faces in source image")
+                source_faces = face_analyzer.get(source_image)
+
+                job.progress("Detecting faces in target image")
+                target_faces = face_analyzer.get(target_image)
+            count("faces_detected", len(source_faces) + len(target_faces))
+            return source_faces, target_faces
+
+        self.jobs.submit(
+            "Detecting faces",
+            detect,
+            self.on_faces_detected,
+            lambda e: messagebox.showerror("Error", f"Face detection failed: {str(e)}"),
+        )
 
-            if not self.source_faces:
-                messagebox.showwarning("Warning", "No faces detected in source image")
+    def on_faces_detected(self, faces):
+        self.source_faces, self.target_faces = faces
+        self.show_metrics()
 
-            if not self.target_faces:
-                messagebox.showwarning("Warning", "No faces detected in target image")
-            else:
-                self.status_var.set(
-                    f"Detected {len(self.target_faces)} faces in target image. Click on faces to select for swapping."
-                )
+        # Reset selections
+        self.selected_face_indices = []
+        self.face_sources = {}
+        self.active_source_index = 0
+        self.reset_swap()
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Face detection failed: {str(e)}")
+        # Display images with face boxes
+        self.display_source_image()
+        self.display_target_image()
 
-    def draw_source_faces(self):
         if not self.source_faces:
-            return
-
-        if self.source_image is None:
-            messagebox.showerror("Error", "No source image to draw faces")
-            return
-
-        # Get canvas dimensions
-        canvas_width = self.source_canvas.winfo_width()
-        canvas_height = self.source_canvas.winfo_height()
-
-        # Get image dimensions
-        img_height, img_width = self.source_image.shape[:2]
-
-        # Calculate scale and offset
-        scale = min(canvas_width / img_width, canvas_height / img_height)
-        scaled_width = img_width * scale
-        scaled_height = img_height * scale
-        offset_x = (canvas_width - scaled_width) / 2
-        offset_y = (canvas_height - scaled_height) / 2
-
-        # Draw rectangles for each face
-        for face in self.source_faces:
-            bbox = face.bbox.astype(int)
-
-            # Convert to canvas coordinates
-            x1 = int(bbox[0] * scale + offset_x)
-            y1 = int(bbox[1] * scale + offset_y)
-            x2 = int(bbox[2] * scale + offset_x)
-            y2 = int(bbox[3] * scale + offset_y)
+            messagebox.showwarning("Warning", "No faces detected in source image")
 
-            # Draw rectangle
-            self.source_canvas.create_rectangle(x1, y1, x2, y2, outline="blue", width=2)
-
-    def draw_target_faces(self):
         if not self.target_faces:
-            return
-
-        if self.target_image is None:
-            messagebox.showerror("Error", "No target image to draw faces")
-            return
+            messagebox.showwarning("Warning", "No faces detected in target image")
+            self.status_var.set("Ready")
+        else:
+            self.status_var.set(
+                f"Detected {len(self.target_faces)} faces in target image. Click on faces to select for swapping."
+            )
 
-        # Get canvas dimensions
-        canvas_width = self.target_canvas.winfo_width()
-        canvas_height = self.target_canvas.winfo_height()
+    def draw_source_faces(self):
+        # Face boxes are persistent canvas items; this only moves them
+        self.source_preview.set_boxes(
+            [face.bbox for face in self.source_faces], labels=True
+        )
+        self.style_source_faces()
+
+    def style_source_faces(self):
+        # The active source face is highlighted
+        for i in range(len(self.source_faces)):
+            active = i == self.active_source_index
+            self.source_preview.style_box(
+                i, "blue" if active else "light blue", 3 if active else 2
+            )
 
-        # Get image dimensions
-        img_height, img_width = self.target_image.shape[:2]
+    def draw_target_faces(self):
+        self.target_preview.set_boxes(
+            [face.bbox for face in self.target_faces], labels=True
+        )
+        self.style_target_faces()
+
+    def style_target_faces(self):
+        # Different color if selected. With several source faces, selected
+        # faces are labelled "target <- source".
+        multiple_sources = len(self.source_faces) > 1
+        for i in range(len(self.target_faces)):
+            selected = i in self.selected_face_indices
+            label = str(i + 1)
+            if selected and multiple_sources:
+                label = f"{i + 1}←{self.face_sources.get(i, 0) + 1}"
+            self.target_preview.style_box(
+                i, "red" if selected else "green", 3 if selected else 2, label
+            )
 
-        # Calculate scale and offset
-        scale = min(canvas_width / img_width, canvas_height / img_height)
-        scaled_width = img_width * scale
-        scaled_height = img_height * scale
-        offset_x = (canvas_width - scaled_width) / 2
-        offset_y = (canvas_height - scaled_height) / 2
+    def selected_pairs(self):
+        # (source index, target index) for every selected target face
+        return [(self.face_sources.get(i, 0), i) for i in self.selected_face_indices]
 
-        # Draw rectangles for each face
-        for i, face in enumerate(self.target_faces):
+    def select_source_face(self, x, y):
+        img_x, img_y = self.source_preview.to_image(x, y)
+        for i, face in enumerate(self.source_faces):
             bbox = face.bbox.astype(int)
-
-            # Convert to canvas coordinates
-            x1 = int(bbox[0] * scale + offset_x)
-            y1 = int(bbox[1] * scale + offset_y)
-            x2 = int(bbox[2] * scale + offset_x)
-            y2 = int(bbox[3] * scale + offset_y)
-
-            # Draw rectangle with different color if selected
-            color = "red" if i in self.selected_face_indices else "green"
-            width = 3 if i in self.selected_face_indices else 2
-
-            self.target_canvas.create_rectangle(
-                x1, y1, x2, y2, outline=color, width=width
-            )
-
-            # Display index number for easier reference
-            self.target_canvas.create_text(
-                (x1 + x2) // 2,
-                y1 - 10,
-                text=str(i + 1),
-                fill=color,
-                font=("Arial", 12, "bold"),
-            )
+            if bbox[0] <= img_x <= bbox[2] and bbox[1] <= img_y <= bbox[3]:
+                self.active_source_index = i
+                self.style_source_faces()
+                self.status_var.set(
+                    f"Source face {i + 1} active. Click on target faces to swap it in."
+                )
+                break
 
     def toggle_face_selection(self, x, y):
         if self.target_image is None:
             messagebox.showerror("Error", "No target image to select faces")
             return
 
-        # Get canvas dimensions
-        canvas_width = self.target_canvas.winfo_width()
-        canvas_height = self.target_canvas.winfo_height()
-
-        # Get image dimensions
-        img_height, img_width = self.target_image.shape[:2]
-
-        # Calculate scale and offset
-        scale = min(canvas_width / img_width, canvas_height / img_height)
-        scaled_width = img_width * scale
-        scaled_height = img_height * scale
-        offset_x = (canvas_width - scaled_width) / 2
-        offset_y = (canvas_height - scaled_height) / 2
-
         # Convert canvas coordinates to image coordinates
-        img_x = int((x - offset_x) / scale)
-        img_y = int((y - offset_y) / scale)
+        img_x, img_y = self.target_preview.to_image(x, y)
 
         # Check if click is inside any face bounding box
         for i, face in enumerate(self.target_faces):
             bbox = face.bbox.astype(int)
 
             if bbox[0] <= img_x <= bbox[2] and bbox[1] <= img_y <= bbox[3]:
-                # Toggle selection
-                if i in self.selected_face_indices:
-                    self.selected_face_indices.remove(i)
-                    self.status_var.set(f"Face {i + 1} deselected")
-                else:
+                # Toggle selection. A face showing another source face is
+                # switched to the active one instead.
+                source_index = self.active_source_index
+                if i not in self.selected_face_indices:
                     self.selected_face_indices.append(i)
+                    self.face_sources[i] = source_index
                     self.status_var.set(f"Face {i + 1} selected")
+                elif self.face_sources.get(i, 0) != source_index:
+                    self.face_sources[i] = source_index
+                    self.status_var.set(
+                        f"Face {i + 1} gets source face {source_index + 1}"
+                    )
+                else:
+                    self.selected_face_indices.remove(i)
+                    self.face_sources.pop(i, None)
+                    self.status_var.set(f"Face {i + 1} deselected")
 
-                # Redraw faces
-                self.display_target_image()
+                # Recolor the boxes, the image itself is unchanged
+                self.style_target_faces()
+
+                # Once a result is shown, it follows the selection
+                if self.swap_engine is not None:
+                    self.start_swap(self.swap_engine.mode)
                 break
 
+    def select_matching_faces(self):
+        # Select every target face of the same person as one of the source
+        # faces, mapped to that source face
+        if not self.source_faces or not self.target_faces:
+            messagebox.showerror("Error", "Please detect faces first")
+            return
+
+        # Embeddings come from the recognition model, which only some swap
+        # methods load
+        face_analyzer = self.face_analyzer_for(("detection", "recognition"))
+        source_image = self.source_image
+        target_image = self.target_image
+        source_faces = self.source_faces
+        target_faces = self.target_faces
+
+        def with_embedding(recognition, image, face):
+            if face.embedding is None:
+                face = type(face)(face)  # Copy, the shown faces stay untouched
+                recognition.get(image, face)
+            return face
+
+        def match(job):
+            if not face_analyzer.ready:
+                job.progress("Loading face models")
+            recognition = face_analyzer.models["recognition"]
+
+            job.progress("Matching faces")
+            sources = [
+                with_embedding(recognition, source_image, face) for face in source_faces
+            ]
+            faces = [
+                with_embedding(recognition, target_image, face) for face in target_faces
+            ]
+            return sources, faces, match_pairs(sources, faces)
+
+        self.jobs.submit(
+            "Matching faces",
+            match,
+            self.on_faces_matched,
+            lambda e: messagebox.showerror("Error", f"Face matching failed: {str(e)}"),
+        )
+
+    def on_faces_matched(self, matched):
+        self.source_faces, self.target_faces, pairs = matched
+        self.selected_face_indices = [target for _, target in pairs]
+        self.face_sources = {target: source for source, target in pairs}
+        self.style_target_faces()
+        self.status_var.set(f"Selected {len(pairs)} faces matching the source faces")
+
+        # Once a result is shown, it follows the selection
+        if self.swap_engine is not None:
+            self.start_swap(self.swap_engine.mode)
+
     def swap_faces(self):
         if not self.source_faces:
             messagebox.showerror("Error", "No face detected in source image")
@@ -524,73 +624,68 @@ class FaceSwapApp:
             messagebox.showerror("Error", "No source image to swap faces")
             return
 
-        try:
-            # Use the first face from source image
-            source_face = self.source_faces[0]
-
-            # Create a copy of target image for the result
-            self.result_image = self.target_image.copy()
-
-            # Process each selected face
-            for idx in self.selected_face_indices:
-                if idx >= len(self.target_faces):
-                    continue
-
-                target_face = self.target_faces[idx]
-
-                # Get bounding boxes
-                src_bbox = source_face.bbox.astype(int)
-                dst_bbox = target_face.bbox.astype(int)
-
-                # Extract source face
-                src_face = self.source_image[
-                    src_bbox[1] : src_bbox[3], src_bbox[0] : src_bbox[2]
-                ]
-
-                # Calculate dimensions for target face
-                dst_width = dst_bbox[2] - dst_bbox[0]
-                dst_height = dst_bbox[3] - dst_bbox[1]
-
-                # Resize source face to match target face dimensions
-                src_face_resized = cv2.resize(src_face, (dst_width, dst_height))
-
-                # Create a mask for blending
-                mask = np.zeros((dst_height, dst_width), dtype=np.uint8)
-                center = (dst_width // 2, dst_height // 2)
-                axes = (
-                    dst_width // 2 - 5,
-                    dst_height // 2 - 5,
-                )  # Slightly smaller than face
-                cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)  # type: ignore
-
-                # Blur the mask for smoother blending
-                mask = cv2.GaussianBlur(mask, (19, 19), 11)
+        mode = self.mode_var.get()
+        if "recognition" in required_tasks(mode) and any(
+            self.source_faces[source].embedding is None
+            for source, _ in self.selected_pairs()
+        ):
+            messagebox.showerror(
+                "Error", f"Please detect faces again for the {mode} method"
+            )
+            return
 
-                # Convert to 3-channel mask
-                mask_3channel = np.stack([mask] * 3, axis=2) / 255.0
+        self.start_swap(mode)
 
-                # Get target face region
-                target_region = self.result_image[
-                    dst_bbox[1] : dst_bbox[3], dst_bbox[0] : dst_bbox[2]
-                ]
+    def start_swap(self, mode):
+        # Only faces whose selection changed since the last swap are redone.
+        # The worker gets its own copy of the selection, which can change
+        # while it runs.
+        engine = self.swap_engine
+        options = {"color_match": True} if self.color_match_var.get() else {}
+        if engine is not None and (
+            engine.mode != mode or engine.backend_options != options
+        ):
+            engine = None
+        pairs = self.selected_pairs()
+
+        engine_args = (
+            self.source_image,
+            self.source_faces,
+            self.target_image,
+            self.target_faces,
+            mode,
+        )
 
-                # Blend the faces
-                blended = (src_face_resized * mask_3channel) + (
-                    target_region * (1 - mask_3channel)
-                )
+        def swap(job):
+            # Only the layers: the result image may be on screen
+            with timed("swap"):
+                swap_engine = engine or IncrementalSwap(*engine_args, **options)
+                swap_engine.prepare(pairs)
+            return swap_engine, pairs
+
+        self.jobs.submit(
+            "Swapping faces",
+            swap,
+            self.on_faces_swapped,
+            lambda e: messagebox.showerror("Error", f"Face swap failed: {str(e)}"),
+        )
 
-                # Replace in the result image
-                self.result_image[
-                    dst_bbox[1] : dst_bbox[3], dst_bbox[0] : dst_bbox[2]
-                ] = blended.astype(np.uint8)
+    def on_faces_swapped(self, swapped):
+        # Composited here on the main thread, between redraws and saves
+        engine, pairs = swapped
+        count("faces_swapped", engine.update(pairs))
 
-            # Display the result
-            self.target_image = self.result_image
+        # Display the result
+        if engine is self.swap_engine:
+            # Same result image, changed in place around the toggled faces
+            self.target_preview.refresh(engine.take_dirty())
+        else:
+            engine.take_dirty()
+            self.swap_engine = engine
+            self.result_image = engine.result
             self.display_target_image()
-            self.status_var.set("Face swap completed!")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Face swap failed: {str(e)}")
+        self.show_metrics()
+        self.status_var.set("Face swap completed!")
 
     def save_result(self):
         if self.result_image is None:
@@ -607,7 +702,12 @@ class FaceSwapApp:
         )
 
         if file_path:
-            cv2.imwrite(file_path, cv2.cvtColor(self.result_image, cv2.COLOR_RGB2BGR))
+            try:
+                write_image(file_path, self.result_image)
+            except ValueError as e:
+                messagebox.showerror("Error", f"Failed to save image: {str(e)}")
+                return
+            self.show_metrics()
             self.status_var.set(f"Result saved to {file_path}")
 
 
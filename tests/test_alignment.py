@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+import pytest
+
+from faceswap.alignment import AlignedSource, aligned_source, warp_blend_into
+
+# Five landmarks of a 100 x 120 face box at (50, 40)
+KPS = np.array(
+    [[80, 85], [120, 85], [100, 110], [84, 135], [116, 135]], dtype=np.float32
+)
+
+
+class FakeFace:
+    def __init__(self, bbox, kps):
+        self.bbox = np.array(bbox, dtype=np.float32)
+        self.kps = None if kps is None else np.asarray(kps, dtype=np.float32)
+
+
+def similarity(angle, scale, shift):
+    matrix = cv2.getRotationMatrix2D((0, 0), angle, scale)
+    matrix[:, 2] = shift
+    return matrix
+
+
+def moved(points, matrix):
+    return points @ matrix[:, :2].T + matrix[:, 2]
+
+
+@pytest.fixture
+def source():
+    image = np.random.default_rng(0).integers(0, 256, (220, 200, 3), dtype=np.uint8)
+    return image, FakeFace([50, 40, 150, 160], KPS)
+
+
+@pytest.mark.parametrize(
+    "angle, scale, shift",
+    [(0, 1, (30, 20)), (25, 1.6, (300, 90)), (-40, 0.7, (5, 200))],
+)
+def test_transform_lands_landmarks_on_the_target(source, angle, scale, shift):
+    image, face = source
+    aligned = AlignedSource(image, face)
+    target = FakeFace([0, 0, 1, 1], moved(KPS, similarity(angle, scale, shift)))
+
+    matrix = aligned.transform_to(target)
+    np.testing.assert_allclose(moved(aligned.kps, matrix), target.kps, atol=0.05)
+
+
+def test_only_the_face_roi_is_written(source):
+    image, face = source
+    aligned = AlignedSource(image, face)
+    target = FakeFace([0, 0, 1, 1], moved(KPS, similarity(15, 1.2, (240, 160))))
+    result = np.full((480, 640, 3), 77, dtype=np.uint8)
+    original = result.copy()
+
+    matrix = aligned.transform_to(target)
+    assert warp_blend_into(result, aligned.face_with_mask, matrix)
+
+    # Bounding box of the warped source crop
+    height, width = aligned.face_with_mask.shape[:2]
+    corners = moved(
+        np.array([[0, 0], [width, 0], [0, height], [width, height]], np.float64),
+        matrix,
+    )
+    x1, y1 = np.floor(corners.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(corners.max(axis=0)).astype(int)
+    changed = np.argwhere((result != original).any(axis=2))
+    assert len(changed)
+    assert changed[:, 1].min() >= x1 and changed[:, 1].max() < x2
+    assert changed[:, 0].min() >= y1 and changed[:, 0].max() < y2
+
+    outside = np.ones(result.shape[:2], dtype=bool)
+    outside[y1:y2, x1:x2] = False
+    assert np.array_equal(result[outside], original[outside])
+
+    # The same as warping onto the whole image and blending everywhere. The
+    # ROI's integer offset changes warpAffine's 1/32 pixel rounding, which
+    # only shows on sharp edges, so compare on a smooth face.
+    aligned = AlignedSource(cv2.GaussianBlur(image, (0, 0), 3), face)
+    result = original.copy()
+    warp_blend_into(result, aligned.face_with_mask, matrix)
+    warped = cv2.warpAffine(aligned.face_with_mask, matrix, (640, 480))
+    mask = warped[:, :, 3].astype(np.float32) / 255
+    expected = cv2.blendLinear(
+        np.ascontiguousarray(warped[:, :, :3]), original, mask, 1 - mask
+    )
+    assert np.abs(result.astype(int) - expected).max() <= 1
+
+
+def test_faces_off_the_image_or_without_landmarks_are_skipped(source):
+    image, face = source
+    aligned = AlignedSource(image, face)
+    result = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert not aligned.swap_into(result, FakeFace([0, 0, 10, 10], None))
+    far_away = FakeFace([0, 0, 1, 1], moved(KPS, similarity(0, 1, (900, 900))))
+    assert not aligned.swap_into(result, far_away)
+    assert not result.any()
+
+
+def test_prepared_sources_are_reused(source):
+    image, face = source
+    assert aligned_source(image, face) is aligned_source(image, face)
+    assert aligned_source(image.copy(), face) is not aligned_source(image, face)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+from faceswap.backends import (
+    AlignedBlendBackend,
+    BboxBlendBackend,
+    get_backend,
+    required_tasks,
+)
+from faceswap.core import MODE_ALIGNED, MODE_BBOX, unique_pairs
+from faceswap.incremental import IncrementalSwap
+
+
+def face(x1, y1, x2, y2):
+    return Face(bbox=np.array([x1, y1, x2, y2], dtype=np.float32))
+
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(0)
+    source = rng.integers(0, 256, (100, 200, 3), dtype=np.uint8)
+    source_faces = [face(10, 10, 90, 90), face(110, 10, 190, 90)]
+    target = np.full((200, 300, 3), 128, dtype=np.uint8)
+    target_faces = [face(20, 20, 80, 90), face(180, 60, 250, 140)]
+    return source, source_faces, target, target_faces
+
+
+def test_get_backend_shares_instances_per_options():
+    assert isinstance(get_backend(MODE_BBOX), BboxBlendBackend)
+    assert get_backend(MODE_ALIGNED) is get_backend(MODE_ALIGNED)
+    assert isinstance(get_backend(MODE_ALIGNED), AlignedBlendBackend)
+    assert get_backend(MODE_BBOX, color_match=True) is not get_backend(MODE_BBOX)
+    assert get_backend(MODE_BBOX, color_match=True).color_match
+
+
+def test_unknown_modes_are_rejected():
+    with pytest.raises(ValueError, match="Unknown swap mode"):
+        get_backend("morph")
+    with pytest.raises(ValueError, match="Unknown swap mode"):
+        required_tasks("morph")
+
+
+def test_unique_pairs_keep_the_last_source_per_target():
+    assert unique_pairs([(0, 1), (1, 0), (2, 1)]) == [(2, 1), (1, 0)]
+    assert unique_pairs([]) == []
+
+
+def test_a_target_in_several_pairs_is_swapped_once(scene):
+    source, source_faces, target, target_faces = scene
+    backend = get_backend(MODE_BBOX)
+
+    twice = target.copy()
+    assert (
+        backend.swap_pairs_into(
+            twice, source, source_faces, target_faces, [(0, 0), (1, 0)]
+        )
+        == 1
+    )
+    once = target.copy()
+    backend.swap_pairs_into(once, source, source_faces, target_faces, [(1, 0)])
+    assert np.array_equal(twice, once)
+
+
+def test_incremental_swap_applies_the_same_rule(scene):
+    source, source_faces, target, target_faces = scene
+    pairs = [(0, 0), (1, 0), (0, 1)]
+
+    expected = target.copy()
+    get_backend(MODE_BBOX).swap_pairs_into(
+        expected, source, source_faces, target_faces, pairs
+    )
+    swap = IncrementalSwap(source, source_faces, target, target_faces, MODE_BBOX)
+    assert swap.update(pairs) == 2
+    assert np.array_equal(swap.result, expected)
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from faceswap.background import BackgroundJobs
+
+
+class FakeRoot:
+    # Tk's after(), run by the test on its own thread like the main loop
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def pump(self, until, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not until():
+            assert time.monotonic() < deadline, "timed out"
+            callbacks, self.scheduled = self.scheduled, []
+            for callback in callbacks:
+                callback()
+            time.sleep(0.001)
+
+
+class FakeVar:
+    def __init__(self):
+        self.value = ""
+
+    def set(self, value):
+        self.value = value
+
+
+@pytest.fixture
+def jobs():
+    root = FakeRoot()
+    jobs = BackgroundJobs(root, FakeVar(), poll_ms=1)
+    yield root, jobs
+    jobs.shutdown()
+
+
+def test_results_come_back_on_the_polling_thread(jobs):
+    root, jobs = jobs
+    results = []
+    jobs.submit("Detecting", lambda job: threading.get_ident(), results.append)
+
+    root.pump(lambda: results)
+    assert results[0] != threading.get_ident()
+    assert not jobs.busy
+    root.pump(lambda: not root.scheduled)  # Polling stops when idle
+
+
+def test_superseded_jobs_are_dropped(jobs):
+    root, jobs = jobs
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow(job):
+        started.set()
+        release.wait(5)
+        return "stale"
+
+    first = jobs.submit("Swapping", slow, results.append)
+    started.wait(5)
+    # Queued behind the running one, then replaced before it starts
+    queued = jobs.submit("Swapping", lambda job: "queued", results.append)
+    jobs.submit("Swapping", lambda job: "fresh", results.append)
+    assert first.cancelled and queued.future.cancelled()
+
+    release.set()
+    root.pump(lambda: results and not jobs._outstanding)
+    assert results == ["fresh"]
+
+
+def test_cancelled_work_stops_at_its_next_check(jobs):
+    root, jobs = jobs
+    started, stopped = threading.Event(), threading.Event()
+
+    def steps(job):
+        started.set()
+        try:
+            while True:
+                job.progress("Working")
+                time.sleep(0.001)
+        finally:
+            stopped.set()
+
+    jobs.submit("Working", steps, pytest.fail, pytest.fail)
+    started.wait(5)
+    jobs.cancel()
+    assert stopped.wait(5)
+    root.pump(lambda: not jobs._outstanding)
+
+
+def test_errors_reach_the_error_callback(jobs):
+    root, jobs = jobs
+    errors = []
+
+    def broken(job):
+        raise ValueError("No face detected")
+
+    jobs.submit("Detecting", broken, pytest.fail, errors.append)
+    root.pump(lambda: errors)
+    assert isinstance(errors[0], ValueError)
+    assert not jobs.busy
+
+
+def test_progress_is_shown_while_running(jobs):
+    root, jobs = jobs
+    release = threading.Event()
+    shown = threading.Event()
+
+    def staged(job):
+        job.progress("Blending")
+        shown.wait(5)
+        release.wait(5)
+
+    job = jobs.submit("Swapping", staged, lambda result: None)
+    root.pump(lambda: job.stage == "Blending")
+    root.pump(lambda: jobs.status_var.value.startswith("Blending..."))
+    shown.set()
+    release.set()
+    root.pump(lambda: not jobs.busy)
+
+
+def test_shutdown_does_not_wait_for_running_work():
+    root = FakeRoot()
+    jobs = BackgroundJobs(root, FakeVar(), poll_ms=1)
+    started, release = threading.Event(), threading.Event()
+
+    def stuck(job):
+        started.set()
+        release.wait(5)
+
+    jobs.submit("Swapping", stuck, pytest.fail)
+    queued = jobs._executor.submit(time.sleep, 5)
+    started.wait(5)
+
+    began = time.monotonic()
+    jobs.shutdown()
+    assert time.monotonic() - began < 0.5
+    assert queued.cancelled()
+    release.set()
+    jobs._executor.shutdown(wait=True)
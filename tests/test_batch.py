@@ -0,0 +1,105 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from faceswap.batch import (
+    SourceFace,
+    TargetPath,
+    check_outputs,
+    glob_root,
+    iter_target_paths,
+    output_path_for,
+)
+from faceswap.core import MAP_MATCH, SELECT_ALL
+
+
+@pytest.fixture
+def photos(tmp_path):
+    for name in ["a/1.jpg", "a/2.png", "b/1.jpg", "b/notes.txt"]:
+        path = tmp_path / "photos" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+    return tmp_path / "photos"
+
+
+def test_glob_root():
+    assert glob_root("photos/**/*.jpg") == "photos"
+    assert glob_root(os.path.join("/data", "x", "*.png")) == os.path.join("/data", "x")
+    assert glob_root("*.jpg") == os.curdir
+
+
+def test_recursive_glob_outputs_mirror_the_tree(photos):
+    targets = list(iter_target_paths([str(photos / "**" / "*.jpg")]))
+    outputs = [output_path_for(target, "out") for target in targets]
+    assert outputs == [
+        os.path.join("out", "a", "1.jpg"),
+        os.path.join("out", "b", "1.jpg"),
+    ]
+    check_outputs(targets, "out")
+
+
+def test_directories_and_lists_keep_the_file_name(photos, tmp_path):
+    listing = tmp_path / "queue.txt"
+    listing.write_text(f"# queue\n{photos / 'a' / '2.png'}\n\n")
+    targets = list(iter_target_paths([str(photos / "a"), "@" + str(listing)]))
+    a = photos / "a"
+    assert targets == [str(a / "1.jpg"), str(a / "2.png"), str(a / "2.png")]
+    assert output_path_for(targets[1], "out", "webp") == os.path.join("out", "2.webp")
+
+
+def test_colliding_outputs_are_refused(photos):
+    targets = list(iter_target_paths([str(photos / "a"), str(photos / "b")]))
+    with pytest.raises(ValueError, match="would both be written"):
+        check_outputs(targets, "out")
+
+
+def test_format_change_can_collide(photos):
+    targets = [TargetPath(str(photos / "a" / "1.jpg")), TargetPath("1.png")]
+    check_outputs(targets, "out")
+    with pytest.raises(ValueError):
+        check_outputs(targets, "out", "webp")
+
+
+def test_target_path_survives_pickling():
+    target = pickle.loads(pickle.dumps(TargetPath("x/y/1.jpg", "y/1.jpg")))
+    assert target == "x/y/1.jpg"
+    assert target.output_name == "y/1.jpg"
+
+
+class FakeFace:
+    def __init__(self, direction):
+        self.bbox = np.array([0, 0, 10, 10], dtype=np.float32)
+        self.normed_embedding = np.zeros(512, dtype=np.float32)
+        self.normed_embedding[direction] = 1
+
+
+class FakeFaceAnalysis:
+    def __init__(self, faces):
+        self.faces = faces
+
+    def get(self, img, max_num=0):
+        return self.faces
+
+
+def source_face(mapping, directions=(0, 1)):
+    analyzer = FakeFaceAnalysis([FakeFace(d) for d in directions])
+    image = np.zeros((16, 16, 3), dtype=np.uint8)
+    return SourceFace(analyzer, image, mapping=mapping)
+
+
+def test_mapping_pairs_source_and_target_faces():
+    targets = [FakeFace(1), FakeFace(2), FakeFace(0)]
+
+    assert source_face(None).pairs(targets, [0, 2]) == [(0, 0), (0, 2)]
+    # Pairs with a missing source face or an unselected target are dropped
+    source = source_face([(1, 0), (0, 1), (2, 2)])
+    assert source.pairs(targets, [0, 2]) == [(1, 0)]
+    assert source.select(targets, SELECT_ALL, None) == [0, 1]
+
+    # Each target that resembles a source face gets that face
+    source = source_face(MAP_MATCH)
+    assert source.pairs(targets, [0, 1, 2]) == [(1, 0), (0, 2)]
+    assert source.with_mapping(None).mapping is None
+    assert source.mapping == MAP_MATCH
@@ -0,0 +1,147 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from insightface.app.common import Face
+from insightface.model_zoo.retinaface import RetinaFace
+
+from faceswap.batch_detection import BatchFaceAnalyzer, detect_many, letterbox
+
+STRIDES = (8, 16, 32)
+ANCHORS = 2
+
+
+class FakeSession:
+    # A RetinaFace-shaped ONNX session: an anchor scores 1 where the input
+    # pixel at its center is bright, with a box of one stride around it and
+    # all five landmarks on it. stacked keeps the batch axis in the outputs,
+    # otherwise rows of all images are concatenated.
+    def __init__(self, batch="None", stacked=False):
+        self.batch = batch
+        self.stacked = stacked
+        self.calls = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input", shape=[self.batch, 3, "?", "?"])]
+
+    def get_outputs(self):
+        return [SimpleNamespace(name=f"out{i}", shape=[1, 2, 3]) for i in range(9)]
+
+    def run(self, output_names, feed):
+        blob = feed["input"]
+        self.calls.append(blob.shape[0])
+        scores, boxes, kpss = [], [], []
+        for stride in STRIDES:
+            centers = blob[:, 0, stride // 2 :: stride, stride // 2 :: stride] > 0.5
+            rows = centers.reshape(len(blob), -1, 1).astype(np.float32)
+            rows = np.repeat(rows, ANCHORS, axis=1)
+            scores.append(rows)
+            boxes.append(np.ones(rows.shape[:2] + (4,), np.float32))
+            kpss.append(np.zeros(rows.shape[:2] + (10,), np.float32))
+
+        outputs = scores + boxes + kpss
+        if self.stacked:
+            return outputs
+        return [out.reshape(-1, out.shape[2]) for out in outputs]
+
+
+class FakeFaceAnalysis:
+    # FaceAnalysis.get with only the detection model
+    def __init__(self, session):
+        self.det_model = RetinaFace(session=session)
+        self.det_model.prepare(0, input_size=(320, 320))
+        self.models = {"detection": self.det_model}
+
+    def get(self, img, max_num=0):
+        bboxes, kpss = self.det_model.detect(img, max_num=max_num)
+        return [
+            Face(bbox=bboxes[i, :4], kps=kpss[i], det_score=bboxes[i, 4])
+            for i in range(bboxes.shape[0])
+        ]
+
+
+def image_with_square(width, height, x, y, size):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[y : y + size, x : x + size] = 255
+    return image
+
+
+IMAGES = [
+    # Different aspect ratios, so every image has its own letterbox scale
+    (640, 480, 100, 200, 120),
+    (300, 900, 150, 500, 100),
+    (320, 320, 40, 40, 64),
+    (1000, 250, 700, 50, 150),
+]
+
+
+def faces_as_arrays(faces):
+    return (
+        np.array([face.bbox for face in faces]),
+        np.array([face.kps for face in faces]),
+        np.array([face.det_score for face in faces]),
+    )
+
+
+def test_letterbox_keeps_the_aspect_ratio():
+    image = np.full((300, 900, 3), 255, dtype=np.uint8)
+    det_image, scale = letterbox(image, (320, 320))
+    assert det_image.shape == (320, 320, 3)
+    # Truncated to whole pixels, like RetinaFace.detect
+    assert scale == 106 / 300
+    assert det_image[:106].min() == 255 and det_image[107:].max() == 0
+
+
+@pytest.mark.parametrize("stacked", [True, False])
+def test_batched_detection_matches_one_by_one(stacked):
+    images = [image_with_square(*spec) for spec in IMAGES]
+    reference = FakeFaceAnalysis(FakeSession())
+    session = FakeSession(stacked=stacked)
+    analyzer = BatchFaceAnalyzer(FakeFaceAnalysis(session), batch_size=8)
+
+    batched = analyzer.get_many(images)
+    assert session.calls == [len(images)]
+
+    for image, spec, faces in zip(images, IMAGES, batched):
+        expected = reference.get(image)
+        assert len(faces) == len(expected) > 0
+        for got, want in zip(faces_as_arrays(faces), faces_as_arrays(expected)):
+            np.testing.assert_allclose(got, want, rtol=1e-5, atol=1e-3)
+
+        # Back in the image's own coordinates: landmarks sit on anchor
+        # centers inside the bright square, give or take one coarse cell
+        _, _, x, y, size = spec
+        scale = letterbox(image, (320, 320))[1]
+        slack = max(STRIDES) / scale
+        kps = np.concatenate([face.kps for face in faces])
+        assert kps[:, 0].min() >= x - slack and kps[:, 0].max() <= x + size + slack
+        assert kps[:, 1].min() >= y - slack and kps[:, 1].max() <= y + size + slack
+
+
+def test_fixed_batch_of_one_falls_back_to_get():
+    images = [image_with_square(*spec) for spec in IMAGES]
+    session = FakeSession(batch=1)
+    base = FakeFaceAnalysis(session)
+    analyzer = BatchFaceAnalyzer(base, batch_size=8)
+    assert not analyzer.batched
+
+    batched = analyzer.get_many(images)
+    assert session.calls == [1] * len(images)
+    for image, faces in zip(images, batched):
+        expected = base.get(image)
+        for got, want in zip(faces_as_arrays(faces), faces_as_arrays(expected)):
+            np.testing.assert_array_equal(got, want)
+
+
+def test_batches_are_split_by_batch_size():
+    images = [image_with_square(*IMAGES[0])] * 5
+    session = FakeSession()
+    analyzer = BatchFaceAnalyzer(FakeFaceAnalysis(session), batch_size=2)
+    assert len(detect_many(analyzer, images)) == 5
+    assert session.calls == [2, 2, 1]
+
+
+def test_detect_many_without_get_many():
+    base = FakeFaceAnalysis(FakeSession())
+    image = image_with_square(*IMAGES[2])
+    assert len(detect_many(base, [image, image])[1]) == len(base.get(image))
@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+import pytest
+
+from faceswap import blending
+from faceswap.blending import (
+    blend_into,
+    clear_mask_cache,
+    draw_ellipse_weights,
+    ellipse_weights,
+    match_color,
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_mask_cache():
+    clear_mask_cache()
+    yield
+    clear_mask_cache()
+
+
+def test_weights_have_the_face_size_and_sum_to_one():
+    mask, inverse = ellipse_weights(123, 157)
+    assert mask.shape == inverse.shape == (157, 123)
+    assert mask.dtype == np.float32
+    assert not mask.flags.writeable
+    np.testing.assert_allclose(mask + inverse, 1.0, atol=1e-6)
+
+
+@pytest.mark.parametrize("width, height", [(37, 45), (161, 200), (1003, 1251)])
+def test_masks_match_an_exact_size_mask(width, height):
+    # Cached masks are drawn at the exact size, never resized from another
+    ellipse_weights(width + 1, height + 1)
+    mask, _ = ellipse_weights(width, height)
+    np.testing.assert_array_equal(mask, draw_ellipse_weights(width, height)[0])
+
+
+def test_one_drawn_mask_per_size():
+    for width in range(161, 168):
+        ellipse_weights(width, 200)
+        ellipse_weights(width, 200)
+    counters = blending._mask_cache_counters()
+    assert counters["mask_cache_misses"] == 7
+    assert counters["mask_cache_hits"] == 7
+    assert ellipse_weights(165, 200) is ellipse_weights(165, 200)
+
+
+def test_cache_is_bounded_by_bytes(monkeypatch):
+    monkeypatch.setattr(blending, "MASK_CACHE_BYTES", 4 * 2**20)
+    for size in range(100, 700, 20):
+        ellipse_weights(size, size)
+    assert blending._mask_cache_counters()["mask_cache_bytes"] <= 4 * 2**20
+    # The most recent size is still cached
+    misses = blending._mask_cache_counters()["mask_cache_misses"]
+    ellipse_weights(680, 680)
+    assert blending._mask_cache_counters()["mask_cache_misses"] == misses
+
+
+def test_blend_into_writes_the_region_in_place():
+    region = np.full((40, 30, 3), 200, dtype=np.uint8)
+    face = np.zeros_like(region)
+    mask, inverse = ellipse_weights(30, 40)
+    result = blend_into(region, face, mask, inverse)
+    assert result is region
+    assert region[20, 15].max() < 10  # Center takes the face
+    assert region[0, 0].min() > 190  # Corners keep the target
+
+
+def patch(mean, std, seed, size=(120, 100)):
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0, 1, (size[1], size[0], 3)).astype(np.float32)
+    noise = cv2.GaussianBlur(noise, (0, 0), 2)
+    noise /= noise.std(axis=(0, 1))
+    return np.clip(np.float32(mean) + noise * np.float32(std), 0, 255).astype(np.uint8)
+
+
+def lab_stats(image, mask):
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    inside = (mask > 0.5).view(np.uint8)
+    mean, std = cv2.meanStdDev(lab, mask=inside)
+    return mean.ravel(), std.ravel()
+
+
+def test_match_color_moves_the_face_to_the_region_statistics():
+    face = patch((70, 100, 170), (18, 14, 22), seed=1)
+    region = patch((150, 140, 110), (30, 26, 24), seed=2)
+    mask, _ = ellipse_weights(120, 100)
+
+    matched = match_color(face, region, mask)
+    face_mean, face_std = lab_stats(face, mask)
+    mean, std = lab_stats(matched, mask)
+    region_mean, region_std = lab_stats(region, mask)
+
+    # Before: far apart; after: close on every LAB channel
+    assert np.abs(face_mean - region_mean).max() > 20
+    np.testing.assert_allclose(mean, region_mean, atol=2)
+    np.testing.assert_allclose(std, region_std, rtol=0.1)
+    assert np.abs(face_std - region_std).min() > 4
+
+
+def test_color_match_off_is_the_plain_blend():
+    face = patch((70, 100, 170), (18, 14, 22), seed=1)
+    target = patch((150, 140, 110), (30, 26, 24), seed=2)
+    mask, inverse = ellipse_weights(120, 100)
+
+    region = target.copy()
+    blend_into(region, face, mask, inverse, color_match=False)
+    np.testing.assert_array_equal(region, cv2.blendLinear(face, target, mask, inverse))
+
+    matched = target.copy()
+    blend_into(matched, face, mask, inverse, color_match=True)
+    assert not np.array_equal(matched, region)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from faceswap.core import (
+    AUTO_DET_SIZES,
+    MAP_MATCH,
+    SELECT_ALL,
+    SELECT_INDICES,
+    SELECT_LARGEST,
+    AutoSizeFaceAnalyzer,
+    auto_det_size,
+    auto_det_sizes,
+    parse_mapping,
+    parse_selection,
+    select_faces,
+)
+from faceswap.detection_cache import CachedFaceAnalyzer, DetectionCache
+
+
+class FakeDetModel:
+    def __init__(self):
+        self.sizes = []
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        self.sizes.append(input_size)
+        bboxes = np.array([[1, 1, 9, 9, 0.9]], dtype=np.float32)
+        return bboxes, np.zeros((1, 5, 2), dtype=np.float32)
+
+
+class FakeFaceAnalysis:
+    model_dir = "/models/buffalo_l"
+    det_thresh = 0.5
+    det_size = (640, 640)
+
+    def __init__(self):
+        self.det_model = FakeDetModel()
+        self.models = {"detection": self.det_model}
+
+
+def test_auto_det_size_is_the_smallest_that_fits():
+    assert auto_det_size((200, 300, 3)) == 320
+    assert auto_det_size((600, 400, 3)) == 640
+    # Plain auto never goes above the fixed default
+    assert auto_det_size((641, 100, 3)) == 640
+    sizes = auto_det_sizes("auto:1280")
+    assert sizes == AUTO_DET_SIZES
+    assert auto_det_size((641, 100, 3), sizes) == 960
+    assert auto_det_size((6000, 8000, 3), sizes) == 1280
+    assert auto_det_sizes("auto:800") == (320, 480, 640, 800)
+
+
+def test_auto_size_detects_each_image_at_its_size():
+    base = FakeFaceAnalysis()
+    analyzer = AutoSizeFaceAnalyzer(base, sizes=auto_det_sizes("auto:1280"))
+    images = [
+        np.zeros(shape, dtype=np.uint8) for shape in [(200, 300, 3), (2000, 3000, 3)]
+    ]
+
+    assert [len(faces) for faces in analyzer.get_many(images)] == [1, 1]
+    assert base.det_model.sizes == [(320, 320), (1280, 1280)]
+    assert analyzer.for_size(320) is analyzer.for_size(320)
+
+
+def test_auto_size_shares_one_detection_cache(tmp_path):
+    cache = DetectionCache(str(tmp_path / "cache.sqlite3"))
+    analyzer = AutoSizeFaceAnalyzer(FakeFaceAnalysis(), cache=cache)
+    small, large = analyzer.for_size(320), analyzer.for_size(1280)
+    assert isinstance(small, CachedFaceAnalyzer)
+    assert small.cache is large.cache is cache
+
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    analyzer.get(image)
+    analyzer.get(image)
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+class FakeFace:
+    def __init__(self, x1, y1, x2, y2):
+        self.bbox = np.array([x1, y1, x2, y2], dtype=np.float32)
+
+
+def test_parse_selection():
+    assert parse_selection(" All ") == (SELECT_ALL, [])
+    assert parse_selection("largest") == (SELECT_LARGEST, [])
+    assert parse_selection("1, 3,") == (SELECT_INDICES, [0, 2])
+    for spec in ["", "0", "1,x", "-1"]:
+        with pytest.raises(ValueError):
+            parse_selection(spec)
+
+
+def test_select_faces():
+    faces = [FakeFace(0, 0, 10, 10), FakeFace(0, 0, 30, 20), FakeFace(5, 5, 5, 50)]
+    assert select_faces([], SELECT_LARGEST) == []
+    assert select_faces(faces) == [0, 1, 2]
+    assert select_faces(faces, SELECT_LARGEST) == [1]
+    # Numbers past the last detected face are skipped
+    assert select_faces(faces, SELECT_INDICES, [2, 0, 5]) == [2, 0]
+    with pytest.raises(ValueError):
+        select_faces(faces, "nearest")
+
+
+def test_select_faces_delegates_to_policy_objects():
+    class EveryOther:
+        def select(self, faces):
+            return list(range(0, len(faces), 2))
+
+    assert select_faces([FakeFace(0, 0, 1, 1)] * 3, EveryOther()) == [0, 2]
+
+
+def test_parse_mapping():
+    assert parse_mapping(" Match ") == MAP_MATCH
+    assert parse_mapping("1:2, 2:1,") == [(0, 1), (1, 0)]
+    for spec in ["", "1", "1:2:3", "a:b", "0:1"]:
+        with pytest.raises(ValueError):
+            parse_mapping(spec)
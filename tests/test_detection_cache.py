@@ -0,0 +1,164 @@
+import itertools
+
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+from faceswap import detection_cache
+from faceswap.detection_cache import (
+    CachedFaceAnalyzer,
+    DetectionCache,
+    image_key,
+    pack_faces,
+    unpack_faces,
+)
+from faceswap.metrics import metrics
+
+
+def make_face(i):
+    return Face(
+        bbox=np.array([i, i, i + 10, i + 10], dtype=np.float32),
+        kps=np.full((5, 2), i, dtype=np.float32),
+        det_score=np.float32(0.9),
+        embedding=np.arange(512, dtype=np.float32) + i,
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Strictly increasing last_used, so LRU order doesn't depend on timer
+    # resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(detection_cache.time, "time", lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = DetectionCache(str(tmp_path / "cache.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_pack_faces_round_trips():
+    faces = unpack_faces(pack_faces([make_face(1), make_face(2)]))
+    assert len(faces) == 2
+    np.testing.assert_array_equal(faces[1].bbox, make_face(2).bbox)
+    np.testing.assert_array_equal(faces[1].embedding, make_face(2).embedding)
+    assert faces[0].det_score == pytest.approx(0.9)
+    assert unpack_faces(pack_faces([])) == []
+
+
+def test_image_key_covers_pixels_and_settings():
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    assert image_key(image, 640) == image_key(image.copy(), 640)
+    assert image_key(image, 640) != image_key(changed, 640)
+    assert image_key(image, 640) != image_key(image, 320)
+
+
+def test_get_counts_hits_and_misses(cache):
+    assert cache.get("a") is None
+    cache.put("a", [make_face(1)])
+    assert len(cache.get("a")) == 1
+    assert cache.get("b") is None
+    assert cache.counters() == {
+        "detection_cache_hits": 1,
+        "detection_cache_misses": 2,
+    }
+    assert metrics.snapshot()["counters"]["detection_cache_hits"] >= 1
+
+
+def test_evicts_least_recently_used_beyond_max_bytes(cache):
+    entry = len(pack_faces([make_face(0)]))
+    cache.max_bytes = 2 * entry
+
+    cache.put("a", [make_face(0)])
+    cache.put("b", [make_face(0)])
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") is not None
+    cache.put("c", [make_face(0)])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert tuple(cache.size()) == (2, 2 * entry)
+
+
+def test_cache_is_shared_through_the_database_file(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = DetectionCache(path), DetectionCache(path)
+    first.put("a", [make_face(1)])
+    assert len(second.get("a")) == 1
+    second.clear()
+    assert first.get("a") is None
+    first.close()
+    second.close()
+
+
+class FakeFaceAnalysis:
+    model_dir = "/models/buffalo_l"
+    models = {"detection": None}
+    det_size = (640, 640)
+    det_thresh = 0.5
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, img, max_num=0):
+        self.calls += 1
+        return [make_face(int(img[0, 0, 0]))]
+
+
+def test_cached_analyzer_detects_each_image_once(cache):
+    analyzer = CachedFaceAnalyzer(FakeFaceAnalysis(), cache)
+    images = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(3)]
+
+    assert len(analyzer.get(images[0])) == 1
+    results = analyzer.get_many(images)
+    assert analyzer.analyzer.calls == 3
+    assert [float(faces[0].bbox[0]) for faces in results] == [0, 1, 2]
+
+    analyzer.get_many(images)
+    assert analyzer.analyzer.calls == 3
+    # A different max_num is a different result
+    analyzer.get(images[0], max_num=1)
+    assert analyzer.analyzer.calls == 4
+
+
+def test_eviction_order_and_byte_total_on_a_large_table(cache):
+    faces = [make_face(0)]
+    entry = len(pack_faces(faces))
+    cache.max_bytes = 3000 * entry
+
+    for i in range(3000):
+        cache.put(f"old{i}", faces)
+    # Hits keep these alive, although they are among the oldest puts
+    recent = [f"old{i}" for i in range(0, 3000, 100)]
+    for key in recent:
+        assert cache.get(key) is not None
+    for i in range(2000):
+        cache.put(f"new{i}", faces)
+
+    count, total = cache.size()
+    assert (count, total) == (3000, 3000 * entry)
+    (stored,) = cache._db.execute("SELECT SUM(size) FROM detections").fetchone()
+    assert stored == total
+
+    # Least recently used first: old entries without hits, the hits, new ones
+    order = [f"old{i}" for i in range(3000) if f"old{i}" not in recent]
+    order += recent + [f"new{i}" for i in range(2000)]
+    kept = {key for (key,) in cache._db.execute("SELECT key FROM detections")}
+    assert kept == set(order[-3000:])
+
+
+def test_existing_databases_get_a_byte_total(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DetectionCache(path)
+    cache.put("a", [make_face(1)])
+    cache._db.execute("DROP TABLE totals")
+    cache.close()
+
+    cache = DetectionCache(path)
+    assert cache.size() == (1, len(pack_faces([make_face(1)])))
+    cache.close()
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from faceswap.core import select_faces
+from faceswap.identity import IdentityIndex, IdentityMatcher, match_pairs
+
+DIM = 512
+
+
+class FakeFace:
+    def __init__(self, embedding):
+        self.normed_embedding = embedding
+
+
+def axis(i):
+    embedding = np.zeros(DIM, dtype=np.float32)
+    embedding[i] = 1
+    return embedding
+
+
+def near(i, similarity, away=DIM - 1):
+    # Unit embedding whose cosine similarity with axis(i) is exactly similarity
+    return similarity * axis(i) + np.sqrt(1 - similarity**2) * axis(away)
+
+
+@pytest.fixture
+def index():
+    index = IdentityIndex(dim=DIM, capacity=1)
+    for i, name in enumerate(["ada", "bob", "cy"]):
+        index.add(name, 3 * axis(i))  # Normalized on the way in
+    return index
+
+
+def test_search_returns_the_closest_row(index):
+    best, scores = index.search(np.stack([near(2, 0.9), near(0, 0.3)]))
+    assert best.tolist() == [2, 0]
+    np.testing.assert_allclose(scores, [0.9, 0.3], atol=1e-6)
+    assert len(index) == 3 and index.matrix.shape == (3, DIM)
+
+
+def test_matches_below_the_threshold_are_dropped(index):
+    faces = [FakeFace(near(0, 0.6)), FakeFace(near(1, 0.39)), FakeFace(axis(300))]
+    assert [(i, name) for i, name, _ in index.match(faces, 0.4)] == [(0, "ada")]
+    assert [(i, name) for i, name, _ in index.match(faces, 0.35)] == [
+        (0, "ada"),
+        (1, "bob"),
+    ]
+    assert index.match(faces, 0.7) == []
+
+
+def test_empty_index_matches_nothing():
+    index = IdentityIndex(dim=DIM)
+    best, scores = index.search(np.stack([axis(0), axis(1)]))
+    assert best.tolist() == [-1, -1] and scores.tolist() == [-1, -1]
+    assert index.match([FakeFace(axis(0))], threshold=-1) == []
+    assert index.match([]) == []
+
+
+def test_matcher_limits_names(index):
+    faces = [FakeFace(axis(1)), FakeFace(axis(300)), FakeFace(near(2, 0.8))]
+    assert IdentityMatcher(index).select(faces) == [0, 2]
+    assert IdentityMatcher(index, names=["cy"]).select(faces) == [2]
+    assert IdentityMatcher(index, threshold=0.9).select(faces) == [0]
+    assert select_faces(faces, IdentityMatcher(index, names=["bob"])) == [0]
+
+
+def test_each_target_gets_its_most_similar_source():
+    sources = [FakeFace(axis(0)), FakeFace(axis(1))]
+    # Two targets compete for source 0: both get it, since one source face
+    # can be swapped onto any number of targets. The third is closer to
+    # source 1 than to source 0, the fourth is nobody.
+    targets = [
+        FakeFace(near(0, 0.9)),
+        FakeFace(near(0, 0.5)),
+        FakeFace((0.45 * axis(0) + 0.8 * axis(1)) / np.hypot(0.45, 0.8)),
+        FakeFace(axis(5)),
+    ]
+    assert match_pairs(sources, targets) == [(0, 0), (0, 1), (1, 2)]
+    assert match_pairs(sources, targets, threshold=0.6) == [(0, 0), (1, 2)]
+    # Indices refer back to the full target list
+    assert match_pairs(sources, targets, indices=[1, 2]) == [(0, 1), (1, 2)]
+    assert match_pairs([], targets) == []
+
+
+def test_faces_without_embeddings_are_rejected(index):
+    with pytest.raises(ValueError, match="no embedding"):
+        index.match([FakeFace(None)])
+    with pytest.raises(ValueError, match="does not match"):
+        index.add("dee", np.ones(128))
+
+
+def test_saved_index_loads_back(index, tmp_path):
+    path = str(tmp_path / "refs.npz")
+    index.save(path)
+    loaded = IdentityIndex.load(path)
+    assert loaded.names == index.names
+    np.testing.assert_array_equal(loaded.matrix, index.matrix)
+    loaded.add("dee", axis(3))
+    assert loaded.match([FakeFace(axis(3))]) == [(0, "dee", 1.0)]
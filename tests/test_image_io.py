@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from faceswap.image_io import (
+    EXIF_ORIENTATION,
+    apply_orientation,
+    encode_image,
+    encode_params,
+    load_image,
+    read_image,
+    reduction_for,
+)
+
+
+@pytest.fixture
+def rgb():
+    # Not symmetric in any direction, so every orientation looks different
+    image = np.random.RandomState(0).randint(0, 255, (37, 53, 3)).astype(np.uint8)
+    image[:5, :9] = (255, 0, 0)
+    return image
+
+
+def save_with_orientation(path, rgb, orientation):
+    image = Image.fromarray(rgb)
+    exif = image.getexif()
+    exif[EXIF_ORIENTATION] = orientation
+    image.save(path, exif=exif)
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_apply_orientation_matches_pil(rgb, orientation):
+    image = Image.fromarray(rgb)
+    exif = image.getexif()
+    exif[EXIF_ORIENTATION] = orientation
+    image.info["exif"] = exif.tobytes()
+    expected = np.asarray(ImageOps.exif_transpose(image))
+    assert np.array_equal(apply_orientation(rgb, orientation), expected)
+
+
+@pytest.mark.parametrize("extension", ["png", "tif"])
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_load_image_turns_images_upright(tmp_path, rgb, extension, orientation):
+    path = str(tmp_path / f"image.{extension}")
+    save_with_orientation(path, rgb, orientation)
+    expected = apply_orientation(rgb[..., ::-1], orientation)
+
+    image, scale = load_image(path)
+    assert scale == 1.0
+    assert np.array_equal(image, expected)
+    with open(path, "rb") as f:
+        assert np.array_equal(load_image(f.read())[0], expected)
+
+
+def test_reduction_for():
+    assert reduction_for(8000, 6000, 640)[0] == 8
+    assert reduction_for(8000, 6000, 1500)[0] == 4
+    assert reduction_for(8000, 6000, 5000)[0] == 1
+    assert reduction_for(640, 480, 640)[0] == 1
+
+
+def test_jpeg_is_decoded_at_reduced_scale(tmp_path):
+    path = str(tmp_path / "big.jpg")
+    cv2.imwrite(path, np.full((1600, 2400, 3), 90, dtype=np.uint8))
+    image, scale = load_image(path, min_size=600)
+    assert scale == 0.25
+    assert image.shape == (400, 600, 3)
+
+    assert read_image(path, 500).shape == (333, 500, 3)
+    assert read_image(path).shape == (1600, 2400, 3)
+
+
+def test_unreadable_images():
+    assert load_image(b"not an image") == (None, 1.0)
+    with pytest.raises(ValueError, match="Could not read image"):
+        read_image(b"not an image")
+
+
+def test_encode_params():
+    assert encode_params(".JPG", jpeg_quality=80) == [cv2.IMWRITE_JPEG_QUALITY, 80]
+    assert encode_params("png", png_compression=3) == [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    assert encode_params("png", jpeg_quality=80) == []
+    data = encode_image(np.zeros((8, 8, 3), dtype=np.uint8), "webp", webp_quality=100)
+    assert data[8:12] == b"WEBP"
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["batch", "identity", "jobs", "server", "video"])
+def test_command_line_tools_defer_insightface(module):
+    # A fresh interpreter, since this one may already have loaded the models
+    code = (
+        f"import sys, faceswap.{module}; "
+        "print(sorted({'insightface', 'onnxruntime'} & set(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_large_image_imports_without_resource():
+    # resource is Unix only; blocking it imitates Windows
+    code = (
+        "import sys; sys.modules['resource'] = None; "
+        "from faceswap.large_image import peak_rss_mb; print(peak_rss_mb())"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "None"
@@ -0,0 +1,56 @@
+import numpy as np
+from insightface.app.common import Face
+
+from faceswap.core import MODE_BBOX
+from faceswap.incremental import IncrementalSwap, expand_bbox, intersect
+
+
+def face(x1, y1, x2, y2):
+    return Face(bbox=np.array([x1, y1, x2, y2], dtype=np.float32))
+
+
+def make_swap():
+    rng = np.random.RandomState(0)
+    source = rng.randint(0, 255, (100, 100, 3)).astype(np.uint8)
+    target = np.full((200, 300, 3), 128, dtype=np.uint8)
+    target_faces = [face(20, 20, 80, 90), face(180, 60, 250, 140)]
+    return IncrementalSwap(
+        source, [face(10, 10, 90, 90)], target, target_faces, MODE_BBOX
+    )
+
+
+def test_expand_bbox_and_intersect():
+    assert expand_bbox(np.array([10, 10, 30, 50]), 0.5, (60, 40)) == (0, 0, 40, 60)
+    assert intersect((0, 0, 10, 10), (5, 5, 20, 20)) == (5, 5, 10, 10)
+    assert intersect((0, 0, 10, 10), (10, 0, 20, 10)) is None
+
+
+def test_prepare_leaves_the_result_alone():
+    swap = make_swap()
+    before = swap.result.copy()
+    swap.prepare([(0, 0), (0, 1)])
+    assert len(swap.layers) == 2
+    assert np.array_equal(swap.result, before)
+    assert swap.take_dirty() == []
+
+
+def test_update_composites_prepared_layers():
+    swap = make_swap()
+    swap.prepare([(0, 0), (0, 1)])
+    layers = dict(swap.layers)
+    assert swap.update([(0, 0), (0, 1)]) == 2
+    assert swap.layers == layers  # Nothing swapped again
+    assert not np.array_equal(swap.result, swap.pristine)
+    assert len(swap.take_dirty()) == 2
+
+
+def test_deselecting_restores_only_that_face():
+    swap = make_swap()
+    swap.update([(0, 0), (0, 1)])
+    both = swap.result.copy()
+    assert swap.update([(0, 1)]) == 1
+
+    x1, y1, x2, y2 = swap._target_rect(0)
+    assert np.array_equal(swap.result[y1:y2, x1:x2], swap.pristine[y1:y2, x1:x2])
+    x1, y1, x2, y2 = swap._target_rect(1)
+    assert np.array_equal(swap.result[y1:y2, x1:x2], both[y1:y2, x1:x2])
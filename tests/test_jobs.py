@@ -0,0 +1,141 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+from faceswap.batch import collect_results
+from faceswap.jobs import (
+    Checkpoint,
+    iter_jobs,
+    job_key,
+    read_manifest,
+    replace_output,
+    reuse_result,
+)
+
+SETTINGS = {"mode": "bbox"}
+
+
+class FixedAnalyzer:
+    # One face in the middle of every image
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, img, max_num=0):
+        self.calls += 1
+        height, width = img.shape[:2]
+        box = [width / 4, height / 4, 3 * width / 4, 3 * height / 4]
+        return [Face(bbox=np.array(box, dtype=np.float32), det_score=0.9)]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    rng = np.random.RandomState(0)
+    for name in ("me.png", "a.png", "b.png"):
+        image = rng.randint(0, 255, (64, 64, 3)).astype(np.uint8)
+        cv2.imwrite(str(tmp_path / name), image)
+    (tmp_path / "jobs.csv").write_text(
+        "source,target,output,select,map\n"
+        "me.png,a.png,out/a.png,largest,\n"
+        "me.png,b.png,out/b.png,,\n"
+        "me.png,a.png,out/a-copy.png,largest,\n"
+    )
+    return tmp_path
+
+
+def run(workspace, settings=SETTINGS):
+    # Statuses in manifest order (all jobs share one source)
+    jobs = read_manifest(str(workspace / "jobs.csv"))
+    checkpoint = Checkpoint(str(workspace / "jobs.csv.done"))
+    try:
+        results = iter_jobs(FixedAnalyzer(), jobs, checkpoint, "bbox", settings)
+        return [status for _, status, _ in results]
+    finally:
+        checkpoint.close()
+
+
+def test_read_manifest_resolves_paths_and_defaults(workspace):
+    jobs = read_manifest(str(workspace / "jobs.csv"))
+    assert [job.number for job in jobs] == [2, 3, 4]
+    assert jobs[0].target == str(workspace / "a.png")
+    assert jobs[0].output == str(workspace / "out" / "a.png")
+    assert (jobs[0].select, jobs[1].select, jobs[1].mapping) == ("largest", "all", None)
+
+
+def test_read_manifest_reports_the_row(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text('{"source": "me.png", "target": "a.png"}\n')
+    with pytest.raises(ValueError, match="jobs.jsonl:1: missing output"):
+        read_manifest(str(path))
+
+
+def test_job_key_covers_the_output_format_and_settings(workspace):
+    job, _, copy = read_manifest(str(workspace / "jobs.csv"))
+    key = job_key("s", "t", job, SETTINGS)
+    assert key == job_key("s", "t", copy, SETTINGS)  # Same result, other path
+    assert key != job_key("s", "t", job, {"mode": "aligned"})
+    copy.output = copy.output[:-4] + ".jpg"
+    assert key != job_key("s", "t", copy, SETTINGS)
+
+
+def test_duplicate_jobs_are_copied_and_reruns_skip(workspace):
+    statuses = run(workspace)
+    assert statuses == ["swapped", "swapped", "skipped"]
+    out = workspace / "out"
+    assert (out / "a.png").read_bytes() == (out / "a-copy.png").read_bytes()
+    assert not [name for name in os.listdir(out) if ".tmp" in name]
+
+    statuses = run(workspace)
+    assert statuses == ["skipped"] * 3
+    assert collect_results((t, s, None) for t, s in enumerate(statuses)).skipped == 3
+
+
+def test_outputs_of_other_settings_are_redone(workspace):
+    run(workspace)
+    statuses = run(workspace, {"mode": "bbox", "color_match": True})
+    assert statuses == ["swapped", "swapped", "skipped"]
+
+
+def test_existing_output_without_checkpoint_is_redone(workspace):
+    (workspace / "out").mkdir()
+    (workspace / "out" / "a.png").write_bytes(b"left over")
+    assert run(workspace)[0] == "swapped"
+    assert cv2.imread(str(workspace / "out" / "a.png")) is not None
+
+
+def test_checkpoint_ignores_a_torn_line(tmp_path):
+    path = tmp_path / "done"
+    path.write_text("k1\tswapped\t/out/1.png\nk2\tswa")
+    checkpoint = Checkpoint(str(path))
+    checkpoint.close()
+    assert checkpoint.done == {"k1": "swapped"}
+    assert checkpoint.produced == {"k1": ["/out/1.png"]}
+
+
+def test_reuse_result_needs_the_same_key(tmp_path):
+    output = tmp_path / "1.png"
+    output.write_bytes(b"png")
+    checkpoint = Checkpoint(str(tmp_path / "done"))
+    checkpoint.record("old", "swapped", str(output))
+    checkpoint.record("new", "no_faces", str(tmp_path / "2.png"))
+    assert reuse_result(checkpoint, "old", str(output))
+    assert reuse_result(checkpoint, "new", str(tmp_path / "2.png"))
+
+    checkpoint.record("other", "swapped", str(output))
+    assert not reuse_result(checkpoint, "old", str(output))
+    checkpoint.close()
+
+
+def test_replace_output_leaves_nothing_on_failure(tmp_path):
+    path = tmp_path / "sub" / "out.png"
+
+    def fail(temp_path):
+        with open(temp_path, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        replace_output(str(path), fail)
+    assert os.listdir(tmp_path / "sub") == []
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from faceswap import large_image
+from faceswap.image_io import load_image
+from faceswap.large_image import MappedImage, open_target, save_mapped
+
+tifffile = pytest.importorskip("tifffile")
+
+ORIENTATION_TAG = 274
+
+
+def write_tiff(path, rgb, orientation=1, compression=None):
+    extratags = [(ORIENTATION_TAG, "H", 1, orientation, True)]
+    tifffile.imwrite(
+        path, rgb, photometric="rgb", compression=compression, extratags=extratags
+    )
+
+
+@pytest.fixture
+def rgb():
+    # Not symmetric in any direction, so every orientation looks different
+    image = np.random.RandomState(0).randint(0, 255, (37, 53, 3)).astype(np.uint8)
+    image[:5, :9] = (255, 0, 0)
+    return image
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_tiff_orientation_matches_normal_loading(
+    tmp_path, monkeypatch, rgb, orientation, compression
+):
+    monkeypatch.setattr(large_image, "ORIENT_BLOCK", 16)  # Several blocks
+    path = str(tmp_path / "target.tif")
+    write_tiff(path, rgb, orientation, compression)
+    expected, _ = load_image(path)
+
+    output_path = str(tmp_path / "out.tif")
+    image = open_target(path, output_path, str(tmp_path))
+    try:
+        assert image.in_place == (orientation == 1 and compression is None)
+        height, width = image.shape[:2]
+        assert np.array_equal(image.read((0, 0, width, height)), expected)
+
+        save_mapped(image, output_path)
+    finally:
+        image.close()
+    assert np.array_equal(cv2.imread(output_path), expected)
+
+
+def test_mapped_image_patches_and_downscale(tmp_path):
+    bgr = np.random.RandomState(1).randint(0, 255, (300, 200, 3)).astype(np.uint8)
+    pixels, temp_path = large_image.temp_map(bgr.shape, str(tmp_path))
+    pixels[:] = bgr[..., ::-1]
+    image = MappedImage(pixels, rgb=True, temp_path=temp_path)
+
+    assert np.array_equal(image.read((10, 20, 50, 60)), bgr[20:60, 10:50])
+    image.write((0, 0, 4, 4), np.zeros((4, 4, 3), dtype=np.uint8))
+    assert not image.pixels[:4, :4].any()
+
+    small, scale = image.downscaled(100)
+    assert small.shape == (100, 67, 3)
+    assert scale == pytest.approx(67 / 200)
+
+    image.close()
+    assert not (tmp_path / temp_path).exists()
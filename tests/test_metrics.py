@@ -0,0 +1,41 @@
+from faceswap.metrics import Metrics
+
+
+def test_counters_and_collectors_add_up():
+    metrics = Metrics()
+    metrics.count("faces_swapped", 2)
+    metrics.count("faces_swapped")
+    metrics.add_collector(lambda: {"detection_cache_hits": 3})
+    metrics.add_collector(lambda: {"detection_cache_hits": 4, "faces_swapped": 1})
+
+    counters = metrics.snapshot()["counters"]
+    assert counters == {"detection_cache_hits": 7, "faces_swapped": 4}
+
+
+def test_timers_record_every_run():
+    metrics = Metrics()
+    for _ in range(3):
+        with metrics.timed("detect"):
+            pass
+    summary = metrics.snapshot()["timers"]["detect"]
+    assert summary["count"] == 3
+    assert "detect" in metrics.status_text(["detect", "swap"])
+
+
+def test_collector_gauges_are_exported_as_gauges():
+    metrics = Metrics()
+    metrics.count("faces_swapped", 2)
+    metrics.add_collector(
+        lambda: {"mask_cache_hits": 5, "mask_cache_bytes": 4096},
+        gauges=["mask_cache_bytes"],
+    )
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"faces_swapped": 2, "mask_cache_hits": 5}
+    assert snapshot["gauges"] == {"mask_cache_bytes": 4096}
+
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE faceswap_mask_cache_hits_total counter" in lines
+    assert "faceswap_faces_swapped_total 2" in lines
+    assert "# TYPE faceswap_mask_cache_bytes gauge" in lines
+    assert "faceswap_mask_cache_bytes 4096" in lines
+    assert not any("mask_cache_bytes_total" in line for line in lines)
@@ -0,0 +1,106 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from faceswap import parallel
+from faceswap.parallel import bounded_map
+
+
+class Tracker:
+    # A task that records how many calls run at once
+    def __init__(self):
+        self.running = 0
+        self.most = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, value, delay):
+        with self._lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(delay)
+        with self._lock:
+            self.running -= 1
+        return value
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_in_flight_work_never_exceeds_the_bound(ordered):
+    task = Tracker()
+    pulled = []
+    consumed = 0
+
+    def items():
+        for i in range(40):
+            # Items are only taken from the input as results are consumed
+            assert i - consumed <= 3
+            pulled.append(i)
+            yield i, 0.001 * (i % 5)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = []
+        for result in bounded_map(executor, task, items(), 3, ordered):
+            results.append(result)
+            consumed += 1
+
+    assert task.most <= 3
+    assert len(pulled) == 40
+    if ordered:
+        assert results == list(range(40))
+    else:
+        assert sorted(results) == list(range(40))
+
+
+def test_results_keep_input_order_when_later_items_finish_first():
+    task = Tracker()
+    items = [(i, 0.02 if i % 3 == 0 else 0) for i in range(12)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(bounded_map(executor, task, items, 4)) == list(range(12))
+
+
+def test_process_pool_keeps_input_order():
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+        results = list(bounded_map(executor, pow, [(i, 2) for i in range(20)], 4))
+    assert results == [i * i for i in range(20)]
+
+
+def test_a_failing_item_is_reported_and_the_rest_continue(monkeypatch):
+    def process_path(analyzer, source, path, output_dir, *options):
+        if path == "bad.jpg":
+            raise ValueError("Could not read image")
+        return "swapped"
+
+    monkeypatch.setattr(parallel, "process_path", process_path)
+    monkeypatch.setattr(
+        parallel,
+        "_worker",
+        {
+            "analyzer": None,
+            "source": None,
+            "policy": "all",
+            "indices": None,
+            "image_options": None,
+        },
+    )
+    paths = ["a.jpg", "bad.jpg", "c.jpg"]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        items = ((path, "out") for path in paths)
+        results = list(bounded_map(executor, parallel._process, items, 2))
+
+    assert results == [
+        ("a.jpg", "swapped", None),
+        ("bad.jpg", "failed", "Could not read image"),
+        ("c.jpg", "swapped", None),
+    ]
+
+
+def test_worker_setup_errors_are_reported_with_the_first_task(monkeypatch):
+    monkeypatch.setattr(parallel, "_worker", {"error": "No face in source"})
+    assert parallel._process("a.jpg", "out") == (
+        "a.jpg",
+        "init_error",
+        "No face in source",
+    )
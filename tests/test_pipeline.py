@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from faceswap.batch import SourceFace, collect_results, iter_serial
+from faceswap.pipeline import SwapPipeline, run_pipeline
+
+
+class FakeFace:
+    def __init__(self, x1, y1, x2, y2):
+        self.bbox = np.array([x1, y1, x2, y2], dtype=np.float32)
+
+
+class FakeFaceAnalysis:
+    # One face in the middle of the image, none in images narrower than 64
+    # pixels. Calls sleep a little, unevenly, so the stages interleave.
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def get(self, img, max_num=0):
+        return self.get_many([img])[0]
+
+    def get_many(self, images, max_num=0):
+        with self._lock:
+            self.batches.append(len(images))
+        time.sleep(0.002 * (len(self.batches) % 3))
+        faces = []
+        for image in images:
+            height, width = image.shape[:2]
+            if width < 64:
+                faces.append([])
+            else:
+                faces.append([FakeFace(width // 4, height // 4, width // 2, height)])
+        return faces
+
+
+@pytest.fixture
+def targets(tmp_path):
+    rng = np.random.default_rng(0)
+    folder = tmp_path / "in"
+    folder.mkdir()
+    paths = []
+    for i in range(10):
+        path = str(folder / f"{i:02d}.png")
+        if i == 4:
+            with open(path, "w") as f:
+                f.write("not an image")
+        else:
+            width = 48 if i == 7 else 80 + 16 * i
+            image = rng.integers(0, 256, (96, width, 3), dtype=np.uint8)
+            cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def source():
+    image = np.random.default_rng(1).integers(0, 256, (120, 100, 3), dtype=np.uint8)
+    analyzer = FakeFaceAnalysis()
+    return SourceFace(analyzer, image, mode="bbox")
+
+
+def expected_status(i):
+    return {4: "failed", 7: "no_faces"}.get(i, "swapped")
+
+
+@pytest.mark.parametrize("detect_batch", [1, 3])
+def test_results_keep_input_order(targets, source, tmp_path, detect_batch):
+    analyzer = FakeFaceAnalysis()
+    pipeline = SwapPipeline(
+        analyzer,
+        source,
+        str(tmp_path / "out"),
+        "all",
+        None,
+        decode_threads=3,
+        encode_threads=3,
+        queue_size=2,
+        detect_batch=detect_batch,
+    )
+    results = list(pipeline.run(targets))
+
+    assert [path for path, _, _ in results] == targets
+    assert [status for _, status, _ in results] == [
+        expected_status(i) for i in range(len(targets))
+    ]
+    # The unreadable file is reported, and doesn't stop the others
+    assert results[4][2]
+    if detect_batch > 1:
+        assert max(analyzer.batches) > 1
+
+
+def test_unreadable_file_is_counted_as_failed(targets, source, tmp_path):
+    logged = []
+    stats = run_pipeline(
+        FakeFaceAnalysis(),
+        source,
+        targets,
+        str(tmp_path / "out"),
+        "all",
+        None,
+        log=logged.append,
+        detect_batch=2,
+    )
+    assert (stats.swapped, stats.no_faces, stats.failed) == (8, 1, 1)
+    assert len(logged) == 1 and "04.png" in logged[0]
+
+
+def test_pipeline_output_matches_the_serial_path(targets, source, tmp_path):
+    serial_dir, pipelined_dir = str(tmp_path / "serial"), str(tmp_path / "pipelined")
+    os.makedirs(serial_dir)
+    serial = collect_results(
+        iter_serial(FakeFaceAnalysis(), source, targets, serial_dir, "all", None)
+    )
+    pipelined = run_pipeline(
+        FakeFaceAnalysis(),
+        source,
+        targets,
+        pipelined_dir,
+        "all",
+        None,
+        detect_batch=3,
+        queue_size=2,
+    )
+
+    assert (serial.swapped, serial.no_faces, serial.failed) == (
+        pipelined.swapped,
+        pipelined.no_faces,
+        pipelined.failed,
+    )
+    names = sorted(os.listdir(serial_dir))
+    assert names == sorted(os.listdir(pipelined_dir))
+    assert len(names) == 8
+    for name in names:
+        with open(os.path.join(serial_dir, name), "rb") as f:
+            expected = f.read()
+        with open(os.path.join(pipelined_dir, name), "rb") as f:
+            assert f.read() == expected, name
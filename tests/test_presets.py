@@ -0,0 +1,88 @@
+import pytest
+
+from faceswap import batch, jobs, server, video
+from faceswap.batch import parse_args
+from faceswap.core import (
+    DET_SIZE_AUTO,
+    PRESETS,
+    auto_det_size,
+    auto_det_sizes,
+    det_size_option,
+    is_auto_det_size,
+    parse_det_size,
+)
+
+COMMANDS = {
+    "batch": (batch.build_parser, ["--source", "me.jpg", "-o", "out", "in/"]),
+    "jobs": (jobs.build_parser, ["manifest.csv"]),
+    "server": (server.build_parser, []),
+    "video": (video.build_parser, ["--source", "me.jpg", "in.mp4", "-o", "out.mp4"]),
+}
+
+
+@pytest.mark.parametrize(
+    "value, size",
+    [("640", 640), ("320", 320), (" Auto", "auto"), ("auto:1280", "auto:1280")],
+)
+def test_parse_det_size(value, size):
+    assert parse_det_size(value) == size
+
+
+@pytest.mark.parametrize(
+    "value", ["0", "-32", "100", "big", "auto:", "auto:100", "x:640"]
+)
+def test_parse_det_size_rejects(value):
+    with pytest.raises(ValueError):
+        parse_det_size(value)
+
+
+def test_det_size_option():
+    assert det_size_option(480) == (480, 480)
+    assert det_size_option(DET_SIZE_AUTO) == DET_SIZE_AUTO
+    assert det_size_option("auto:960") == "auto:960"
+
+
+def picked_det_size(det_size, shape):
+    if is_auto_det_size(det_size):
+        return auto_det_size(shape, auto_det_sizes(det_size))
+    return det_size
+
+
+@pytest.mark.parametrize(
+    "preset, size", [("fast", 320), ("balanced", 640), ("accurate", 1280)]
+)
+def test_detector_size_for_a_camera_photo(preset, size):
+    assert picked_det_size(PRESETS[preset]["det_size"], (3000, 4000, 3)) == size
+
+
+def test_gui_detector_size_for_a_camera_photo():
+    # main.py builds its analyzers with det_size=DET_SIZE_AUTO
+    assert picked_det_size(DET_SIZE_AUTO, (3000, 4000, 3)) == 640
+    assert picked_det_size(DET_SIZE_AUTO, (200, 300, 3)) == 320
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+@pytest.mark.parametrize("preset", sorted(PRESETS))
+def test_every_command_applies_the_whole_preset(command, preset):
+    build_parser, argv = COMMANDS[command]
+    args = parse_args(build_parser(), argv + ["--preset", preset])
+    for name, value in PRESETS[preset].items():
+        assert getattr(args, name) == value
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_explicit_options_override_the_preset(command):
+    build_parser, argv = COMMANDS[command]
+    argv = argv + ["--preset", "fast", "--det-size", "auto", "--mode", "aligned"]
+    args = parse_args(build_parser(), argv)
+    assert (args.model_pack, args.det_size, args.mode) == (
+        "buffalo_s",
+        DET_SIZE_AUTO,
+        "aligned",
+    )
+
+
+def test_invalid_det_size_is_a_usage_error(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(batch.build_parser(), COMMANDS["batch"][1] + ["--det-size", "100"])
+    assert "multiple of 32" in capsys.readouterr().err
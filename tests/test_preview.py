@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from faceswap import preview
+from faceswap.preview import CanvasPreview, DisplayPyramid
+
+
+def random_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def built(pyramid):
+    # Every level down to 1 pixel
+    list(pyramid._iter_levels())
+    return pyramid
+
+
+@pytest.mark.parametrize("width, height", [(640, 480), (301, 203), (1023, 769)])
+def test_update_matches_a_full_rebuild(width, height):
+    image = random_image(width, height)
+    pyramid = built(DisplayPyramid(image))
+
+    rng = np.random.default_rng(1)
+    rects = [
+        (13, 7, 90, 61),
+        # Odd edges, up to the last row and column
+        (width - 37, height - 21, width, height),
+        (0, height // 2 + 1, width // 3 + 1, height // 2 + 2),
+    ]
+    for x1, y1, x2, y2 in rects:
+        image[y1:y2, x1:x2] = rng.integers(0, 256, (y2 - y1, x2 - x1, 3))
+    pyramid.update(rects)
+
+    rebuilt = built(DisplayPyramid(image.copy()))
+    assert len(pyramid.levels) == len(rebuilt.levels)
+    for level, expected in zip(pyramid.levels, rebuilt.levels):
+        assert level.shape == expected.shape
+        np.testing.assert_array_equal(level, expected)
+
+
+def test_level_shapes_halve_and_drop_odd_edges():
+    shapes = [
+        level.shape[:2]
+        for level in built(DisplayPyramid(random_image(301, 203))).levels
+    ]
+    assert shapes[:4] == [(203, 301), (101, 150), (50, 75), (25, 37)]
+    assert shapes[-1] == (1, 2)
+
+
+def test_levels_are_only_built_when_needed():
+    pyramid = DisplayPyramid(random_image(2000, 1600))
+    pyramid.fit(1500, 1200)
+    assert len(pyramid.levels) == 1
+    pyramid.fit(400, 320)
+    assert len(pyramid.levels) == 3
+
+
+@pytest.mark.parametrize(
+    "size, level",
+    [
+        ((2000, 1600), 0),
+        ((1200, 960), 0),
+        ((1000, 800), 1),
+        ((999, 799), 1),
+        ((400, 320), 2),
+        # min_size stops halving before the level gets small
+        ((100, 80), 2),
+    ],
+)
+def test_smallest_level_that_is_big_enough(size, level):
+    pyramid = DisplayPyramid(random_image(2000, 1600), min_size=256)
+    assert pyramid._level_for(*size) is pyramid.levels[level]
+    assert pyramid.fit(*size).shape[:2] == size[::-1]
+
+
+class FakeCanvas:
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.items = {}
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def _create(self, *coords, **options):
+        self.items[len(self.items) + 1] = list(coords)
+        return len(self.items)
+
+    create_image = create_rectangle = create_text = _create
+
+    def coords(self, item, *coords):
+        self.items[item] = list(coords)
+
+    def itemconfig(self, item, **options):
+        pass
+
+    def tag_lower(self, item):
+        pass
+
+    def delete(self, item):
+        del self.items[item]
+
+
+@pytest.fixture
+def photos(monkeypatch):
+    # Tk images need a Tk root; record what would have been shown instead
+    shown = []
+    monkeypatch.setattr(
+        preview.ImageTk, "PhotoImage", lambda image: shown.append(image)
+    )
+    return shown
+
+
+def test_canvas_preview_redraws_only_on_change(photos):
+    canvas = FakeCanvas(400, 400)
+    view = CanvasPreview(canvas)
+    image = random_image(2000, 1000)
+
+    assert view.show(image)
+    assert photos[-1].size == (400, 200)
+    assert not view.show(image)
+    canvas.width = 200
+    assert view.show(image)
+    assert photos[-1].size == (200, 100)
+    assert len(photos) == 2
+
+
+def test_canvas_preview_boxes_follow_the_scale(photos):
+    canvas = FakeCanvas(400, 400)
+    view = CanvasPreview(canvas)
+    view.show(random_image(2000, 1000))
+    view.set_boxes([(100, 200, 300, 400)], labels=True)
+
+    rect, text = view.box_items[0]
+    # Scale 0.2, centred with a 100 pixel band above the image
+    assert canvas.items[rect] == [20, 140, 60, 180]
+    assert canvas.items[text] == [40, 130]
+    assert view.to_image(*view.to_canvas(1000, 500)) == (1000, 500)
+
+    view.set_boxes([])
+    assert rect not in canvas.items and text not in canvas.items
@@ -0,0 +1,161 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import cv2
+import numpy as np
+import pytest
+
+from faceswap.metrics import metrics
+from faceswap.server import SwapService, create_server
+
+BOXES = [(40, 30, 120, 130), (160, 40, 230, 120)]
+
+
+class FakeFace:
+    def __init__(self, box):
+        x1, y1, x2, y2 = box
+        self.bbox = np.array(box, dtype=np.float32)
+        self.det_score = np.float32(0.9)
+        self.kps = np.array(
+            [
+                [x1 + (x2 - x1) * fx, y1 + (y2 - y1) * fy]
+                for fx, fy in [
+                    (0.3, 0.4),
+                    (0.7, 0.4),
+                    (0.5, 0.6),
+                    (0.35, 0.8),
+                    (0.65, 0.8),
+                ]
+            ],
+            dtype=np.float32,
+        )
+
+
+class FakeFaceAnalysis:
+    # get_many() records the size of every detector call
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, img, max_num=0):
+        return self.get_many([img], max_num)[0]
+
+    def get_many(self, images, max_num=0):
+        with self._lock:
+            self.calls.append(len(images))
+        return [[FakeFace(box) for box in BOXES] for _ in images]
+
+
+def encoded(seed=0):
+    image = np.random.RandomState(seed).randint(0, 255, (240, 320, 3), np.uint8)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+@pytest.fixture
+def served():
+    analyzer = FakeFaceAnalysis()
+    service = SwapService(analyzer, "bbox", max_batch=4, max_wait=0)
+    service.add_source(
+        cv2.imdecode(np.frombuffer(encoded(), np.uint8), 1), None, "default"
+    )
+    analyzer.calls.clear()
+    server = create_server(service, port=0)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+
+    def post(path, data):
+        url = f"http://127.0.0.1:{server.server_port}{path}"
+        request = urllib.request.Request(url, data=data, method="POST")
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    yield analyzer, service, post
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def test_detect_returns_faces(served):
+    analyzer, service, post = served
+    status, _, body = post("/detect", encoded(1))
+    assert status == 200
+    faces = json.loads(body)["faces"]
+    assert [face["bbox"] for face in faces] == [list(map(float, b)) for b in BOXES]
+    assert len(faces[0]["kps"]) == 5
+
+
+def test_swap_returns_the_swapped_image(served):
+    analyzer, service, post = served
+    status, headers, body = post("/swap?format=png&select=2", encoded(1))
+    assert status == 200
+    assert headers["Content-Type"] == "image/png"
+    assert headers["X-Faces-Swapped"] == "1"
+    swapped = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+    target = cv2.imdecode(np.frombuffer(encoded(1), np.uint8), cv2.IMREAD_COLOR)
+    x1, y1, x2, y2 = BOXES[1]
+    assert not np.array_equal(swapped[y1:y2, x1:x2], target[y1:y2, x1:x2])
+    x1, y1, x2, y2 = BOXES[0]
+    assert np.array_equal(swapped[y1:y2, x1:x2], target[y1:y2, x1:x2])
+
+
+@pytest.mark.parametrize(
+    "path, body, status",
+    [
+        ("/swap?format=gif", "image", 400),
+        ("/swap?quality=101", "image", 400),
+        ("/swap?compression=x", "image", 400),
+        ("/swap?select=0", "image", 400),
+        ("/swap", "text", 400),
+        ("/swap", "empty", 400),
+        ("/swap?source=missing", "image", 404),
+        ("/sources?map=1", "image", 400),
+        ("/nowhere", "image", 404),
+    ],
+)
+def test_bad_requests_fail_before_detection(served, path, body, status):
+    analyzer, service, post = served
+    body = {"image": encoded(1), "text": b"not an image", "empty": b""}[body]
+    code, _, response = post(path, body)
+    assert code == status
+    assert "error" in json.loads(response)
+    assert analyzer.calls == []
+
+
+def test_concurrent_requests_share_one_detector_call(served):
+    # max_batch=4 and a long max_wait: the batch runs once all four are in
+    analyzer, service, post = served
+    service.detector.max_wait = 10.0
+    batches = service.stats()["batches"]
+    statuses = []
+
+    def swap(seed):
+        statuses.append(post("/swap", encoded(seed))[0])
+
+    threads = [threading.Thread(target=swap, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 4
+    assert analyzer.calls == [4]
+    assert service.stats()["batches"] == batches + 1
+    assert service.stats()["mean_batch_size"] > 1
+
+
+def test_decoding_is_timed_once(served):
+    analyzer, service, post = served
+    before = metrics.snapshot()["timers"]
+    reads = before.get("read", {"count": 0})["count"]
+    assert post("/detect", encoded(1))[0] == 200
+
+    timers = metrics.snapshot()["timers"]
+    assert timers["read"]["count"] == reads + 1
+    assert "decode" not in timers
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from faceswap.tiled_detection import TiledFaceAnalyzer, _merge, tile_grid
+
+TILE = 640
+
+
+class FakeDetModel:
+    # Finds the painted face rectangles of an image. Face k is painted with
+    # value k + 1; a face is detected when at least half of it is visible,
+    # as the box of its visible part, and when it is at least min_size
+    # pixels wide after the downscale to the detector input.
+    def __init__(self, faces, min_size=20):
+        self.faces = faces
+        self.min_size = min_size
+        self.input_size = (TILE, TILE)
+        self.det_thresh = 0.5
+        self.nms_thresh = 0.4
+        self.use_kps = True
+
+        class Session:
+            def get_inputs(self):
+                return [type("Input", (), {"shape": [1, 3, TILE, TILE]})()]
+
+        self.session = Session()
+
+    def detect(self, img, max_num=0, metric="default"):
+        height, width = img.shape[:2]
+        scale = min(1.0, TILE / width, TILE / height)
+        boxes = []
+        for k, (x1, y1, x2, y2) in enumerate(self.faces):
+            ys, xs = np.nonzero(img[..., 0] == k + 1)
+            if len(xs) < 0.5 * (x2 - x1) * (y2 - y1):
+                continue
+            if (xs.max() + 1 - xs.min()) * scale < self.min_size:
+                continue
+            boxes.append([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1, 0.9])
+        bboxes = np.array(boxes, dtype=np.float32).reshape(-1, 5)
+        centers = (bboxes[:, :2] + bboxes[:, 2:4]) / 2
+        kpss = np.repeat(centers[:, None], 5, axis=1)
+        return bboxes, kpss
+
+
+class FakeAnalyzer:
+    def __init__(self, det_model):
+        self.det_model = det_model
+        self.models = {"detection": det_model}
+
+
+def painted(shape, faces):
+    image = np.zeros(shape, dtype=np.uint8)
+    for k, (x1, y1, x2, y2) in enumerate(faces):
+        image[y1:y2, x1:x2] = k + 1
+    return image
+
+
+def detect_boxes(shape, faces):
+    analyzer = TiledFaceAnalyzer(FakeAnalyzer(FakeDetModel(faces)))
+    return [face.bbox for face in analyzer.get(painted(shape, faces))]
+
+
+def test_tile_grid_covers_the_image():
+    tiles = tile_grid((1000, 1500, 3), (TILE, TILE), 128)
+    assert tiles[0] == (0, 0, TILE, TILE)
+    assert tiles[-1] == (1500 - TILE, 1000 - TILE, 1500, 1000)
+    assert all(x2 - x1 == TILE and y2 - y1 == TILE for x1, y1, x2, y2 in tiles)
+
+
+@pytest.mark.parametrize("size", [60, 120, 140, 200, 300])
+def test_face_across_a_seam_is_detected_once(size):
+    # Tiles start at 0 and 512, so x=500 crosses the left edge of the second
+    # tile. Faces this small vanish in the whole-image pass of 8000 pixels.
+    face = (500, 300, 500 + size, 300 + size)
+    boxes = detect_boxes((1000, 8000, 3), [face])
+    assert len(boxes) == 1
+    x1, y1, x2, y2 = boxes[0]
+    assert x1 < face[0] + size / 2 < x2
+    assert y1 < face[1] + size / 2 < y2
+
+
+def test_small_faces_in_tiles_are_all_found():
+    faces = [(100, 100, 140, 140), (2000, 500, 2040, 540), (7900, 900, 7940, 940)]
+    boxes = detect_boxes((1000, 8000, 3), faces)
+    assert sorted(tuple(map(int, box)) for box in boxes) == sorted(faces)
+
+
+def test_merge_prefers_whole_boxes_over_fragments():
+    det = np.array(
+        [
+            [0, 0, 100, 100, 0.8],  # whole face
+            [0, 0, 40, 100, 0.95],  # fragment of it, low IoU
+            [300, 0, 400, 100, 0.7],  # a fragment on its own
+        ],
+        dtype=np.float32,
+    )
+    cut = np.array([False, True, True])
+    assert list(_merge(det, cut, 0.4)) == [0, 2]
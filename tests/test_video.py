@@ -0,0 +1,57 @@
+import numpy as np
+from insightface.app.common import Face
+
+from faceswap.video import FaceTracker, iou_matrix
+
+
+class CountingAnalyzer:
+    # Finds one face on frames whose top left pixel is set
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, frame):
+        self.calls += 1
+        if not frame[0, 0].any():
+            return []
+        kps = np.array([[50, 60], [80, 60], [65, 75], [55, 90], [75, 90]], np.float32)
+        return [Face(bbox=np.array([40, 40, 90, 100], np.float32), kps=kps)]
+
+
+def textured_frame(marked):
+    frame = np.random.RandomState(0).randint(0, 255, (160, 160, 3)).astype(np.uint8)
+    frame[0, 0] = 255 if marked else 0
+    return frame
+
+
+def test_iou_matrix():
+    overlap = iou_matrix(
+        [[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]]
+    )
+    np.testing.assert_allclose(overlap, [[1.0, 1 / 3, 0.0]], atol=1e-6)
+
+
+def test_empty_frames_skip_detection():
+    analyzer = CountingAnalyzer()
+    tracker = FaceTracker(analyzer, detect_every=10)
+    blank = np.zeros((160, 160, 3), dtype=np.uint8)
+    for _ in range(30):
+        assert tracker.update(blank) == []
+    assert analyzer.calls == 3
+
+
+def test_reacquire_interval_for_empty_frames():
+    analyzer = CountingAnalyzer()
+    tracker = FaceTracker(analyzer, detect_every=10, reacquire_every=5)
+    for _ in range(30):
+        tracker.update(np.zeros((160, 160, 3), dtype=np.uint8))
+    assert analyzer.calls == 6
+
+
+def test_tracked_faces_are_detected_every_n_frames():
+    analyzer = CountingAnalyzer()
+    tracker = FaceTracker(analyzer, detect_every=10)
+    frame = textured_frame(marked=True)
+    for _ in range(30):
+        tracks = tracker.update(frame)
+        assert [track.id for track in tracks] == [0]
+    assert analyzer.calls == 3